@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Peak memory of document creation: formatted template vs streamed template.
+
+Generates a large synthetic code - annotations pair with
+:mod:`benchmarks.generators` and creates its document both ways. That the
+outputs are identical is checked by ``test/test_document.py``.
+
+Usage::
+
+    PYTHONPATH=lib python -m benchmarks.document [LINES]
+"""
+
+from sys import argv
+from time import time
+from shutil import rmtree
+from tempfile import mkdtemp
+from os.path import join
+from tracemalloc import start, stop, get_traced_memory
+
+from codeco.processor import Processor
+
+from .generators import generate_pair
+
+
+def measure(func):
+    """
+    Measure the time and peak traced memory of calling given function.
+    """
+    start()
+    try:
+        begin = time()
+        func()
+        elapsed = time() - begin
+        peak = get_traced_memory()[1]
+    finally:
+        stop()
+    return elapsed, peak
+
+
+def main():
+    lines = int(argv[1]) if len(argv) > 1 else 20000
+    directory = mkdtemp()
+    try:
+        codefn, annfn = generate_pair(directory, lines, lines // 4)
+        formatted = join(directory, 'formatted.html')
+        streamed = join(directory, 'streamed.html')
+
+        # Warm up renderers sessions and lexers, without caching highlighted
+        # code, so both ways do the same work
+        proc = Processor(highlight_cache=None)
+        proc.create_document(codefn, annfn)
+
+        results = [
+            ('formatted', measure(lambda: proc.create_document(
+                codefn, annfn, out_file=formatted
+            ))),
+            ('streamed', measure(lambda: proc.create_document(
+                codefn, annfn, out_file=streamed, stream=True
+            ))),
+        ]
+
+        with open(formatted, 'r') as ff:
+            document = ff.read()
+
+        print('{} lines, document of {:.1f} MiB'.format(
+            lines, len(document) / 1024.0 / 1024.0
+        ))
+        for name, (elapsed, peak) in results:
+            print('{:<10} {:8.2f} s {:10.1f} MiB peak'.format(
+                name, elapsed, peak / 1024.0 / 1024.0
+            ))
+        print('saving     {:10.1f} %'.format(
+            100.0 * (1 - float(results[1][1][1]) / results[0][1][1])
+        ))
+    finally:
+        rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
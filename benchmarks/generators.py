@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Synthetic code - annotations pairs generators for the benchmarks.
+
+Generated content is deterministic, so runs can be compared over time.
+"""
+
+from os.path import join
+from random import Random
+
+
+def generate_code(lines):
+    """
+    Generate Python code with given number of lines.
+
+    :param int lines: Number of lines.
+    :rtype: str
+    """
+    code = []
+    for num in range(lines):
+        if num % 4 == 0:
+            code.append('def function_{0}(value):'.format(num))
+        elif num % 4 == 1:
+            code.append('    """Return the value plus {0}."""'.format(num))
+        elif num % 4 == 2:
+            code.append('    return value + {0}  # Sum'.format(num))
+        else:
+            code.append('')
+    return '\n'.join(code) + '\n'
+
+
+def generate_annotations(
+        lines, annotations, ann_format='markdown',
+        targets=2, density=0.5, seed=0):
+    """
+    Generate annotations for code generated with :func:`generate_code`.
+
+    :param int lines: Number of lines of the code.
+    :param int annotations: Number of annotations.
+    :param str ann_format: ``'markdown'`` or ``'rest'``.
+    :param int targets: Number of targets of each annotation.
+    :param float density: Fraction of the targets that are characters
+     ranges instead of whole lines, from 0 to 1.
+    :param int seed: Seed of the random targets.
+    :rtype: str
+    """
+    random = Random(seed)
+    parts = []
+    for num in range(annotations):
+        args = []
+        for target in range(targets):
+            line = random.randint(1, lines)
+            if random.random() < density:
+                beg = random.randint(0, 10)
+                args.append('{}[{},{}]'.format(
+                    line, beg, beg + random.randint(0, 10)
+                ))
+            else:
+                args.append(str(line))
+
+        parts.append('<[annotation]> {}\n'.format(' '.join(args)))
+        if ann_format == 'rest':
+            title = 'Annotation {}'.format(num)
+            parts.append(
+                '{1}\n{2}\n\n'
+                'The *function* number ``{0}``, with a link to '
+                '`its definition <#line-{0}>`_.\n\n'
+                '- It returns the **value** plus {0}.\n'
+                '- It is not recursive.\n\n'.format(
+                    num, title, '=' * len(title)
+                )
+            )
+        else:
+            parts.append(
+                '# Annotation {0}\n\n'
+                'The *function* number `{0}`, with a link to '
+                '[its definition](#line-{0}).\n\n'
+                '- It returns the **value** plus {0}.\n'
+                '- It is not recursive.\n\n'.format(num)
+            )
+    return ''.join(parts)
+
+
+def generate_pair(
+        directory, lines, annotations, ann_format='markdown', **kwargs):
+    """
+    Write a generated code - annotations pair to a directory.
+
+    :param str directory: Path to the directory.
+    :param int lines: Number of lines of the code.
+    :param int annotations: Number of annotations.
+    :param str ann_format: ``'markdown'`` or ``'rest'``.
+    :param dict kwargs: Other arguments for :func:`generate_annotations`.
+    :rtype: tuple
+    :return: A tuple ``(codefn, annfn)`` with the paths of the files.
+    """
+    codefn = join(directory, 'source.py')
+    annfn = join(
+        directory, 'source.py' + ('.rst' if ann_format == 'rest' else '.md')
+    )
+    with open(codefn, 'w') as cf:
+        cf.write(generate_code(lines))
+    with open(annfn, 'w') as af:
+        af.write(generate_annotations(
+            lines, annotations, ann_format=ann_format, **kwargs
+        ))
+    return codefn, annfn
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Startup time of the library and the command line tool.
+
+The ``timeraw_`` benchmarks are run by asv in a fresh interpreter each time.
+That startup doesn't import the heavy dependencies is checked by
+``test/test_imports.py``.
+"""
+
+from os.path import join, dirname, abspath
+
+
+"""
+Path to the command line tool.
+"""
+codeco_bin = join(dirname(dirname(abspath(__file__))), 'bin', 'codeco')
+
+
+def timeraw_import_processor():
+    return 'import codeco.processor'
+
+
+def timeraw_cli_help():
+    return """
+        from io import StringIO
+        from runpy import run_path
+        from contextlib import redirect_stdout
+        import sys
+
+        sys.argv = [{0!r}, '--help']
+        with redirect_stdout(StringIO()):
+            try:
+                run_path({0!r}, run_name='__main__')
+            except SystemExit:
+                pass
+    """.format(codeco_bin)
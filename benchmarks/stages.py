@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Benchmarks of each stage of the pipeline, for
+`airspeed velocity <https://asv.readthedocs.io/>`_.
+
+Inputs are generated with :mod:`benchmarks.generators`. Caches are disabled,
+so every call does the full work of its stage. To run them against the
+current tree, installed in the current environment, from the root of the
+repository::
+
+    pip install -e .
+    asv run --python=same --set-commit-hash $(git rev-parse HEAD)
+
+Results are stored as JSON in ``.asv/results`` and can be compared with
+``asv compare``. See ``asv.conf.json``.
+"""
+
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from codeco.processor import Processor
+
+from .generators import generate_code, generate_annotations, generate_pair
+
+
+class ParseAnnotations(object):
+    """
+    Parsing of the annotations headers and bodies.
+    """
+
+    params = ([100, 1000, 10000], [0.0, 1.0])
+    param_names = ['annotations', 'density']
+
+    def setup(self, annotations, density):
+        self.proc = Processor(highlight_cache=None)
+        self.annotations = generate_annotations(
+            annotations * 4, annotations, density=density
+        )
+
+    def time_parse_annotations(self, annotations, density):
+        self.proc._parse_annotations(self.annotations, 'bench')
+
+
+class Render(object):
+    """
+    Rendering of the annotations, in both formats, with warm renderers.
+    """
+
+    params = (['markdown', 'rest'], [10, 100])
+    param_names = ['ann_format', 'annotations']
+    timeout = 120
+
+    def setup(self, ann_format, annotations):
+        self.proc = Processor(highlight_cache=None)
+        self.parsed = self.proc._parse_annotations(
+            generate_annotations(
+                annotations * 4, annotations, ann_format=ann_format
+            ),
+            'bench'
+        )
+        self.proc._render(self.parsed[:1], ann_format, {})
+
+    def time_render(self, ann_format, annotations):
+        self.proc._render(self.parsed, ann_format, {})
+
+
+class Highlight(object):
+    """
+    Highlighting of the code with Pygments, and marking of the characters
+    ranges and lines targeted by the annotations.
+    """
+
+    params = ([1000, 10000], [0.0, 1.0])
+    param_names = ['lines', 'density']
+    timeout = 120
+
+    def setup(self, lines, density):
+        self.proc = Processor(highlight_cache=None)
+        self.code = generate_code(lines)
+        self.lexer = self.proc._get_lexer(self.code, codefn='source.py')
+        self.metas = [
+            meta for meta, body in self.proc._parse_annotations(
+                generate_annotations(
+                    lines, lines // 4, targets=4, density=density
+                ),
+                'bench'
+            )
+        ]
+
+    def time_pygments(self, lines, density):
+        self.proc._highlight(
+            self.code, self.lexer, {'style': 'monokai', 'linenos': 'table'},
+            'bench'
+        )
+
+    def time_highlight_block(self, lines, density):
+        self.proc._highlight_block(
+            self.code, self.lexer, 'monokai', 'bench', self.metas
+        )
+
+
+class CreateDocument(object):
+    """
+    Full document creation from files, formatted and streamed.
+    """
+
+    params = ([1000, 10000], [False, True])
+    param_names = ['lines', 'stream']
+    timeout = 300
+
+    def setup(self, lines, stream):
+        self.directory = mkdtemp()
+        self.codefn, self.annfn = generate_pair(
+            self.directory, lines, lines // 4
+        )
+        self.out_file = self.codefn + '.html'
+        self.proc = Processor(highlight_cache=None)
+        self.proc.create_document(self.codefn, self.annfn)
+
+    def teardown(self, lines, stream):
+        rmtree(self.directory)
+
+    def time_create_document(self, lines, stream):
+        self.proc.create_document(
+            self.codefn, self.annfn, out_file=self.out_file, stream=stream
+        )
+
+    def peakmem_create_document(self, lines, stream):
+        self.proc.create_document(
+            self.codefn, self.annfn, out_file=self.out_file, stream=stream
+        )
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Benchmark of the annotations wrapper: streaming parser vs Beautiful Soup.
+
+That both produce the same output is checked by ``test/test_wrapper.py``.
+
+Usage::
+
+    PYTHONPATH=lib python benchmarks/wrapper.py
+"""
+
+from timeit import timeit
+from os.path import join, dirname, abspath
+
+from codeco.processor import Processor
+from codeco.wrapper import wrap_fast, wrap_soup
+
+
+examples = join(dirname(dirname(abspath(__file__))), 'examples')
+
+
+def corpus():
+    """
+    Render the annotations of the examples.
+    """
+    proc = Processor()
+    rendered = []
+    for annfn, renderer in [
+            (join(examples, 'ex1', 'annotations.md'), proc._render_markdown),
+            (join(examples, 'ex2', 'annotations.rst'), proc._render_rest)]:
+        with open(annfn, 'r') as af:
+            parsed = proc._parse_annotations(af.read(), 'bench')
+        for meta, body in parsed:
+            rendered.append(renderer(body).strip())
+    return rendered
+
+
+def main():
+    rendered = corpus()
+    classes = ['annotation_body']
+
+    number = 200
+    results = {}
+    for name, func in [('beautifulsoup', wrap_soup), ('streaming', wrap_fast)]:
+        results[name] = timeit(
+            lambda: [
+                func(html, classes, 'annotation_title') for html in rendered
+            ],
+            number=number,
+        ) / (number * len(rendered))
+        print('{:<15} {:10.1f} us per annotation'.format(
+            name, results[name] * 1e6
+        ))
+
+    print('speedup         {:10.1f}x'.format(
+        results['beautifulsoup'] / results['streaming']
+    ))
+
+
+if __name__ == '__main__':
+    main()
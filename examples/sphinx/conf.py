@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+#
+# Sample Sphinx project using the codeco directive. See test/test_sphinx.py.
+
+extensions = ['codeco.directive']
+
+master_doc = 'index'
+project = u'codeco sample'
+copyright = u'2014, Carlos Jenkins'
+version = '1.0'
+release = '1.0'
+
+exclude_patterns = ['_build']
+pygments_style = 'monokai'
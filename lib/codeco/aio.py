@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Asyncio module.
+"""
+
+from os import cpu_count
+from copy import deepcopy
+from asyncio import Semaphore, ensure_future, shield, get_running_loop
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from codeco.cache import hash_material
+from codeco.batch import create_processor
+from codeco.processor import Processor
+
+
+# Per worker process state, see _run_in_worker()
+_processor = None
+
+
+def _run_in_worker(processor_opts, method, args, kwargs):
+    """
+    Call a method of the processor of the current worker process, creating
+    it on first use.
+
+    :param dict processor_opts: Options to be passed to
+     :func:`codeco.batch.create_processor`.
+    :param str method: Name of the method of the processor.
+    :param tuple args: Positional arguments of the method.
+    :param dict kwargs: Keyword arguments of the method.
+    """
+    global _processor
+    if _processor is None:
+        _processor = create_processor(**processor_opts)
+    return getattr(_processor, method)(*args, **kwargs)
+
+
+def _write(path, content):
+    # Warning: might raise IO exceptions
+    with open(path, 'w') as fd:
+        fd.write(content)
+
+
+class AsyncProcessor(object):
+    """
+    Asyncio front end of :class:`codeco.processor.Processor`, to embed codeco
+    in asynchronous services without blocking the event loop.
+
+    Files are read and written in the default executor of the event loop,
+    while parsing, rendering and highlighting are run in the given executor.
+    At most ``max_concurrency`` jobs are run at a time, the others wait their
+    turn. Concurrent requests for the same inputs and options are coalesced:
+    the work is done once and all the callers get the same result.
+
+    With a thread executor, a single warm processor is shared by all threads
+    (renderers sessions are per thread). With a process executor, each worker
+    process creates its own processor with the same options.
+
+    :param executor: Optional :class:`concurrent.futures.Executor` to run the
+     CPU bound stages in. If ``None`` is given, a thread pool with
+     ``max_concurrency`` threads is created, and shut down by
+     :meth:`AsyncProcessor.close`.
+    :param int max_concurrency: Maximum number of jobs run at a time. If
+     ``None`` is given, the number of CPUs in the system is used.
+    :param str cache_dir: Optional path to a directory to cache rendered
+     annotations and highlighted code between runs. See
+     :mod:`codeco.cache`.
+    :param dict kwargs: Other arguments for
+     :class:`codeco.processor.Processor`. They must be picklable to use a
+     process executor.
+    """
+
+    def __init__(
+            self, executor=None, max_concurrency=None,
+            cache_dir=None, **kwargs):
+        if max_concurrency is None:
+            max_concurrency = cpu_count() or 1
+        self.max_concurrency = max_concurrency
+
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.executor = executor
+
+        self._processor_opts = dict(kwargs, cache_dir=cache_dir)
+        self.processor = None
+        if not isinstance(executor, ProcessPoolExecutor):
+            self.processor = create_processor(**self._processor_opts)
+
+        # Created on first use, in the running event loop
+        self._semaphore = None
+        self._inflight = {}
+
+    async def _call(self, method, *args, **kwargs):
+        """
+        Call a method of the processor in the executor, waiting for a slot.
+        """
+        if self._semaphore is None:
+            self._semaphore = Semaphore(self.max_concurrency)
+
+        loop = get_running_loop()
+        async with self._semaphore:
+            if self.processor is not None:
+                return await loop.run_in_executor(
+                    self.executor,
+                    lambda: getattr(self.processor, method)(*args, **kwargs)
+                )
+            return await loop.run_in_executor(
+                self.executor, _run_in_worker,
+                self._processor_opts, method, args, kwargs
+            )
+
+    async def _coalesce(self, key, factory):
+        """
+        Await the job identified by given key, starting it with given
+        coroutine function unless it is already in flight.
+
+        The job is shielded, so a cancelled caller doesn't cancel it for the
+        other callers. Each caller gets its own copy of the result.
+        """
+        task = self._inflight.get(key, None)
+        if task is None:
+            task = ensure_future(factory())
+            self._inflight[key] = task
+
+            def done(finished):
+                if self._inflight.get(key, None) is finished:
+                    del self._inflight[key]
+            task.add_done_callback(done)
+
+        return deepcopy(await shield(task))
+
+    async def _read_files(self, codefn, annfn):
+        return await get_running_loop().run_in_executor(
+            None, Processor.read_files, codefn, annfn
+        )
+
+    def _get_format(self, annfn, ext_map=None):
+        """
+        Get the format of an annotations file from its extension. See
+        :meth:`codeco.processor.Processor._get_format`.
+        """
+        processor = self.processor
+        if processor is None:
+            processor = Processor
+        return processor._get_format(annfn, ext_map)
+
+    async def process(self, code, annotations, **kwargs):
+        """
+        Asynchronous :meth:`codeco.processor.Processor.process`.
+
+        Coalesced callers get equal copies of the same result, including the
+        prefix, even with the default ``'random'`` ``prefix_mode``.
+        """
+        key = hash_material('process', code, annotations, kwargs)
+        return await self._coalesce(
+            key, lambda: self._call('process', code, annotations, **kwargs)
+        )
+
+    async def process_files(self, codefn, annfn, ext_map=None, **kwargs):
+        """
+        Asynchronous :meth:`codeco.processor.Processor.process_files`.
+
+        Requests are coalesced by the content of the files, not by their
+        modification time, so a file changed while its request is in flight
+        is processed again.
+        """
+        code, annotations = await self._read_files(codefn, annfn)
+        if 'ann_format' not in kwargs:
+            kwargs['ann_format'] = self._get_format(annfn, ext_map)
+        return await self.process(
+            code, annotations, codefn=codefn, **kwargs
+        )
+
+    async def create_document(
+            self, codefn, annfn,
+            title='', tpl=None, out_file=None, ext_map=None, **kwargs):
+        """
+        Asynchronous :meth:`codeco.processor.Processor.create_document`.
+
+        Documents are not streamed: the ``stream`` argument isn't supported.
+        Assets are written from the executor, see the ``assets_dir`` argument
+        of :meth:`codeco.processor.Processor.write_document`.
+        """
+        code, annotations = await self._read_files(codefn, annfn)
+        kwargs = Processor.document_options(
+            annfn, out_file=out_file, ext_map=ext_map, **kwargs
+        )
+
+        async def create():
+            document = await self._call(
+                'render_document', code, annotations,
+                codefn=codefn, title=title, tpl=tpl, **kwargs
+            )
+            if out_file is not None:
+                await get_running_loop().run_in_executor(
+                    None, _write, out_file, document
+                )
+            return document
+
+        key = hash_material(
+            'create_document', code, annotations, codefn, title, tpl,
+            out_file, kwargs
+        )
+        return await self._coalesce(key, create)
+
+    def close(self):
+        """
+        Release the resources of the processor. The executor is shut down
+        only if it was created by this processor.
+        """
+        if self._own_executor:
+            self.executor.shutdown()
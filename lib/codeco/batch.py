@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Batch processing module.
+"""
+
+from os import walk, makedirs
+from os.path import join, relpath, isdir, dirname
+from traceback import format_exc
+
+from codeco.processor import Processor, files_ext_map
+from codeco.cache import RenderCache, HighlightCache
+
+
+"""
+Annotations files extensions, in order of precedence, used to pair code files.
+The empty extension is excluded as a file cannot be paired with itself.
+"""
+annotations_exts = sorted(ext for ext in files_ext_map if ext)
+
+
+def find_pairs(root):
+    """
+    Find code - annotations pairs in a directory tree.
+
+    A code file is paired with an annotations file named after it plus one of
+    the extensions in ``codeco.processor.files_ext_map``. For example,
+    ``foo.py`` is paired with ``foo.py.md`` or ``foo.py.rst``.
+
+    :param str root: Path to the root of the tree.
+    :rtype: list
+    :return: A sorted list of tuples ``(codefn, annfn)`` with paths relative
+     to ``root``.
+    """
+
+    pairs = []
+    for dirpath, dirnames, filenames in walk(root):
+        dirnames.sort()
+        available = set(filenames)
+        for filename in sorted(filenames):
+            for ext in annotations_exts:
+                annfile = filename + ext
+                if annfile in available:
+                    pairs.append((
+                        relpath(join(dirpath, filename), root),
+                        relpath(join(dirpath, annfile), root),
+                    ))
+                    break
+    return pairs
+
+
+def create_processor(cache_dir=None, **kwargs):
+    """
+    Create a processor, optionally caching to a directory.
+
+    :param str cache_dir: Optional path to a directory to cache rendered
+     annotations and highlighted code between runs. See :mod:`codeco.cache`.
+    :param dict kwargs: Other arguments for
+     :class:`codeco.processor.Processor`.
+    :rtype: :class:`codeco.processor.Processor`
+    """
+    if cache_dir is not None:
+        kwargs['cache'] = RenderCache(join(cache_dir, 'render'))
+        kwargs['highlight_cache'] = HighlightCache(
+            join(cache_dir, 'highlight')
+        )
+    return Processor(**kwargs)
+
+
+# Per worker state, see _init_worker()
+_processor = None
+_processor_opts = None
+_options = None
+
+
+def _init_worker(options, processor_opts):
+    """
+    Initialize a worker process.
+
+    The processor is created by the first job, so a failure to create it is
+    reported as the error of the job instead of breaking the pool.
+
+    :param dict options: Options to be passed to
+     :meth:`codeco.processor.Processor.create_document` for each pair.
+    :param dict processor_opts: Options to be passed to
+     :func:`create_processor`.
+    """
+    global _processor, _processor_opts, _options
+    _processor = None
+    _processor_opts = processor_opts
+    _options = options
+
+
+def _process_pair(job):
+    """
+    Render a code - annotations pair in the current worker, which keeps its
+    processor warm between jobs.
+
+    :param tuple job: A tuple ``(codefn, annfn, outfn, title)``.
+    :rtype: tuple
+    :return: The job plus the formatted traceback of the error, if any.
+    """
+    global _processor
+    codefn, annfn, outfn, title = job
+    try:
+        if _processor is None:
+            _processor = create_processor(**_processor_opts)
+        _processor.create_document(
+            codefn, annfn,
+            title=title, out_file=outfn, **_options
+        )
+    except Exception:
+        return job + (format_exc(),)
+    return job + (None,)
+
+
+def process_tree(
+        source, output, jobs=None,
+        cache_dir=None, single_pass=False, **kwargs):
+    """
+    Render all code - annotations pairs found in a directory tree.
+
+    The output tree mirrors the source tree, where each code file ``foo.py``
+    produces a document ``foo.py.html``.
+
+    :param str source: Path to the source tree.
+    :param str output: Path to the output tree.
+    :param int jobs: Number of worker processes to use. If ``None`` is given,
+     the number of CPUs in the system will be used. If ``1`` is given, the
+     pairs are processed in the current process.
+    :param str cache_dir: Optional path to a directory to cache rendered
+     annotations and highlighted code between runs. See
+     :mod:`codeco.cache`.
+    :param bool single_pass: Publish all the reStructuredText annotations of
+     a document in a single pass when possible. See
+     :class:`codeco.processor.Processor`.
+    :param dict kwargs: Except for ``codefn``, ``annfn`` and ``out_file`` (with
+     are automatically set), this function supports all the other arguments
+     :meth:`codeco.processor.Processor.create_document` supports. If no
+     ``title`` is given, the relative path to the code file is used.
+    :rtype: list
+    :return: A list of tuples ``(codefn, annfn, outfn, title, error)`` in the
+     same order the pairs were found, where ``error`` is ``None`` on success
+     or the formatted traceback on failure.
+    """
+
+    title = kwargs.pop('title', None)
+
+    # Single pass publishing needs all the annotations of a document at once
+    kwargs.setdefault('stream', not single_pass)
+    processor_opts = {
+        'cache_dir': cache_dir,
+        'single_pass': single_pass,
+    }
+
+    queue = []
+    for codefn, annfn in find_pairs(source):
+        outfn = join(output, codefn + '.html')
+        queue.append((
+            join(source, codefn),
+            join(source, annfn),
+            outfn,
+            codefn if title is None else title,
+        ))
+
+        # Create directories before dispatching to avoid races in workers
+        outdir = dirname(outfn)
+        if not isdir(outdir):
+            makedirs(outdir)
+
+    if jobs == 1:
+        _init_worker(kwargs, processor_opts)
+        return [_process_pair(job) for job in queue]
+
+    if cache_dir is not None and not isdir(cache_dir):
+        makedirs(cache_dir)
+
+    from multiprocessing import Pool
+    pool = Pool(
+        processes=jobs,
+        initializer=_init_worker,
+        initargs=(kwargs, processor_opts),
+    )
+    try:
+        return pool.map(_process_pair, queue, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Caching module.
+"""
+
+from io import open
+from os import listdir, makedirs, rename, unlink, utime, close
+from os.path import join, isdir, getsize, getmtime
+from json import dumps
+from hashlib import sha1
+from tempfile import mkstemp
+from threading import Lock
+from collections import OrderedDict
+
+from pygments import __version__ as pygments_version
+
+from codeco import __version__
+
+
+class Cache(object):
+    """
+    Content addressed, size bounded, LRU cache of strings.
+
+    If a directory is given entries are stored on disk, one file per entry, so
+    they survive between runs and can be shared between processes. Otherwise
+    entries are kept in memory.
+
+    :param str directory: Optional path to the cache directory. It is created
+     if it doesn't exist.
+    :param int max_size: Maximum size of the cache in bytes (characters, if
+     kept in memory). When exceeded, the least recently used entries are
+     evicted.
+
+    Cache hits and misses are counted in the ``hits`` and ``misses``
+    attributes. The cache is safe to use from several threads, and a
+    directory can be shared by several processes. In that case, each process
+    only learns about the entries written by the others when it scans the
+    directory again, so the directory may exceed its size by up to
+    ``1 - low_water`` of it per process.
+    """
+
+    """
+    Fraction of the size an on-disk cache is reduced to when evicting.
+    """
+    low_water = 0.9
+
+    def __init__(self, directory=None, max_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+        # Key -> size if stored on disk, or key -> value if in memory.
+        # Ordered from least to most recently used.
+        self._entries = OrderedDict()
+        self._size = 0
+
+        # Size written to disk since the last scan of the directory
+        self._written = 0
+
+        if directory is not None:
+            if not isdir(directory):
+                makedirs(directory)
+            self._scan()
+            self._evict(rescan=False)
+
+    def _path(self, key):
+        return join(self.directory, key[:2], key[2:] + '.html')
+
+    def _scan(self):
+        """
+        Load the index of the entries in the cache directory, using the
+        modification time as the last time the entry was used.
+
+        Entries written or removed by other processes sharing the directory
+        since the last scan are taken into account.
+        """
+        found = []
+        for subdir in listdir(self.directory):
+            dirpath = join(self.directory, subdir)
+            if len(subdir) != 2 or not isdir(dirpath):
+                continue
+            try:
+                filenames = listdir(dirpath)
+            except OSError:
+                continue
+            for filename in filenames:
+                if not filename.endswith('.html'):
+                    continue
+                path = join(dirpath, filename)
+                key = subdir + filename[:-len('.html')]
+                try:
+                    found.append((getmtime(path), key, getsize(path)))
+                except OSError:
+                    # Evicted by another process sharing the directory
+                    continue
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._written = 0
+        for mtime, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+
+    def _evict(self, rescan=True):
+        """
+        Remove least recently used entries until the cache fits its size.
+
+        On disk, each process only counts its own writes, so the directory is
+        scanned again when the cache goes over its size or a fraction of it
+        has been written since the last scan. Entries are then evicted until
+        the cache fits in ``low_water`` of its size, so scans are not repeated
+        on every write.
+
+        :param bool rescan: Scan the directory if required before evicting.
+        """
+        if self.directory is None:
+            while self._size > self.max_size and self._entries:
+                key, value = self._entries.popitem(last=False)
+                self._size -= len(value)
+            return
+
+        if rescan and (
+                self._size > self.max_size or
+                self._written > self.max_size * (1 - self.low_water)):
+            self._scan()
+        if self._size <= self.max_size:
+            return
+
+        limit = int(self.max_size * self.low_water)
+        while self._size > limit and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                unlink(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key):
+        """
+        Get the value stored for a key.
+
+        :param str key: Key of the entry.
+        :rtype: str
+        :return: The value, or ``None`` if not cached.
+        """
+        with self._lock:
+            return self._get(key)
+
+    def put(self, key, value):
+        """
+        Store the value for a key.
+
+        :param str key: Key of the entry.
+        :param str value: Value to store.
+        """
+        with self._lock:
+            self._put(key, value)
+
+    def _get(self, key):
+        if key not in self._entries:
+            self.misses += 1
+            return None
+
+        value = self._entries.pop(key)
+
+        if self.directory is None:
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as fd:
+                stored = fd.read()
+            utime(path, None)
+        except (IOError, OSError):
+            # Evicted by another process sharing the directory
+            self._size -= value
+            self.misses += 1
+            return None
+
+        self._entries[key] = value
+        self.hits += 1
+        return stored
+
+    def _put(self, key, value):
+        if key in self._entries:
+            old = self._entries.pop(key)
+            self._size -= old if self.directory is not None else len(old)
+
+        if self.directory is None:
+            self._entries[key] = value
+            self._size += len(value)
+            self._evict()
+            return
+
+        # Write atomically, other processes might be reading the same entry
+        path = self._path(key)
+        subdir = join(self.directory, key[:2])
+        if not isdir(subdir):
+            try:
+                makedirs(subdir)
+            except OSError:
+                pass
+
+        handle, tmp = mkstemp(dir=subdir, suffix='.tmp')
+        close(handle)
+        with open(tmp, 'w', encoding='utf-8') as fd:
+            fd.write(value)
+        size = getsize(tmp)
+        rename(tmp, path)
+
+        self._entries[key] = size
+        self._size += size
+        self._written += size
+        self._evict()
+
+
+class RenderCache(Cache):
+    """
+    Cache for rendered annotations.
+
+    Entries are the final wrapped HTML fragment of an annotation body, keyed by
+    the hash of everything the fragment depends on. See :class:`Cache` for the
+    arguments.
+    """
+
+    @staticmethod
+    def key(body, ann_format, renderer_opts, hide):
+        """
+        Compute the key of an annotation body.
+
+        :param str body: Source of the annotation body.
+        :param str ann_format: Format of the annotation.
+        :param dict renderer_opts: Options passed to the renderer.
+        :param bool hide: If the annotation is hidden.
+        :rtype: str
+        :return: Hexadecimal hash for given arguments and codeco version.
+        """
+        return hash_material(
+            __version__, ann_format, renderer_opts, hide, body
+        )
+
+
+class HighlightCache(object):
+    """
+    Two tiers cache for highlighted code.
+
+    Entries are the HTML produced by Pygments, keyed by the hash of the code,
+    the lexer and the formatter options. Entries are kept in memory and,
+    optionally, on disk. Entries found on disk are promoted to memory.
+
+    :param str directory: Optional path to the on-disk tier directory.
+    :param int max_size: Maximum size of the in-memory tier in characters.
+    :param int max_disk_size: Maximum size of the on-disk tier in bytes.
+
+    Cache hits and misses, of both tiers combined, are counted in the ``hits``
+    and ``misses`` attributes.
+    """
+
+    def __init__(
+            self, directory=None,
+            max_size=16 * 1024 * 1024, max_disk_size=256 * 1024 * 1024):
+        self.memory = Cache(max_size=max_size)
+        self.disk = None
+        if directory is not None:
+            self.disk = Cache(directory, max_size=max_disk_size)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(code, lexer, options):
+        """
+        Compute the key of a piece of code.
+
+        :param str code: Code to be highlighted.
+        :param lexer: ``pygments.lexer.Lexer`` instance.
+        :param dict options: Options of the ``HtmlFormatter``.
+        :rtype: str
+        :return: Hexadecimal hash for given arguments, and codeco and Pygments
+         versions.
+        """
+        lexer_id = '{}.{}'.format(
+            type(lexer).__module__, type(lexer).__name__
+        )
+        return hash_material(
+            __version__, pygments_version,
+            lexer_id, lexer.options, options, code
+        )
+
+    def get(self, key):
+        """
+        Get the highlighted code stored for a key.
+
+        :param str key: Key as returned by :meth:`HighlightCache.key`.
+        :rtype: str
+        :return: The highlighted code, or ``None`` if not cached.
+        """
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Store the highlighted code for a key in all tiers.
+
+        :param str key: Key as returned by :meth:`HighlightCache.key`.
+        :param str value: Highlighted code.
+        """
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+
+def hash_material(*material):
+    """
+    Hash given JSON serializable material.
+    """
+    serialized = dumps(material, sort_keys=True, default=repr)
+    return sha1(serialized.encode('utf-8')).hexdigest()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Render daemon client module.
+
+Functions to submit jobs to a :class:`codeco.daemon.RenderDaemon`. See
+:mod:`codeco.daemon` for the protocol. This module is light to import, so
+clients can check for a daemon on every run.
+"""
+
+from os import environ, getuid, stat
+from os.path import join, abspath
+from stat import S_ISSOCK
+from json import dumps, loads
+from socket import socket, AF_UNIX, SOCK_STREAM
+from tempfile import gettempdir
+
+from codeco import __version__
+
+
+def default_socket():
+    """
+    Get the default path of the socket of the daemon.
+
+    It is the ``CODECO_SOCKET`` environment variable, if set. Otherwise, it is
+    a per user socket in ``XDG_RUNTIME_DIR``, or in the temporary directory.
+
+    :rtype: str
+    """
+    path = environ.get('CODECO_SOCKET', None)
+    if path:
+        return path
+    directory = environ.get('XDG_RUNTIME_DIR', None) or gettempdir()
+    return join(directory, 'codeco-{}.sock'.format(getuid()))
+
+
+def is_daemon_socket(path):
+    """
+    Check if path is a socket owned by the current user. It only takes a
+    ``stat`` call, so it is cheap enough to do on every run.
+
+    :rtype: bool
+    """
+    try:
+        info = stat(path)
+    except OSError:
+        return False
+    return S_ISSOCK(info.st_mode) and info.st_uid == getuid()
+
+
+def submit(request, path=None):
+    """
+    Submit a job to the daemon and wait for its response.
+
+    :param dict request: The job. See :func:`create_request`.
+    :param str path: Path to the socket of the daemon. If ``None`` is given,
+     :func:`default_socket` is used.
+    :rtype: dict
+    :return: The response, or ``None`` if no daemon is listening or it
+     refused the job. Jobs can then be run in process.
+    """
+    if path is None:
+        path = default_socket()
+
+    # Don't talk to sockets of other users
+    if not is_daemon_socket(path):
+        return None
+
+    sock = socket(AF_UNIX, SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except OSError:
+            # Stale socket or daemon shutting down
+            return None
+
+        sock.sendall(dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as fd:
+            line = fd.readline()
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+    if not line:
+        return None
+    response = loads(line.decode('utf-8'))
+    if response['status'] == 'refused':
+        return None
+    return response
+
+
+def create_request(
+        codefn, annfn, out_file=None, processor_opts=None, **kwargs):
+    """
+    Create a job for the daemon.
+
+    :param str codefn: Path to the code file.
+    :param str annfn: Path to the annotations file.
+    :param str out_file: Optional path for the output file. If given, the
+     document is written by the daemon and not sent back.
+    :param dict processor_opts: Arguments of
+     :func:`codeco.batch.create_processor`. They must be JSON serializable.
+    :param dict kwargs: Other arguments of
+     :meth:`codeco.processor.Processor.create_document`, except for
+     ``stream``. They must be JSON serializable.
+    :rtype: dict
+    """
+    processor_opts = dict(processor_opts or {})
+    if processor_opts.get('cache_dir', None) is not None:
+        processor_opts['cache_dir'] = abspath(processor_opts['cache_dir'])
+
+    return {
+        'version' : __version__,
+        'cwd' : abspath('.'),
+        'codefn' : codefn,
+        'annfn' : annfn,
+        'out_file' : out_file,
+        'processor' : processor_opts,
+        'options' : kwargs,
+    }
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Render daemon module.
+
+A :class:`RenderDaemon` keeps warm processors resident and creates documents
+for clients connected to a Unix domain socket, so each ``codeco`` run doesn't
+start cold. Each connection carries a single job: a request, and then a
+response, each one a JSON object on its own line.
+
+A request has the keys:
+
+- ``version``: Version of ``codeco`` of the client. Daemons of other versions
+  refuse the job.
+- ``cwd``: Working directory of the client, relative paths are resolved
+  against it.
+- ``codefn``, ``annfn`` and ``out_file``: Paths to the code, annotations and
+  optional output files.
+- ``processor``: Arguments of :func:`codeco.batch.create_processor`.
+- ``options``: Other arguments of
+  :meth:`codeco.processor.Processor.create_document`.
+
+A response has the keys ``status`` (``'ok'``, ``'error'`` or ``'refused'``),
+``document`` (the document, unless written to the output file), ``warnings``
+(the list of warnings of the parsing) and ``error`` (the formatted traceback
+of the error, if any).
+
+Clients use :mod:`codeco.client`, that doesn't import this module.
+"""
+
+from os import unlink, umask, cpu_count
+from os.path import join, exists
+from json import dumps, loads
+from time import time
+from socket import socket, AF_UNIX, SOCK_STREAM
+from threading import Lock
+from traceback import format_exc
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+
+from codeco import __version__
+from codeco.cache import RenderCache
+from codeco.batch import create_processor
+from codeco.client import default_socket, is_daemon_socket
+
+
+class DaemonHandler(StreamRequestHandler):
+    """
+    Handler of a connection to the daemon.
+    """
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        self.server.begin_job()
+        start = time()
+        request = {}
+        try:
+            request = loads(line.decode('utf-8'))
+            if request.get('version', None) != __version__:
+                response = {
+                    'status' : 'refused',
+                    'document' : None,
+                    'warnings' : [],
+                    'error' : 'Daemon version is {}.'.format(__version__),
+                }
+            else:
+                document, warnings = self.server.executor.submit(
+                    self.server.create_document, request
+                ).result()
+                response = {
+                    'status' : 'ok',
+                    'document' : document,
+                    'warnings' : warnings,
+                    'error' : None,
+                }
+        except Exception:
+            response = {
+                'status' : 'error',
+                'document' : None,
+                'warnings' : [],
+                'error' : format_exc(),
+            }
+        finally:
+            self.server.end_job()
+
+        if self.server.verbose and response['status'] != 'refused':
+            print('[{}] {} in {:.2f}s'.format(
+                ' OK ' if response['error'] is None else 'FAIL',
+                request.get('codefn', '?'), time() - start,
+            ))
+
+        try:
+            self.wfile.write(dumps(response).encode('utf-8') + b'\n')
+        except (IOError, OSError):
+            pass
+
+
+class RenderDaemon(ThreadingMixIn, UnixStreamServer):
+    """
+    Daemon that creates documents for clients connected to a Unix domain
+    socket.
+
+    Connections are accepted in their own threads, and jobs are run
+    concurrently by a pool of ``max_jobs`` threads that live as long as the
+    daemon, so lexers, renderers sessions, styles and rendered annotations
+    are reused between jobs. A warm processor is kept for each distinct set
+    of processor options. Without a cache directory, rendered annotations are
+    cached in memory.
+
+    The socket is only accessible by the current user. Call
+    :meth:`RenderDaemon.close` to remove it.
+
+    :param str path: Path to the socket. If ``None`` is given,
+     :func:`codeco.client.default_socket` is used.
+    :param float idle_timeout: Seconds without jobs after which
+     :meth:`RenderDaemon.serve_until_idle` returns. ``None`` or ``0`` to
+     serve forever.
+    :param int max_jobs: Maximum number of jobs run at a time. If ``None`` is
+     given, the number of CPUs in the system is used.
+    :param bool verbose: Log jobs to standard output.
+    :raises RuntimeError: If another daemon is listening on the socket, or
+     the path exists and isn't a socket of the current user.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+            self, path=None, idle_timeout=600.0,
+            max_jobs=None, verbose=False):
+        if path is None:
+            path = default_socket()
+
+        # Replace stale sockets, not the ones of live daemons or other users
+        if exists(path):
+            if not is_daemon_socket(path):
+                raise RuntimeError(
+                    '{} exists and is not a socket of the current '
+                    'user.'.format(path)
+                )
+            probe = socket(AF_UNIX, SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                unlink(path)
+            else:
+                raise RuntimeError(
+                    'A daemon is already listening on {}.'.format(path)
+                )
+            finally:
+                probe.close()
+
+        mask = umask(0o177)
+        try:
+            UnixStreamServer.__init__(self, path, DaemonHandler)
+        finally:
+            umask(mask)
+
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.verbose = verbose
+
+        if max_jobs is None:
+            max_jobs = cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs)
+
+        self._lock = Lock()
+        self._processors = {}
+        self._active = 0
+        self._last = time()
+
+    def begin_job(self):
+        with self._lock:
+            self._active += 1
+
+    def end_job(self):
+        with self._lock:
+            self._active -= 1
+            self._last = time()
+
+    def get_processor(self, processor_opts):
+        """
+        Get the warm processor for given options, creating it on first use.
+
+        :param dict processor_opts: Arguments of
+         :func:`codeco.batch.create_processor`.
+        :rtype: :class:`codeco.processor.Processor`
+        """
+        key = dumps(processor_opts, sort_keys=True)
+        with self._lock:
+            processor = self._processors.get(key, None)
+            if processor is None:
+                processor_opts = dict(processor_opts)
+                if processor_opts.get('cache_dir', None) is None:
+                    processor_opts['cache'] = RenderCache()
+                processor = self._processors[key] = create_processor(
+                    **processor_opts
+                )
+        return processor
+
+    def create_document(self, request):
+        """
+        Create the document of a job.
+
+        Files are resolved against the working directory of the client, but
+        the code file name is passed as given to the processor, so guessed
+        lexers and ``'path'`` prefixes are the same as in the client.
+
+        :param dict request: The job. See
+         :func:`codeco.client.create_request`.
+        :rtype: tuple
+        :return: A tuple ``(document, warnings)`` with the document, or
+         ``None`` if it was written to the output file, and the list of
+         warnings of the parsing.
+        """
+        cwd = request['cwd']
+        codefn = request['codefn']
+        annfn = join(cwd, request['annfn'])
+        out_file = request['out_file']
+        if out_file is not None:
+            out_file = join(cwd, out_file)
+
+        processor = self.get_processor(request['processor'])
+        options = dict(request['options'])
+        if options.get('assets_dir', None) is not None:
+            options['assets_dir'] = join(cwd, options['assets_dir'])
+        options = processor.document_options(
+            annfn, out_file=out_file, **options
+        )
+
+        # Warning: might raise IO exceptions
+        code, annotations = processor.read_files(join(cwd, codefn), annfn)
+
+        with processor._capturing_warnings() as warnings:
+            document = processor.render_document(
+                code, annotations, codefn=codefn, **options
+            )
+
+        # Warning: might raise IO exceptions
+        if out_file is None:
+            return document, warnings
+        with open(out_file, 'w') as of:
+            of.write(document)
+        return None, warnings
+
+    def serve_until_idle(self, poll_interval=0.5):
+        """
+        Serve jobs until no job has been run for ``idle_timeout`` seconds.
+
+        :param float poll_interval: Seconds between checks of the timeout.
+        """
+        self.timeout = poll_interval
+        while True:
+            self.handle_request()
+            if not self.idle_timeout:
+                continue
+            with self._lock:
+                if not self._active and \
+                        time() - self._last >= self.idle_timeout:
+                    return
+
+    def close(self):
+        """
+        Stop accepting jobs, remove the socket and release the resources of
+        the daemon.
+        """
+        self.server_close()
+        if exists(self.path):
+            unlink(self.path)
+        self.executor.shutdown()
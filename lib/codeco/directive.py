@@ -19,20 +19,81 @@ Directive for Sphinx document system.
 """
 
 import re
-from os.path import join
+from io import open
+from os.path import join, splitext, basename
 
 from docutils import nodes
-from sphinx.util.compat import Directive
+from docutils.parsers.rst import Directive, directives
+from pygments import __version__ as pygments_version
+from pygments.styles import get_style_by_name
+from pygments.util import ClassNotFound
+from sphinx.util import logging
 from sphinx.util.osutil import ensuredir
 
-from codeco.processor import Processor
+from codeco import __version__
+from codeco.cache import hash_material
+from codeco.processor import Processor, interact_script
+from codeco.processor import files_ext_map, prefix_placeholder
+
+
+logger = logging.getLogger(__name__)
 
 
 class codeco_node(nodes.General, nodes.Element):
+    """
+    Node of an annotated code block.
+
+    The node only references the block, with the ``docname`` and ``block``
+    attributes, so it is compact and can be pickled and copied. The rendered
+    block is kept in the build environment, see :func:`get_blocks`.
+    """
+    pass
+
+
+def get_blocks(env):
+    """
+    Get the blocks stored in the build environment.
+
+    :rtype: dict
+    :return: A dictionary mapping document names to lists of tuples
+     ``(key, prefix)``, in the order the blocks appear in the document, where
+     ``key`` is the key of the rendered block in :func:`get_cache`.
+    """
+    if not hasattr(env, 'codeco_blocks'):
+        env.codeco_blocks = {}
+    return env.codeco_blocks
+
+
+def get_cache(env):
+    """
+    Get the cache of rendered blocks stored in the build environment.
 
-    def __init__(self, codeco_dict=None, **kwargs):
-        self.codeco_dict = codeco_dict
-        super(codeco_node, self).__init__(**kwargs)
+    The cache persists between incremental builds, so blocks whose content
+    didn't change are not highlighted or rendered again when their document
+    is read again.
+
+    :rtype: dict
+    :return: A dictionary mapping the hash of the content of a block to the
+     block rendered with the ``codeco.processor.prefix_placeholder`` prefix.
+    """
+    if not hasattr(env, 'codeco_cache'):
+        env.codeco_cache = {}
+    return env.codeco_cache
+
+
+# Warm processor of this process, see get_processor()
+_processor = None
+
+
+def get_processor():
+    """
+    Get the processor of this process, keeping lexers and renderers warm
+    between blocks.
+    """
+    global _processor
+    if _processor is None:
+        _processor = Processor()
+    return _processor
 
 
 class CodecoDirective(Directive):
@@ -40,14 +101,21 @@ class CodecoDirective(Directive):
     has_content = True
     required_arguments = 0
     optional_arguments = 0
+    option_spec = {
+        'lexer': directives.unchanged,
+        'code': directives.path,
+        'annotations': directives.path,
+    }
 
     # Regex required to split content
     div_regex = \
         r'^<\[===========*\]> *?$'
     div_re = re.compile(div_regex)
 
-    def run(self):
-
+    def _split_content(self):
+        """
+        Split the content of the directive into code and annotations.
+        """
         code = []
         annotations = []
 
@@ -61,13 +129,88 @@ class CodecoDirective(Directive):
                 continue
             bucket.append(line)
 
-        proc = Processor()
-        codeco_dict = proc.process(
-            '\n'.join(code),
-            '\n'.join(annotations)
+        return '\n'.join(code), '\n'.join(annotations)
+
+    def _read_file(self, option):
+        """
+        Read the file given in an option and register it as a dependency of
+        the document, so the document is read again when the file changes.
+
+        :rtype: tuple
+        :return: A tuple ``(path, content)``.
+        """
+        env = self.state.document.settings.env
+        relfn, filename = env.relfn2path(self.options[option])
+        env.note_dependency(relfn)
+
+        encoding = self.state.document.settings.input_encoding
+        try:
+            with open(filename, 'r', encoding=encoding) as fd:
+                return filename, fd.read()
+        except (IOError, OSError, UnicodeError) as e:
+            raise self.error(
+                'Unable to read {} file "{}": {}'.format(
+                    option, self.options[option], e
+                )
+            )
+
+    def run(self):
+
+        env = self.state.document.settings.env
+        codefn = None
+        ann_format = 'rest'
+
+        # Get code and annotations, from files or content
+        if 'code' in self.options and 'annotations' in self.options:
+            if self.content:
+                raise self.error(
+                    'No content is allowed when both the code and the '
+                    'annotations files are given.'
+                )
+            code, annotations = '', ''
+        elif 'code' in self.options:
+            code, annotations = '', '\n'.join(self.content)
+        elif 'annotations' in self.options:
+            code, annotations = '\n'.join(self.content), ''
+        else:
+            code, annotations = self._split_content()
+
+        if 'code' in self.options:
+            codefn, code = self._read_file('code')
+        if 'annotations' in self.options:
+            annfn, annotations = self._read_file('annotations')
+            ann_format = files_ext_map.get(splitext(annfn)[1], 'rest')
+
+        lexer = self.options.get('lexer', None)
+
+        # Render the block, unless its content was already rendered. Lexers
+        # are guessed from the whole file name, like CMakeLists.txt.
+        key = hash_material(
+            __version__, pygments_version, code, annotations, ann_format,
+            lexer, None if codefn is None else basename(codefn),
+        )
+        cache = get_cache(env)
+        if key not in cache:
+            codeco_dict = get_processor().process(
+                code, annotations,
+                codefn=codefn, ann_format=ann_format,
+                prefix=prefix_placeholder, lexer=lexer,
+            )
+            cache[key] = directive_tpl.format(
+                annotations='\n'.join(codeco_dict['annotations']),
+                code=codeco_dict['code'],
+            )
+
+        # Derive prefix from location for reproducible builds
+        prefix = get_processor()._generate_prefix(
+            seed='{}:{}'.format(env.docname, self.lineno)
         )
 
-        return [codeco_node(codeco_dict=codeco_dict)]
+        # Styles and script are written once per build, see build_finished()
+        blocks = get_blocks(env).setdefault(env.docname, [])
+        blocks.append((key, prefix))
+
+        return [codeco_node(docname=env.docname, block=len(blocks) - 1)]
 
 
 directive_tpl = """\
@@ -81,34 +224,12 @@ directive_tpl = """\
 
 
 def visit_codeco_node(self, node):
-    # Get variables
-    d = node.codeco_dict
-    codestyle = getattr(
-        self.settings.env.config, 'pygments_style', None
-    )
-
     # Add segment to body
-    document = directive_tpl.format(
-        annotations='\n'.join(d['annotations']),
-        code=d['code'],
-        codestyle=codestyle,
+    env = self.builder.env
+    key, prefix = get_blocks(env)[node['docname']][node['block']]
+    self.body.append(
+        get_cache(env)[key].replace(prefix_placeholder, prefix)
     )
-    self.body.append(document)
-
-    # Create style and script files
-    # XXX This will recreate the file again and again. I accept better ideas :S
-    html_static_path = getattr(
-        self.settings.env.config, 'html_static_path', ['_static']
-    )
-    build_dir = join(
-        self.builder.outdir, html_static_path[0]  # First index, are you sure?
-    )
-    ensuredir(build_dir)
-
-    with open(join(build_dir, 'codeco.css'), 'w') as css:
-        css.write(d['styles'][-1])  # Only extras, are you sure?
-    with open(join(build_dir, 'codeco.js'), 'w') as js:
-        js.write(d['script'])
 
     raise nodes.SkipNode
 
@@ -117,9 +238,84 @@ def depart_codeco_node(self, node):
     pass
 
 
+def get_codestyle(config):
+    """
+    Get the Pygments style for the code blocks, the configured
+    ``pygments_style`` if it's a known style, or ``'monokai'`` otherwise.
+    """
+    codestyle = getattr(config, 'pygments_style', None)
+    if codestyle is None:
+        return 'monokai'
+
+    try:
+        get_style_by_name(codestyle)
+    except ClassNotFound:
+        logger.warning(
+            'codeco: unknown Pygments style "%s", using "monokai".', codestyle
+        )
+        return 'monokai'
+    return codestyle
+
+
 def builder_inited(app):
-    app.add_stylesheet('codeco.css')
-    app.add_javascript('codeco.js')
+    add_css_file = getattr(app, 'add_css_file', None) or app.add_stylesheet
+    add_js_file = getattr(app, 'add_js_file', None) or app.add_javascript
+    add_css_file('codeco.css')
+    add_js_file('codeco.js')
+
+
+def env_purge_doc(app, env, docname):
+    """
+    Forget the blocks of a document that is about to be read again.
+    """
+    get_blocks(env).pop(docname, None)
+
+
+def env_merge_info(app, env, docnames, other):
+    """
+    Merge the blocks of the documents read by a parallel reader.
+    """
+    blocks = get_blocks(env)
+    cache = get_cache(env)
+    other_blocks = get_blocks(other)
+    other_cache = get_cache(other)
+    for docname in docnames:
+        if docname not in other_blocks:
+            continue
+        blocks[docname] = other_blocks[docname]
+        for key, prefix in other_blocks[docname]:
+            cache[key] = other_cache[key]
+
+
+def env_updated(app, env):
+    """
+    Remove the rendered blocks no longer used by any document.
+    """
+    used = set(
+        key for blocks in get_blocks(env).values() for key, prefix in blocks
+    )
+    cache = get_cache(env)
+    for key in list(cache):
+        if key not in used:
+            del cache[key]
+    return []
+
+
+def build_finished(app, exception):
+    """
+    Write the style and script files, once per build.
+    """
+    if exception is not None or app.builder.format != 'html':
+        return
+
+    styles = get_processor()._get_styles(get_codestyle(app.config))
+
+    static_dir = join(app.builder.outdir, '_static')
+    ensuredir(static_dir)
+    with open(join(static_dir, 'codeco.css'), 'w') as css:
+        css.write('\n'.join(styles))
+    with open(join(static_dir, 'codeco.js'), 'w') as js:
+        js.write(interact_script)
 
 
 def setup(app):
@@ -135,3 +331,14 @@ def setup(app):
     app.add_directive('annotated-code', CodecoDirective)
 
     app.connect('builder-inited', builder_inited)
+    app.connect('env-purge-doc', env_purge_doc)
+    app.connect('env-merge-info', env_merge_info)
+    app.connect('env-updated', env_updated)
+    app.connect('build-finished', build_finished)
+
+    return {
+        'version' : __version__,
+        'env_version' : 3,
+        'parallel_read_safe' : True,
+        'parallel_write_safe' : True,
+    }
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Annotations data model module.
+"""
+
+from array import array
+from bisect import bisect_right
+
+
+class Target(object):
+    """
+    Line, or range of characters of a line, targeted by an annotation.
+
+    :param int line: Number of the line, starting at 1.
+    :param int beg: First character of the range, starting at 0, or ``None``
+     to target the whole line.
+    :param int end: Last character of the range, inclusive, or ``None`` to
+     target the whole line.
+    """
+
+    __slots__ = ('line', 'beg', 'end')
+
+    def __init__(self, line, beg=None, end=None):
+        self.line = line
+        self.beg = beg
+        self.end = end
+
+    def __repr__(self):
+        return 'Target({!r}, {!r}, {!r})'.format(self.line, self.beg, self.end)
+
+    def as_data(self):
+        """
+        Get the target as a compact JSON serializable list, ``[line]`` or
+        ``[line, beg, end]``.
+        """
+        if self.beg is None or self.end is None:
+            return [self.line]
+        return [self.line, self.beg, self.end]
+
+
+class Annotation(object):
+    """
+    Header of an annotation.
+
+    :param int index: Position of the annotation in its block, starting at 0.
+    :param list targets: List of :class:`Target`, or ``None`` if the header
+     has no arguments.
+    :param str prefix: Prefix of the block.
+    :param bool hide: If the body of the annotation is hidden, except for its
+     title.
+    """
+
+    __slots__ = ('index', 'targets', 'prefix', 'hide')
+
+    def __init__(self, index, targets=None, prefix='', hide=False):
+        self.index = index
+        self.targets = targets
+        self.prefix = prefix
+        self.hide = hide
+
+    def __repr__(self):
+        return 'Annotation({!r}, {!r}, {!r}, {!r})'.format(
+            self.index, self.targets, self.prefix, self.hide
+        )
+
+    @property
+    def anchor(self):
+        """
+        Identifier of the element of the annotation in the document.
+        """
+        return '{}annotation-{}'.format(self.prefix, self.index)
+
+    def as_data(self):
+        """
+        Get the annotation as a compact JSON serializable dictionary with the
+        keys ``targets`` (list of targets, see :meth:`Target.as_data`) and
+        ``hide``.
+        """
+        return {
+            'targets' : [
+                target.as_data() for target in self.targets or ()
+            ],
+            'hide' : self.hide,
+        }
+
+
+class AnnotationIndex(object):
+    """
+    Index of the annotations that target each line of a block.
+
+    The lines targeted by each annotation are merged into intervals of
+    consecutive lines, and the intervals of all the annotations are split at
+    their boundaries into disjoint segments of lines touched by the same
+    annotations. Segments and the indexes of their annotations are kept in
+    arrays, so the index takes a few bytes per segment and finding the
+    annotations of a line is a binary search.
+
+    :param annotations: Iterable of :class:`Annotation`. ``None`` items are
+     ignored.
+    """
+
+    __slots__ = ('_firsts', '_lasts', '_offsets', '_members')
+
+    def __init__(self, annotations):
+        # Boundaries of the intervals, mapped to the annotations that start
+        # and stop touching lines there
+        starts = {}
+        stops = {}
+        for ann in annotations:
+            if ann is None or not ann.targets:
+                continue
+
+            lines = sorted(set(target.line for target in ann.targets))
+            first = last = lines[0]
+            for line in lines[1:]:
+                if line != last + 1:
+                    starts.setdefault(first, []).append(ann.index)
+                    stops.setdefault(last + 1, []).append(ann.index)
+                    first = line
+                last = line
+            starts.setdefault(first, []).append(ann.index)
+            stops.setdefault(last + 1, []).append(ann.index)
+
+        self._firsts = array('I')
+        self._lasts = array('I')
+        self._offsets = array('I', [0])
+        self._members = array('I')
+
+        # Sweep the boundaries keeping the set of active annotations
+        active = set()
+        bounds = sorted(set(starts) | set(stops))
+        for pos, bound in enumerate(bounds):
+            active.difference_update(stops.get(bound, ()))
+            active.update(starts.get(bound, ()))
+            if not active:
+                continue
+
+            # Active annotations always stop at a later boundary
+            self._firsts.append(bound)
+            self._lasts.append(bounds[pos + 1] - 1)
+            self._members.extend(sorted(active))
+            self._offsets.append(len(self._members))
+
+    def __len__(self):
+        """
+        Number of segments of the index.
+        """
+        return len(self._firsts)
+
+    def annotations_at(self, line):
+        """
+        Get the annotations that target given line.
+
+        :param int line: Number of the line.
+        :rtype: tuple
+        :return: The sorted indexes of the annotations.
+        """
+        pos = bisect_right(self._firsts, line) - 1
+        if pos < 0 or line > self._lasts[pos]:
+            return ()
+        return tuple(
+            self._members[self._offsets[pos]:self._offsets[pos + 1]]
+        )
+
+    def segments(self):
+        """
+        Iterate the segments of the index, in order.
+
+        :rtype: generator
+        :return: A generator of tuples ``(first, last, indexes)`` with the
+         first and last lines of the segment, inclusive, and the sorted
+         indexes of the annotations that target them.
+        """
+        for pos, first in enumerate(self._firsts):
+            yield (
+                first, self._lasts[pos],
+                tuple(self._members[
+                    self._offsets[pos]:self._offsets[pos + 1]
+                ]),
+            )
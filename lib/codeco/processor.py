@@ -19,15 +19,25 @@ Main processing module.
 """
 
 import re
+import sys
+from io import StringIO
 from json import dumps
 from random import random
 from hashlib import sha1
-from os.path import splitext
-
-from pygments import lexers, highlight, formatters
-from markdown import markdown
-from docutils.core import publish_parts
-from bs4 import BeautifulSoup, Tag
+from os import unlink, makedirs, rename, chmod, close, sep
+from os.path import splitext, basename, exists, isdir, join, relpath
+from os.path import abspath, dirname
+from tempfile import mkstemp
+from threading import local
+from fnmatch import fnmatchcase
+from functools import wraps
+from contextlib import contextmanager, nullcontext
+
+from codeco.cache import HighlightCache
+from codeco.model import Target, Annotation, AnnotationIndex
+from codeco.renderers import get_renderer
+from codeco.template import compile_template
+from codeco.wrapper import wrap
 
 
 default_tpl = """\
@@ -71,10 +81,9 @@ default_tpl = """\
     {styles}
     </style>
 
-    <script src="http://code.jquery.com/jquery-2.1.0.min.js"></script>
     <script type="text/javascript">
     {script}
-    </script>
+    </script>{assets}
 </head>
 <body>
 <div id="wrapper">
@@ -93,13 +102,33 @@ default_tpl = """\
 
 
 annotation_tpl = """\
-<div class="annotation">
-    <span style="display: none;" class="data">{json}</span>
+<div class="annotation" id="{anchor}">
     {body}
 </div>
 """
 
 
+assets_tpl = """
+    <link rel="stylesheet" type="text/css" href="{stylesheet}" />
+    <script type="text/javascript" src="{script}"></script>"""
+
+
+data_tpl = """\
+<script type="application/json" class="codeco-data">{json}</script>
+"""
+
+
+chunk_tpl = """\
+<tbody class="codeco-chunk" data-first="{first}" data-last="{last}">\
+{row}</tbody>"""
+
+
+lazy_chunk_tpl = """\
+<tbody class="codeco-chunk codeco-lazy" \
+data-first="{first}" data-last="{last}">\
+{placeholder}<template>{row}</template></tbody>"""
+
+
 extra_styles = """\
 table.highlighttable .hll-line,
 table.highlighttable .hll-char {
@@ -111,102 +140,192 @@ table.highlighttable .hll-char {
 table.highlighttable .hll-line {
     display: block;
 }
-"""
 
+table.highlighttable a.annotation-link {
+    float: right;
+    padding-left: 0.5em;
+    color: inherit;
+    opacity: 0.5;
+    text-decoration: none;
+}
 
-interact_script = """\
-$(window).load(function () {
+table.highlighttable a.annotation-link:after {
+    content: '\\2190';
+}
 
-    var speed = 300;
+div.annotation_hidden:not(.hover) > :not(.annotation_title) {
+    display: none;
+}
+"""
 
-    // Hide non title elements for annotations that require it.
-    $('div.annotation_body').each(function () {
-        var meta = jQuery.parseJSON($(this).siblings('.data').text());
-        if (meta.hide) {
-            $(this).children('*:not(.annotation_title)').hide();
+
+interact_script = """\
+(function () {
+
+    // Annotations by identifier, see setup()
+    var annotations = {};
+
+    // Materialize lazy code chunks when they are about to be visible, or
+    // when targeted by an annotation or the location hash.
+    function materialize(chunk) {
+        var tpl = null;
+        for (var i = 0; i < chunk.children.length; i++) {
+            if (chunk.children[i].tagName == 'TEMPLATE') {
+                tpl = chunk.children[i];
+            }
+        }
+        if (tpl == null) {
+            return;
         }
-    });
+        while (chunk.firstChild !== tpl) {
+            chunk.removeChild(chunk.firstChild);
+        }
+        chunk.replaceChild(document.importNode(tpl.content, true), tpl);
+        chunk.classList.remove('codeco-lazy');
+    }
 
-    function show_annotation(ann_body, adding) {
+    function materialize_element(element) {
+        var chunk = element && element.closest('tbody.codeco-lazy');
+        if (chunk != null) {
+            materialize(chunk);
+        }
+    }
 
-        ann_body.toggleClass('hover');
+    function materialize_hash() {
+        materialize_element(
+            document.getElementById(window.location.hash.slice(1))
+        );
+    }
 
-        // Display line if required.
-        var meta = jQuery.parseJSON(ann_body.siblings('.data').text());
-        if (meta.hide) {
-            ann_body.children('*:not(.annotation_title)').slideToggle(speed);
+    function observe_chunks() {
+        var chunks = document.querySelectorAll('tbody.codeco-lazy');
+        if (!chunks.length) {
+            return;
         }
-
-        if (meta.args == null) {
+        if (!window.IntersectionObserver) {
+            for (var i = 0; i < chunks.length; i++) {
+                materialize(chunks[i]);
+            }
             return;
         }
+        var observer = new IntersectionObserver(function (entries) {
+            for (var i = 0; i < entries.length; i++) {
+                if (entries[i].isIntersecting) {
+                    observer.unobserve(entries[i].target);
+                    materialize(entries[i].target);
+                }
+            }
+        }, {rootMargin: '100% 0px'});
+        for (var j = 0; j < chunks.length; j++) {
+            observer.observe(chunks[j]);
+        }
+    }
 
-        for (var i = 0; i < meta.args.length; i++) {
-
-            var arg = meta.args[i];
-            var line = $('#' + meta.prefix + 'line-' + arg.line);
-
-            // Highlight line
-            if (arg.beg == null || arg.end == null) {
-                line.toggleClass('hll hll-line');
-                continue;
+    // Read the data block of each code block. Targets are [line] or
+    // [line, beg, end].
+    function setup() {
+        var blocks = document.querySelectorAll('script.codeco-data');
+        for (var i = 0; i < blocks.length; i++) {
+            var data = JSON.parse(blocks[i].textContent);
+            for (var j = 0; j < data.annotations.length; j++) {
+                var ann = data.annotations[j];
+                ann.prefix = data.prefix;
+                ann.elements = null;
+                annotations[data.prefix + 'annotation-' + j] = ann;
             }
+        }
+    }
 
-            // Highlight characters
-            if (!adding) {
-                line.find('.hll-char').contents().unwrap();
+    // Find the elements to highlight for an annotation, once
+    function get_elements(ann) {
+        if (ann.elements != null) {
+            return ann.elements;
+        }
+        var elements = [];
+        for (var i = 0; i < ann.targets.length; i++) {
+            var target = ann.targets[i];
+            var line = document.getElementById(
+                ann.prefix + 'line-' + target[0]
+            );
+
+            // Chunks are materialized first, so elements are not replaced
+            // afterwards
+            materialize_element(line);
+            if (target.length < 3) {
+                line = document.getElementById(
+                    ann.prefix + 'line-' + target[0]
+                );
+                if (line != null) {
+                    elements.push([line, 'hll-line']);
+                }
                 continue;
             }
 
-            var html = line.html();
-            var in_tag = false;
-            var buff = [];
-            var codej = 0;
-
-            for (var j = 0; j < html.length; j++) {
+            // Characters, already marked when highlighting
+            var chars = document.getElementsByClassName(
+                ann.prefix + 'chars-' + target.join('-')
+            );
+            for (var j = 0; j < chars.length; j++) {
+                elements.push([chars[j], null]);
+            }
+        }
+        ann.elements = elements;
+        return elements;
+    }
 
-                var char = html.charAt(j);
+    function show_annotation(body, adding) {
+        body.classList.toggle('hover', adding);
 
-                if (in_tag) {
-                    if (char == '>') {
-                        in_tag = false;
-                    }
-                    buff.push(char);
-                    continue;
-                }
+        var ann = annotations[body.parentNode.id];
+        if (ann == null) {
+            return;
+        }
+        var elements = get_elements(ann);
+        for (var i = 0; i < elements.length; i++) {
+            elements[i][0].classList.toggle('hll', adding);
+            if (elements[i][1] != null) {
+                elements[i][0].classList.toggle(elements[i][1], adding);
+            }
+        }
+    }
 
-                if (!in_tag && char == '<') {
-                    in_tag = true;
-                    buff.push(char);
-                    continue;
-                }
+    // A single delegated listener for all the annotations
+    var current = null;
 
-                if (codej >= arg.beg && codej <= arg.end) {
-                    buff.push(
-                        '<span class="hll hll-char">' +
-                        char +
-                        '</span>'
-                    );
-                } else {
-                    buff.push(char);
-                }
-                codej++;
-            }
-            line.html(buff.join(''));
-            line.addClass('hll-chars');
+    function hover(body) {
+        if (body === current) {
+            return;
+        }
+        if (current != null) {
+            show_annotation(current, false);
         }
+        current = body;
+        if (current != null) {
+            show_annotation(current, true);
+        }
+    }
 
+    function init() {
+        setup();
+        observe_chunks();
+        materialize_hash();
+        window.addEventListener('hashchange', materialize_hash);
+
+        document.addEventListener('mouseover', function (event) {
+            hover(event.target.closest ?
+                event.target.closest('div.annotation_body') : null);
+        });
+        document.documentElement.addEventListener('mouseleave', function () {
+            hover(null);
+        });
     }
 
-    $('div.annotation_body').hover(
-        function () {
-            show_annotation($(this), true);
-        },
-        function () {
-            show_annotation($(this), false);
-        }
-    );
-});
+    if (document.readyState == 'loading') {
+        document.addEventListener('DOMContentLoaded', init);
+    } else {
+        init();
+    }
+})();
 """
 
 
@@ -218,7 +337,111 @@ files_ext_map = {
 }
 
 
+"""
+Process-wide index of the file name patterns of the lexers, built on first
+use. See :func:`_lexers_for_filename`.
+"""
+lexers_patterns = {}
+
+
+"""
+File name patterns that match by extension only, like ``*.py``.
+"""
+ext_pattern_re = re.compile(r'^\*\.[^*?\[\].]+$')
+
+
+"""
+Process-wide in-memory cache for highlighted code, used by default by all
+processors. See :meth:`Processor._highlight`.
+"""
+shared_highlight_cache = HighlightCache()
+
+
+"""
+Process-wide memo of the styles required by each Pygments style. See
+:meth:`Processor._get_styles`.
+"""
+styles_memo = {}
+
+
+"""
+Placeholder for the prefix in highlighted code. Highlighted code is cached
+with this placeholder, which can't appear in escaped code, and the actual
+prefix is substituted afterwards.
+"""
+prefix_placeholder = '<codeco-prefix>'
+
+
+def _profiled(method):
+    """
+    Decorator for the processor methods that accept a ``stats`` argument, a
+    :class:`codeco.stats.StageStats` instance to measure the stages of the
+    call with. See :meth:`Processor._profiling`.
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._profiling(kwargs.pop('stats', None)):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _lexers_for_filename(codefn):
+    """
+    Find the lexers classes with a pattern, primary or alias, that matches the
+    base name of a file, as ``pygments.lexers.guess_lexer_for_filename``
+    does.
+
+    Patterns like ``*.py`` are looked up by extension, so only the few other
+    patterns, like ``CMakeLists.txt`` or ``Makefile.*``, are matched against
+    the name.
+
+    :param str codefn: Path to the file.
+    :rtype: set
+    """
+    if 'others' not in lexers_patterns:
+        from pygments.lexers import _iter_lexerclasses
+
+        by_ext = {}
+        others = []
+        for cls in _iter_lexerclasses():
+            for pattern in list(cls.filenames) + list(cls.alias_filenames):
+                if ext_pattern_re.match(pattern):
+                    by_ext.setdefault(pattern[1:], set()).add(cls)
+                else:
+                    others.append((pattern, cls))
+        lexers_patterns['ext'] = by_ext
+        lexers_patterns['others'] = others
+
+    name = basename(codefn)
+    candidates = set()
+    if '.' in name:
+        candidates.update(lexers_patterns['ext'].get(
+            '.' + name.rsplit('.', 1)[1], ()
+        ))
+    for pattern, cls in lexers_patterns['others']:
+        if fnmatchcase(name, pattern):
+            candidates.add(cls)
+    return candidates
+
+
 class Processor(object):
+    """
+    Code annotations processor.
+
+    :param cache: Optional :class:`codeco.cache.RenderCache` used to store
+     rendered annotations. If given, annotations bodies whose content, format
+     and renderer options didn't change are not rendered again.
+    :param highlight_cache: :class:`codeco.cache.HighlightCache` used to store
+     highlighted code. By default, a process-wide in-memory cache is used. If
+     ``None`` is given, highlighted code is not cached.
+    :param bool single_pass: If ``True``, all the reStructuredText annotations
+     of a block are published in a single pass when possible. See
+     :meth:`codeco.renderers.RestRenderer.render_many`.
+
+    Renderers sessions are kept for the lifetime of the processor, one per
+    format, renderer options and thread.
+    """
 
     """
     Regular expression used to find annotations.
@@ -231,15 +454,128 @@ class Processor(object):
         r'^(?P<line>[0-9]+)(\[(?P<beg>[0-9]+),(?P<end>[0-9]+)\])?$'
     args_re = re.compile(args_regex)
 
-    def _parse_args(self, args, num):
+    """
+    Regular expressions used to split highlighted lines into tags and text,
+    and text into characters.
+    """
+    tags_re = re.compile(r'(<[^>]*>)')
+    chars_re = re.compile(r'&[^;<]*;|[^&]')
+
+    """
+    Regular expression used to split the table of highlighted code into the
+    line numbers and the code.
+    """
+    table_re = re.compile(
+        r'^(?P<open>.*?<table[^>]*>)'
+        r'(?P<linenos_open><tr>.*?<pre>)(?P<linenos>.*?)'
+        r'(?P<code_open></pre>.*?<pre>)(?P<code>.*?)'
+        r'(?P<row_close></pre>.*?</tr>)'
+        r'(?P<close></table>.*)$',
+        re.DOTALL
+    )
+
+    def __init__(
+            self, cache=None, highlight_cache=shared_highlight_cache,
+            single_pass=False):
+        self.cache = cache
+        self.highlight_cache = highlight_cache
+        self.single_pass = single_pass
+        self._local = local()
+
+    @contextmanager
+    def _profiling(self, stats):
+        """
+        Measure the stages run by this thread inside the context with given
+        stats, as the ``total`` stage. Nested contexts without stats, or with
+        the same ones, keep measuring with the stats of the outer context.
+
+        :param stats: :class:`codeco.stats.StageStats` instance, or ``None``.
+        """
+
+        previous = getattr(self._local, 'stats', None)
+        if stats is None or stats is previous:
+            yield
+            return
+
+        self._local.stats = stats
+        try:
+            with stats.stage('total'):
+                yield
+        finally:
+            self._local.stats = previous
+
+    @contextmanager
+    def _capturing_warnings(self):
+        """
+        Collect the warnings of the parsing run by this thread inside the
+        context, instead of writing them to standard error.
+
+        :rtype: list
+        :return: The list the warnings are appended to, as strings.
+        """
+
+        previous = getattr(self._local, 'warnings', None)
+        captured = self._local.warnings = []
+        try:
+            yield captured
+        finally:
+            self._local.warnings = previous
+
+    def _warn(self, message):
+        """
+        Report a warning to standard error, that documents may be written
+        to standard output, or to the list of the capturing context. See
+        :meth:`Processor._capturing_warnings`.
+
+        :param str message: The warning.
+        """
+
+        captured = getattr(self._local, 'warnings', None)
+        if captured is None:
+            print(message, file=sys.stderr)
+        else:
+            captured.append(message)
+
+    def _stage(self, name):
+        """
+        Get a context manager that measures a stage, if stats are being
+        collected in this thread. See :mod:`codeco.stats`.
+
+        :param str name: Name of the stage. See ``codeco.stats.stages``.
         """
-        Parse a string with line arguments to a list of dictionaries. Returns
-        a list of dictionaries of the type:
+
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            return nullcontext()
+        return stats.stage(name)
+
+    def _iter_stage(self, name, iterable):
+        """
+        Measure each step of an iterable as a stage.
+
+        :param str name: Name of the stage.
+        :param iterable: Iterable to measure.
+        """
+
+        iterator = iter(iterable)
+        while True:
+            with self._stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def _parse_args(self, args, num, warn=True):
+        """
+        Parse a string with line arguments to a list of
+        :class:`codeco.model.Target`. For example, ``1 10[0,20] 20[5,10]``
+        gives:
         ```
         [
-            {'line': '1', 'end': None, 'beg': None},
-            {'line': '10', 'end': '20', 'beg': '0'},
-            {'line': '20', 'end': '10', 'beg': '5'},
+            Target(1, None, None),
+            Target(10, 0, 20),
+            Target(20, 5, 10),
         ]
         ```
 
@@ -247,13 +583,17 @@ class Processor(object):
          ``1 10[0,20] 20[5,10]``.
         :param str num: Line number, useful for warning messages when the
          parsing fails.
+        :param bool warn: Report a warning for tokens that can't be parsed.
+         See :meth:`Processor._warn`.
         """
         parsed = []
         for token in args.strip().split():
 
             m = Processor.args_re.match(token)
             if not m:
-                print(
+                if not warn:
+                    continue
+                self._warn(
                     '** WARNING: Unable to parse token "{}" '
                     'in line #{}.'.format(
                         token, num
@@ -262,64 +602,142 @@ class Processor(object):
                 continue
 
             # Map datatypes
-            mapped = {
-                k: (v if v is None else int(v))
-                for k, v in m.groupdict().items()
-            }
-            parsed.append(mapped)
+            beg, end = m.group('beg'), m.group('end')
+            parsed.append(Target(
+                int(m.group('line')),
+                None if beg is None else int(beg),
+                None if end is None else int(end),
+            ))
 
         return parsed
 
-    def _parse_annotations(self, annotations, prefix):
+    def iter_annotations(self, lines, prefix):
         """
-        Parse annotations from a string.
+        Parse annotations from an iterable of lines.
 
-        This method allows to split a large string containing annotations and
-        returns a list of tuples with (dictionary, annotation).
+        This generator yields a tuple (:class:`codeco.model.Annotation`,
+        body) for each annotation as soon as it is complete, so annotations
+        can be read from a file handle and rendered one at a time without
+        loading the whole file in memory:
 
-        :param str annotations: String with annotations.
+        ::
+
+            with open('annotations.md', 'r') as af:
+                for meta, body in proc.iter_annotations(af, 'prefix'):
+                    ...
+
+        :param lines: Iterable of lines, with or without line terminators.
         :param str prefix: Prefix to be used for this annotated code.
         """
 
         current = None
         buff = []
-        parsed_anns = []
+        index = 0
 
-        for num, line in enumerate(annotations.splitlines(), 1):
+        for num, line in enumerate(lines, 1):
+            line = line.rstrip('\r\n')
             m = Processor.ann_re.match(line)
             if not m:
                 buff.append(line)
                 continue
 
             if current is not None:
-                parsed_anns.append(
-                    (current, '\n'.join(buff))
-                )
+                yield (current, '\n'.join(buff))
 
-            current = {
-                'args' : None,
-                'prefix' : prefix,
-                'hide' : False,
-            }
+            current = Annotation(index, prefix=prefix)
+            index += 1
             groups = m.groupdict()
 
             args = groups['args']
             if args is not None:
-                current['args'] = self._parse_args(args, num)
+                current.targets = self._parse_args(args, num)
 
             hidden = groups['hidden']
             if hidden is not None:
-                current['hide'] = True
+                current.hide = True
 
             # Reset buffer
             buff = []
 
         if buff:
-            parsed_anns.append(
-                (current, '\n'.join(buff))
+            yield (current, '\n'.join(buff))
+
+    def _iter_headers(self, lines, prefix):
+        """
+        Parse only the headers of the annotations in an iterable of lines,
+        without warnings. See :meth:`Processor.iter_annotations`.
+
+        :param lines: Iterable of lines, with or without line terminators.
+        :param str prefix: Prefix to be used for this annotated code.
+        """
+
+        current = None
+        followed = False
+        index = 0
+
+        for num, line in enumerate(lines, 1):
+            m = Processor.ann_re.match(line.rstrip('\r\n'))
+            if not m:
+                followed = True
+                continue
+
+            if current is not None:
+                yield current
+
+            groups = m.groupdict()
+            args = groups['args']
+            current = Annotation(
+                index,
+                targets=(
+                    None if args is None
+                    else self._parse_args(args, num, warn=False)
+                ),
+                prefix=prefix,
+                hide=groups['hidden'] is not None,
             )
+            index += 1
+            followed = False
+
+        # Like iter_annotations(), drop a last header without any line after
+        if current is not None and followed:
+            yield current
+
+    def _parse_annotations(self, annotations, prefix):
+        """
+        Parse annotations from a string.
+
+        This method allows to split a large string containing annotations and
+        returns a list of tuples with (:class:`codeco.model.Annotation`,
+        body). See
+        :meth:`Processor.iter_annotations`.
+
+        :param str annotations: String with annotations.
+        :param str prefix: Prefix to be used for this annotated code.
+        """
 
-        return parsed_anns
+        # Split lines as files opened in text mode do, see write_document()
+        return list(self.iter_annotations(
+            StringIO(annotations, newline=None), prefix
+        ))
+
+    def _get_renderer(self, ann_format, renderer_opts):
+        """
+        Get the renderer session for given format and options.
+
+        :param str ann_format: Format of the annotations.
+        :param dict renderer_opts: Options to be passed to the renderer.
+        """
+
+        renderers = getattr(self._local, 'renderers', None)
+        if renderers is None:
+            renderers = self._local.renderers = {}
+
+        key = (ann_format, dumps(renderer_opts, sort_keys=True, default=repr))
+        renderer = renderers.get(key, None)
+        if renderer is None:
+            renderer = get_renderer(ann_format)(**renderer_opts)
+            renderers[key] = renderer
+        return renderer
 
     def _render_markdown(self, body, **kwargs):
         """
@@ -328,8 +746,7 @@ class Processor(object):
         :param str body: String with Markdown.
         """
 
-        kwargs['output_format'] = 'html4'  # Same as Pygments
-        return markdown(body, **kwargs)
+        return self._get_renderer('markdown', kwargs).render(body)
 
     def _render_rest(self, body, **kwargs):
         """
@@ -338,96 +755,653 @@ class Processor(object):
         :param str body: String with reStructuredText.
         """
 
-        overrides = {
-            'doctitle_xform': False,
-            'initial_header_level': 1
-        }
-        overrides.update(kwargs)
-        parts = publish_parts(
-            source=body,
-            writer_name='html',
-            settings_overrides=overrides
-        )
-        return parts['body']
+        return self._get_renderer('rest', kwargs).render(body)
+
+    def _wrap(self, html, hide):
+        """
+        Wrap a rendered annotation into a ``div`` and mark it with the classes
+        used for interaction. See :func:`codeco.wrapper.wrap`.
+
+        :param str html: Rendered annotation.
+        :param bool hide: If the annotation is hidden.
+        """
+
+        classes = ['annotation_body']
+        if hide:
+            classes.append('annotation_hidden')
+        with self._stage('wrap'):
+            return wrap(html, classes, 'annotation_title')
+
+    def iter_render(self, parsed_anns, ann_format='rest', renderer_opts=None):
+        """
+        Render to the specified format the given parsed annotations, one at a
+        time.
+
+        Annotations are consumed lazily, so this generator can be chained with
+        :meth:`Processor.iter_annotations` to render annotations files of any
+        size with bounded memory.
+
+        :param parsed_anns: Iterable of parsed annotations in the format given
+         by :meth:`Processor.iter_annotations`.
+        :param str ann_format: Format to render the annotations. Supported
+         formats are the ones registered in :mod:`codeco.renderers`.
+        :param dict renderer_opts: Options to be passed to the renderer.
+        """
+
+        if renderer_opts is None:
+            renderer_opts = {}
+
+        # Get renderer
+        renderer = self._get_renderer(ann_format, renderer_opts)
+
+        for meta, ann_body in parsed_anns:
+
+            # Get cached annotation
+            key = None
+            body = None
+            if self.cache is not None:
+                key = self.cache.key(
+                    ann_body, ann_format, renderer_opts, meta.hide
+                )
+                body = self.cache.get(key)
+
+            # Render missing annotation
+            if body is None:
+                with self._stage('render'):
+                    html = renderer.render(ann_body)
+                body = self._wrap(html.strip(), meta.hide)
+                if key is not None:
+                    self.cache.put(key, body)
+
+            yield annotation_tpl.format(anchor=meta.anchor, body=body)
 
     def _render(self, parsed_anns, ann_format, renderer_opts):
         """
         Render to the specified format the given parsed annotations.
 
+        Annotations are rendered one by one with :meth:`Processor.iter_render`,
+        unless the processor is in single pass mode and the renderer supports
+        it.
+
         :param list parsed_anns: A list of parsed annotations in the format
          given by :meth:`Processor._parse_annotations`.
         :param str ann_format: Format to render the annotations. Supported
-         formats are 'rest' and 'markdown'.
+         formats are the ones registered in :mod:`codeco.renderers`.
         :param dict renderer_opts: Options to be passed to the renderer.
         """
 
         # Get renderer
-        renderers = {
-            'markdown' : self._render_markdown,
-            'rest'     : self._render_rest,
-        }
-        renderer = renderers[ann_format]
-
-        def add_class(elem, html_class):
-            """
-            Helper to safely add a class to a Tag object.
-            """
-            if not isinstance(elem, Tag):
-                return False
-            if 'class' in elem.attrs:
-                elem.attrs['class'] += [html_class]
-            else:
-                elem.attrs['class'] = [html_class]
-            return True
+        renderer = self._get_renderer(ann_format, renderer_opts)
+        if not self.single_pass or not hasattr(renderer, 'render_many'):
+            return list(
+                self.iter_render(parsed_anns, ann_format, renderer_opts)
+            )
 
-        # Render annotations
-        rendered_anns = []
-        for meta, ann_body in parsed_anns:
+        # Get cached annotations
+        keys = [None] * len(parsed_anns)
+        bodies = [None] * len(parsed_anns)
+        if self.cache is not None:
+            for index, (meta, ann_body) in enumerate(parsed_anns):
+                keys[index] = self.cache.key(
+                    ann_body, ann_format, renderer_opts, meta.hide
+                )
+                bodies[index] = self.cache.get(keys[index])
 
-            html = renderer(ann_body, **renderer_opts).strip()
-
-            # Wrap rendered annotation
-            bs = BeautifulSoup(html, 'html5lib')
-            elements = bs.body.contents
-            if len(elements) == 1 and elements[0].name == 'div':
-                # Already wrapped
-                wrapper = elements[0]
-            else:
-                # Wrap into a div
-                wrapper = bs.new_tag('div')
-                for elem in elements:
-                    wrapper.append(elem)
-            add_class(wrapper, 'annotation_body')
-            if meta['hide']:
-                add_class(wrapper, 'annotation_hidden')
-
-            for child in wrapper.children:
-                if add_class(child, 'annotation_title'):
-                    break
-            body = str(wrapper)
+        # Render missing annotations
+        missing = [
+            index for index, body in enumerate(bodies) if body is None
+        ]
+        with self._stage('render'):
+            htmls = renderer.render_many(
+                [parsed_anns[index][1] for index in missing]
+            )
+            if htmls is None:
+                htmls = [
+                    renderer.render(parsed_anns[index][1])
+                    for index in missing
+                ]
+
+        for index, html in zip(missing, htmls):
+            meta, ann_body = parsed_anns[index]
+            bodies[index] = self._wrap(html.strip(), meta.hide)
+            if keys[index] is not None:
+                self.cache.put(keys[index], bodies[index])
 
+        # Render annotations
+        rendered_anns = []
+        for (meta, ann_body), body in zip(parsed_anns, bodies):
             rendered_anns.append(
-                annotation_tpl.format(json=dumps(meta), body=body)
+                annotation_tpl.format(anchor=meta.anchor, body=body)
             )
 
         return rendered_anns
 
-    def _generate_prefix(self, length=10):
+    def _generate_prefix(self, length=10, seed=None):
         """
-        Generates a random hash to be used as prefix.
+        Generates a hash to be used as prefix.
 
         :param int length: Size to cut the hash.
+        :param seed: Optional seed for the hash, a string or an iterable of
+         strings hashed as if they were joined. If ``None`` is given, a random
+         prefix is generated.
         """
 
+        if seed is None:
+            seed = str(random())
+        if isinstance(seed, str):
+            seed = [seed]
+
         the_hash = sha1()
-        the_hash.update(str(random()))
+        for chunk in seed:
+            the_hash.update(chunk.encode('utf-8'))
         return the_hash.hexdigest()[:length]
 
+    def _resolve_prefix(self, prefix, prefix_mode, codefn, content):
+        """
+        Get the prefix of a block, generating it if required.
+
+        :param str prefix: Prefix given by the user, or ``None``.
+        :param str prefix_mode: How to generate the prefix. See
+         :meth:`Processor.process`.
+        :param str codefn: Optional "CodeFileName".
+        :param content: Callable that returns the content of the block, an
+         iterable of strings, used only if the prefix is derived from it.
+        """
+
+        if prefix is not None:
+            return prefix
+
+        seed = None
+        if prefix_mode == 'path' and codefn is not None:
+            seed = codefn
+        elif prefix_mode in ('content', 'path'):
+            seed = content()
+        elif prefix_mode != 'random':
+            raise ValueError(
+                'Unknown prefix mode "{}".'.format(prefix_mode)
+            )
+        return self._generate_prefix(seed=seed)
+
+    def _get_lexer(self, code, codefn=None, lexer=None):
+        """
+        Get the lexer for given code.
+
+        Guessing a lexer for a file name requires to match the name against
+        the patterns of every lexer, and to analyse the code with each
+        candidate. The patterns are indexed once per process (see
+        :func:`_lexers_for_filename`) and, if a single lexer matches the name,
+        it is used without analysing the code, as Pygments does. Otherwise,
+        the lexer is guessed every time, so it doesn't depend on the code
+        processed before.
+
+        :param str code: Code to be highlighted.
+        :param str codefn: Optional "CodeFileName" used to guess the lexer.
+        :param lexer: Optional lexer name or ``pygments.lexer.Lexer`` instance.
+         If given, no guessing is performed.
+        """
+        from pygments import lexers
+        from pygments.lexer import Lexer
+
+        # Explicit lexer
+        if lexer is not None:
+            if isinstance(lexer, Lexer):
+                return lexer
+            return lexers.get_lexer_by_name(lexer)
+
+        # Guess programming language
+        if codefn is None:
+            return lexers.guess_lexer(code)
+
+        candidates = _lexers_for_filename(codefn)
+        if len(candidates) == 1:
+            return candidates.pop()()
+        return lexers.guess_lexer_for_filename(codefn, code)
+
+    def _highlight(self, code, lexer, options, prefix):
+        """
+        Highlight given code.
+
+        The output of Pygments only depends on the prefix through the line
+        spans identifiers. Code is highlighted, and cached, using a placeholder
+        prefix that is then replaced with the given prefix.
+
+        :param str code: Code to be highlighted.
+        :param lexer: ``pygments.lexer.Lexer`` instance.
+        :param dict options: Options for the ``HtmlFormatter``. The
+         ``linespans`` option is set automatically.
+        :param str prefix: Prefix to identify the block.
+        """
+
+        options = dict(options, linespans=prefix_placeholder + 'line')
+
+        key = None
+        highlighted = None
+        if self.highlight_cache is not None:
+            key = self.highlight_cache.key(code, lexer, options)
+            highlighted = self.highlight_cache.get(key)
+
+        if highlighted is None:
+            from pygments import highlight
+            from pygments.formatters import HtmlFormatter
+
+            formatter = HtmlFormatter(**options)
+            highlighted = highlight(code, lexer, formatter)
+            if key is not None:
+                self.highlight_cache.put(key, highlighted)
+
+        return highlighted.replace(prefix_placeholder, prefix)
+
+    def _get_ranges(self, metas):
+        """
+        Get the characters ranges targeted by annotations, by line.
+
+        :param metas: Iterable of :class:`codeco.model.Annotation`, as given
+         by :meth:`Processor.iter_annotations`.
+        :rtype: dict
+        :return: A dictionary mapping line numbers to sets of tuples
+         ``(beg, end)``.
+        """
+
+        ranges = {}
+        for meta in metas:
+            if not meta or not meta.targets:
+                continue
+            for target in meta.targets:
+                if target.beg is None or target.end is None:
+                    continue
+                ranges.setdefault(target.line, set()).add(
+                    (target.beg, target.end)
+                )
+        return ranges
+
+    def _mark_line(self, html, num, ranges, prefix):
+        """
+        Mark the characters ranges of a highlighted line.
+
+        Each run of characters inside one or more ranges is wrapped, inside the
+        Pygments token spans, with a ``span`` with the ``hll-char`` class plus
+        a ``{prefix}chars-{line}-{beg}-{end}`` class for each range, so the
+        interaction script only has to toggle a class. Ranges are 0-based and
+        inclusive, and count characters of the code, not of the HTML.
+
+        :param str html: Content of the line span.
+        :param int num: Number of the line.
+        :param set ranges: Set of tuples ``(beg, end)``.
+        :param str prefix: Prefix to identify the block.
+        """
+
+        ranges = [
+            (beg, end, '{}chars-{}-{}-{}'.format(prefix, num, beg, end))
+            for beg, end in sorted(ranges)
+        ]
+
+        marked = []
+        pos = 0
+        for part in Processor.tags_re.split(html):
+            if not part or part.startswith('<'):
+                marked.append(part)
+                continue
+
+            run = []
+            run_classes = ()
+            for char in Processor.chars_re.findall(part):
+                classes = tuple(
+                    cls for beg, end, cls in ranges if beg <= pos <= end
+                )
+                if classes != run_classes and run:
+                    marked.append(self._mark_run(run, run_classes))
+                    run = []
+                run.append(char)
+                run_classes = classes
+                pos += 1
+
+            if run:
+                marked.append(self._mark_run(run, run_classes))
+
+        return ''.join(marked)
+
+    def _mark_run(self, run, classes):
+        """
+        Wrap a run of characters with the given ranges classes, if any.
+        """
+
+        text = ''.join(run)
+        if not classes:
+            return text
+        return '<span class="hll-char {}">{}</span>'.format(
+            ' '.join(classes), text
+        )
+
+    def _mark_ranges(self, highlighted, prefix, ranges):
+        """
+        Mark the characters ranges in highlighted code.
+
+        :param str highlighted: Code highlighted with line spans.
+        :param str prefix: Prefix to identify the block.
+        :param dict ranges: Ranges by line, as given by
+         :meth:`Processor._get_ranges`.
+        """
+
+        if not ranges:
+            return highlighted
+
+        line_re = re.compile(
+            '(<span id="{}line-([0-9]+)">)([^\n]*)(\n</span>)'.format(
+                re.escape(prefix)
+            )
+        )
+
+        def mark(m):
+            num = int(m.group(2))
+            if num not in ranges:
+                return m.group(0)
+            return ''.join([
+                m.group(1),
+                self._mark_line(m.group(3), num, ranges[num], prefix),
+                m.group(4),
+            ])
+
+        return line_re.sub(mark, highlighted)
+
+    def _link_lines(self, highlighted, prefix, index):
+        """
+        Add links from the highlighted lines to the annotations that target
+        them.
+
+        A link with the ``annotation-link`` class to the element of each
+        annotation is added at the end of the content of the line span, so
+        lines, characters ranges and chunks are not affected.
+
+        :param str highlighted: Code highlighted with line spans.
+        :param str prefix: Prefix to identify the block.
+        :param index: :class:`codeco.model.AnnotationIndex` of the
+         annotations of the block.
+        """
+
+        if not index:
+            return highlighted
+
+        line_re = re.compile(
+            '(<span id="{}line-([0-9]+)">[^\n]*)(\n</span>)'.format(
+                re.escape(prefix)
+            )
+        )
+
+        def link(m):
+            indexes = index.annotations_at(int(m.group(2)))
+            if not indexes:
+                return m.group(0)
+            return ''.join([m.group(1)] + [
+                '<a class="annotation-link" '
+                'href="#{0}annotation-{1}"></a>'.format(prefix, ann)
+                for ann in indexes
+            ] + [m.group(3)])
+
+        return line_re.sub(link, highlighted)
+
+    def _chunk_code(self, highlighted, prefix, chunk_lines):
+        """
+        Split highlighted code into chunks of lines that are materialized by
+        the interaction script only when needed.
+
+        Each chunk is a ``tbody`` of the highlighted code table. The first
+        chunk is rendered as usual. The others contain an inert ``template``
+        with the code and a placeholder with the same height, whose lines keep
+        the ``{prefix}line-N`` identifiers, so anchors and annotations find
+        them. Chunks are materialized when they are about to scroll into view,
+        or when targeted by an annotation or the location hash.
+
+        :param str highlighted: Code highlighted as a table with line spans.
+        :param str prefix: Prefix to identify the block.
+        :param int chunk_lines: Number of lines per chunk.
+        :rtype: str
+        :return: The chunked code, or the highlighted code if it has a single
+         chunk or its structure isn't the expected one.
+        """
+
+        m = Processor.table_re.match(highlighted)
+        if m is None:
+            return highlighted
+
+        linenos = m.group('linenos').split('\n')
+        code = m.group('code')
+        lines = re.findall(
+            '<span id="{}line-[0-9]+">[^\n]*\n</span>'.format(
+                re.escape(prefix)
+            ),
+            code
+        )
+        if not lines or len(lines) != len(linenos):
+            return highlighted
+
+        code_head = code[:code.index(lines[0])]
+        if code_head + ''.join(lines) != code or len(lines) <= chunk_lines:
+            return highlighted
+
+        chunks = [m.group('open')]
+        for index in range(0, len(lines), chunk_lines):
+            first = index + 1
+            last = min(index + chunk_lines, len(lines))
+
+            row = ''.join([
+                m.group('linenos_open'),
+                '\n'.join(linenos[index:last]),
+                m.group('code_open'),
+                code_head,
+                ''.join(lines[index:last]),
+                m.group('row_close'),
+            ])
+            if not index:
+                chunks.append(
+                    chunk_tpl.format(first=first, last=last, row=row)
+                )
+                continue
+
+            # Leading spaces avoid the first newline of pre to be ignored
+            placeholder = ''.join([
+                m.group('linenos_open'),
+                '\n'.join([' '] * (last - index)),
+                m.group('code_open'),
+                ''.join([
+                    '<span id="{}line-{}"> \n</span>'.format(prefix, num)
+                    for num in range(first, last + 1)
+                ]),
+                m.group('row_close'),
+            ])
+            chunks.append(lazy_chunk_tpl.format(
+                first=first, last=last, placeholder=placeholder, row=row
+            ))
+
+        chunks.append(m.group('close'))
+        return ''.join(chunks)
+
+    def _highlight_block(
+            self, code, lexer, codestyle, prefix,
+            metas=(), chunk_lines=None):
+        """
+        Highlight the code of a block and get the styles it requires.
+
+        The characters ranges targeted by the annotations are marked (see
+        :meth:`Processor._mark_ranges`), the lines are linked to their
+        annotations (see :meth:`Processor._link_lines`) and the data block
+        of the annotations is added (see :meth:`Processor._data_block`).
+
+        :param str code: Code to be highlighted.
+        :param lexer: ``pygments.lexer.Lexer`` instance.
+        :param str codestyle: Pygments style to be used for syntax highlight.
+        :param str prefix: Prefix to identify the block.
+        :param list metas: List of :class:`codeco.model.Annotation` of the
+         block.
+        :param int chunk_lines: Optional number of lines per chunk. See
+         :meth:`Processor._chunk_code`.
+        :rtype: tuple
+        :return: A tuple ``(styles, highlighted)`` with the list of styles and
+         the highlighted code.
+        """
+
+        options = {
+            'style'    : codestyle,
+            'linenos'  : 'table',
+        }
+        with self._stage('highlight'):
+            highlighted = self._highlight(code, lexer, options, prefix)
+
+        with self._stage('mark'):
+            highlighted = self._mark_ranges(
+                highlighted, prefix, self._get_ranges(metas)
+            )
+            highlighted = self._link_lines(
+                highlighted, prefix, AnnotationIndex(metas)
+            )
+
+        if chunk_lines:
+            with self._stage('chunk'):
+                highlighted = self._chunk_code(
+                    highlighted, prefix, chunk_lines
+                )
+
+        highlighted += self._data_block(prefix, metas)
+        return self._get_styles(codestyle), highlighted
+
+    def _data_block(self, prefix, metas):
+        """
+        Get the data block of the annotations of a block, read by the
+        interaction script.
+
+        The block is a JSON ``script`` element with the prefix and the
+        annotations in order, see :meth:`codeco.model.Annotation.as_data`,
+        so the script doesn't have to parse the annotations elements.
+
+        :param str prefix: Prefix to identify the block.
+        :param list metas: List of :class:`codeco.model.Annotation` of the
+         block.
+        """
+
+        data = dumps({
+            'prefix' : prefix,
+            'annotations' : [
+                meta.as_data() for meta in metas if meta is not None
+            ],
+        }, separators=(',', ':'))
+
+        # Avoid closing the script element
+        return data_tpl.format(json=data.replace('</', '<\\/'))
+
+    def _get_styles(self, codestyle):
+        """
+        Get the styles required by highlighted code, memoized by style.
+
+        :param str codestyle: Pygments style to be used for syntax highlight.
+        :rtype: list
+        :return: A new list with the Pygments style definitions and the extra
+         styles.
+        """
+
+        styles = styles_memo.get(codestyle, None)
+        if styles is None:
+            from pygments.formatters import HtmlFormatter
+
+            formatter = HtmlFormatter(style=codestyle)
+            styles = styles_memo[codestyle] = [
+                formatter.get_style_defs('table.highlighttable'),
+                extra_styles
+            ]
+        return list(styles)
+
+    def _write_asset(self, directory, name, content):
+        """
+        Write an asset file named by the hash of its content, unless it
+        already exists.
+
+        :param str directory: Path to the assets directory. It is created if
+         it doesn't exist.
+        :param str name: Name of the file, with a ``{hash}`` field.
+        :param str content: Content of the file.
+        :rtype: str
+        :return: The name of the file.
+        """
+
+        digest = sha1(content.encode('utf-8')).hexdigest()[:8]
+        name = name.format(hash=digest)
+        path = join(directory, name)
+
+        # Checked every time, long running processes outlive output trees
+        if not exists(path):
+            if not isdir(directory):
+                try:
+                    makedirs(directory)
+                except OSError:
+                    pass
+
+            # Write atomically, other processes might be writing it too
+            handle, tmp = mkstemp(dir=directory, suffix='.tmp')
+            close(handle)
+            with open(tmp, 'w') as fd:
+                fd.write(content)
+            chmod(tmp, 0o644)
+            rename(tmp, path)
+
+        return name
+
+    def _get_assets(self, styles, codestyle, assets_dir, assets_url, tpl):
+        """
+        Get the template values for the styles and the script.
+
+        :param list styles: Styles, as returned by :meth:`Processor.process`.
+        :param str codestyle: Pygments style of the styles.
+        :param str assets_dir: Path to the directory to write the styles and
+         the script as external files, named by their content hash. If
+         ``None`` is given, they are inlined.
+        :param str assets_url: URL of the assets directory, as referenced from
+         the document. If ``None`` is given, ``assets_dir`` is used.
+        :param str tpl: Template of the document.
+        :rtype: dict
+        :return: A dictionary with the ``styles``, ``script`` and ``assets``
+         template values.
+        """
+
+        if assets_dir is None:
+            return {
+                'styles' : '\n'.join(styles),
+                'script' : interact_script,
+                'assets' : '',
+            }
+
+        if 'assets' not in compile_template(tpl).fields:
+            raise ValueError(
+                'The template must have an {assets} field to use external '
+                'assets.'
+            )
+
+        if assets_url is None:
+            assets_url = assets_dir
+        assets_url = assets_url.replace(sep, '/')
+        if assets_url and not assets_url.endswith('/'):
+            assets_url += '/'
+
+        stylesheet = self._write_asset(
+            assets_dir, 'codeco-{}.{{hash}}.css'.format(codestyle),
+            '\n'.join(styles)
+        )
+        script = self._write_asset(
+            assets_dir, 'codeco.{hash}.js', interact_script
+        )
+        return {
+            'styles' : '',
+            'script' : '',
+            'assets' : assets_tpl.format(
+                stylesheet=assets_url + stylesheet,
+                script=assets_url + script,
+            ),
+        }
+
+    @_profiled
     def process(
             self, code, annotations,
             codefn=None, ann_format='rest',
             prefix=None, codestyle='monokai',
-            renderer_opts=None):
+            renderer_opts=None, lexer=None, prefix_mode='random',
+            chunk_lines=None):
         """
         Main processing function.
 
@@ -436,36 +1410,57 @@ class Processor(object):
         :param str codefn: Optional "CodeFileName" that can be used to better
          detect the programming language in code.
         :param str ann_format: Format of the annotations. Supported formats are
-         ``'rest'`` and ``'markdown'``.
+         ``'rest'`` and ``'markdown'``, plus ``'commonmark'`` (requires
+         markdown-it-py) and ``'mistune'`` (requires mistune) as faster
+         Markdown engines. Other formats can be added with
+         :func:`codeco.renderers.register_renderer`.
         :param str prefix: Prefix to be used to identify this block
          (code - annotations pair). The prefix allows multiples blocks to be
          included in the same web page without interfering with each other. If
-         ``None`` is given, a random prefix will be generated.
+         ``None`` is given, a prefix will be generated as specified by
+         ``prefix_mode``.
         :param str codestyle: Pygments style to be used for syntax highlight.
          See http://pygments.org/docs/styles/
         :param dict renderer_opts: Dictionary with keyword options to be passed
          to the renderer. For Markdown, this dictionary is passed to the
-         ``markdown.markdown`` function as ``**kwargs``. For reStructuredText
+         ``markdown.Markdown`` class as ``**kwargs``. For reStructuredText
          this dictionary is passed to the ``settings_overrides`` argument of
          the ``docutils.code.publish_parts`` function.
+        :param lexer: Optional Pygments lexer name (for example
+         ``'python'``) or ``pygments.lexer.Lexer`` instance to highlight the
+         code with. If ``None`` is given, the lexer is guessed from the code
+         and ``codefn``.
+        :param str prefix_mode: How to generate the prefix if none is given.
+         ``'random'`` generates a different prefix on each call.
+         ``'content'`` derives the prefix from the code and the annotations,
+         so identical inputs produce identical output. ``'path'`` derives the
+         prefix from ``codefn``, falling back to ``'content'`` if not given.
+        :param int chunk_lines: If given, code with more lines is split into
+         chunks of this number of lines, and all but the first are only
+         materialized by the browser when needed. See
+         :meth:`Processor._chunk_code`.
+        :param stats: Optional :class:`codeco.stats.StageStats` instance to
+         measure the time, number of calls and memory of each stage with.
         """
 
         if renderer_opts is None:
             renderer_opts = {}
-        if prefix is None:
-            prefix = self._generate_prefix()
+        with self._stage('prefix'):
+            prefix = self._resolve_prefix(
+                prefix, prefix_mode, codefn,
+                lambda: [code, '\0', annotations]
+            )
 
-        # Guess programming language
+        # Get lexer
         # Warning: might raise pygments.util.ClassNotFound
-        if codefn is None:
-            lexer = lexers.guess_lexer(code)
-        else:
-            lexer = lexers.guess_lexer_for_filename(codefn, code)
+        with self._stage('lexer'):
+            lexer = self._get_lexer(code, codefn=codefn, lexer=lexer)
 
         # Parse annotations
-        parsed_anns = self._parse_annotations(
-            annotations, prefix
-        )
+        with self._stage('parse'):
+            parsed_anns = self._parse_annotations(
+                annotations, prefix
+            )
 
         # Render annotations
         rendered_anns = self._render(
@@ -473,17 +1468,10 @@ class Processor(object):
         )
 
         # Highlight code
-        options = {
-            'style'    : codestyle,
-            'linenos'  : 'table',
-            'linespans': prefix + 'line',
-        }
-        formatter = formatters.HtmlFormatter(**options)
-        highlighted = highlight(code, lexer, formatter)
-        styles = [
-            formatter.get_style_defs('table.highlighttable'),
-            extra_styles
-        ]
+        styles, highlighted = self._highlight_block(
+            code, lexer, codestyle, prefix,
+            [meta for meta, body in parsed_anns], chunk_lines
+        )
 
         return {
             'styles'      : styles,
@@ -492,15 +1480,31 @@ class Processor(object):
             'code'        : highlighted,
         }
 
-    def process_files(self, codefn, annfn, **kwargs):
+    @staticmethod
+    def _get_format(annfn, ext_map=None):
+        """
+        Get the format of an annotations file from its extension.
+
+        :param str annfn: Path to the annotations file.
+        :param dict ext_map: Optional map from annotations file extension to
+         annotations format. If ``None`` is given, ``files_ext_map`` is used.
         """
-        Process and interpret given code file name and annotations file name.
+
+        if ext_map is None:
+            ext_map = files_ext_map
+        fn, ext = splitext(annfn)
+        return ext_map[ext]
+
+    @staticmethod
+    def read_files(codefn, annfn):
+        """
+        Read given code file name and annotations file name.
 
         :param str codefn: Path to the code file.
         :param str annfn: Path to the annotations file.
-        :param dict kwargs: Except for ``codefn`` (with is automatically set),
-         this method supports all the other arguments
-         :meth:`Processor.process`` supports.
+        :rtype: tuple
+        :return: A tuple ``(code, annotations)`` with the content of the
+         files.
         """
 
         # Warning: might raise IO exceptions
@@ -508,23 +1512,189 @@ class Processor(object):
             code = cf.read()
         with open(annfn, 'r') as af:
             annotations = af.read()
+        return code, annotations
+
+    @staticmethod
+    def document_options(annfn, out_file=None, ext_map=None, **kwargs):
+        """
+        Complete the arguments of :meth:`Processor.render_document` for a
+        document created from files, as :meth:`Processor.create_document`
+        does.
+
+        Unless otherwise specified, the prefix is derived from the content of
+        the files, the URL of the assets is the path to ``assets_dir``
+        relative to ``out_file`` and the format of the annotations is
+        determined from their file extension.
+
+        :param str annfn: Path to the annotations file.
+        :param str out_file: Optional path for the output file.
+        :param dict ext_map: Optional map from annotations file extension to
+         annotations format, used if no ``ann_format`` is given. If ``None``
+         is given, ``files_ext_map`` is used.
+        :param dict kwargs: Arguments of :meth:`Processor.render_document`.
+        :rtype: dict
+        :return: The completed arguments.
+        """
+
+        kwargs.setdefault('prefix_mode', 'content')
+        assets_dir = kwargs.get('assets_dir', None)
+        if assets_dir is not None and out_file and \
+                kwargs.get('assets_url', None) is None:
+            kwargs['assets_url'] = relpath(
+                abspath(assets_dir), dirname(abspath(out_file))
+            )
+        if 'ann_format' not in kwargs:
+            kwargs['ann_format'] = Processor._get_format(annfn, ext_map)
+        return kwargs
+
+    @_profiled
+    def process_files(self, codefn, annfn, ext_map=None, **kwargs):
+        """
+        Process and interpret given code file name and annotations file name.
+
+        :param str codefn: Path to the code file.
+        :param str annfn: Path to the annotations file.
+        :param dict ext_map: Optional map from annotations file extension to
+         annotations format, used if no ``ann_format`` is given. If ``None``
+         is given, ``files_ext_map`` is used.
+        :param dict kwargs: Except for ``codefn`` (with is automatically set),
+         this method supports all the other arguments
+         :meth:`Processor.process`` supports.
+        """
+
+        # Warning: might raise IO exceptions
+        with self._stage('read'):
+            code, annotations = self.read_files(codefn, annfn)
 
         # Determine type
         if 'ann_format' not in kwargs:
-            fn, ext = splitext(annfn)
-            kwargs['ann_format'] = files_ext_map[ext]
+            kwargs['ann_format'] = self._get_format(annfn, ext_map)
 
         return self.process(
             code, annotations,
             codefn=codefn, **kwargs
         )
 
+    @_profiled
+    def write_document(
+            self, codefn, annfn, out,
+            title='', tpl=None, ext_map=None, ann_format=None,
+            prefix=None, codestyle='monokai', renderer_opts=None,
+            lexer=None, prefix_mode='content', chunk_lines=None,
+            assets_dir=None, assets_url=None):
+        """
+        Write a document for given code file name and annotations file name
+        to a file object, streaming it as it is produced.
+
+        The template is compiled once (see :mod:`codeco.template`) and the
+        annotations are read, rendered and written one at a time, so the full
+        document is never kept in memory. The output is the same as the one of
+        :meth:`Processor.create_document`, except that reStructuredText
+        annotations are always published one by one.
+
+        :param str codefn: Path to the code file.
+        :param str annfn: Path to the annotations file.
+        :param out: File-like object with a ``write`` method.
+        :param str title: Title of the document.
+        :param str tpl: Python template string to be used a template for the
+         document. If ``None`` is given, the ``default_tpl`` will be used.
+        :param dict ext_map: Optional map from annotations file extension to
+         annotations format, used if no ``ann_format`` is given. If ``None``
+         is given, ``files_ext_map`` is used.
+        :param str ann_format: Format of the annotations. If ``None`` is
+         given, it is determined from the annotations file extension.
+        :param str assets_dir: Optional path to a directory to write the
+         styles and the script as external files, named by their content hash
+         (for example ``codeco-monokai.3f2a9c1b.css``), instead of inlining
+         them. The template must have an ``{assets}`` field.
+        :param str assets_url: URL of the assets directory, as referenced from
+         the document. If ``None`` is given, ``assets_dir`` is used.
+
+        See :meth:`Processor.process` for the other arguments. The prefix is
+        derived from the content of the files by default. If stats are given,
+        the ``write`` stage includes the parsing, rendering and wrapping of the
+        annotations, done while they are written.
+        """
+
+        if ann_format is None:
+            ann_format = self._get_format(annfn, ext_map)
+        if tpl is None:
+            tpl = default_tpl
+        compiled = compile_template(tpl)
+
+        # Warning: might raise IO exceptions
+        with self._stage('read'):
+            with open(codefn, 'r') as cf:
+                code = cf.read()
+
+        def content():
+            yield code
+            yield '\0'
+            with open(annfn, 'r') as af:
+                for chunk in iter(lambda: af.read(64 * 1024), ''):
+                    yield chunk
+
+        with self._stage('prefix'):
+            prefix = self._resolve_prefix(
+                prefix, prefix_mode, codefn, content
+            )
+
+        # Get lexer
+        # Warning: might raise pygments.util.ClassNotFound
+        with self._stage('lexer'):
+            lexer = self._get_lexer(code, codefn=codefn, lexer=lexer)
+
+        # Highlight code, marking the ranges and linking the lines found in
+        # the annotations headers
+        with self._stage('parse'):
+            with open(annfn, 'r') as af:
+                metas = list(self._iter_headers(af, prefix))
+        styles, highlighted = self._highlight_block(
+            code, lexer, codestyle, prefix, metas, chunk_lines
+        )
+
+        with open(annfn, 'r') as af:
+
+            # Parse and render annotations as they are written
+            def annotations():
+                parsed_anns = self._iter_stage(
+                    'parse', self.iter_annotations(af, prefix)
+                )
+                rendered_anns = self.iter_render(
+                    parsed_anns, ann_format, renderer_opts
+                )
+                for index, rendered in enumerate(rendered_anns):
+                    if index:
+                        yield '\n'
+                    yield rendered
+
+            values = {
+                'title'       : title,
+                'annotations' : annotations(),
+                'code'        : highlighted,
+            }
+            values.update(self._get_assets(
+                styles, codestyle, assets_dir, assets_url, tpl
+            ))
+
+            # Streamed values can only be used once
+            if compiled.fields.count('annotations') > 1:
+                values['annotations'] = ''.join(values['annotations'])
+
+            with self._stage('write'):
+                compiled.write(out, values)
+
+    @_profiled
     def create_document(
             self, codefn, annfn,
-            title='', tpl=None, out_file=None, **kwargs):
+            title='', tpl=None, out_file=None, stream=False,
+            assets_dir=None, assets_url=None, **kwargs):
         """
+        Create a document for given code file name and annotations file name.
 
-        The full content of the document is always returned.
+        The full content of the document is returned, unless streamed. Unless
+        otherwise specified, the prefix is derived from the content of the
+        files, so identical inputs produce identical documents.
 
         :param str codefn: Path to the code file.
         :param str annfn: Path to the annotations file.
@@ -534,25 +1704,96 @@ class Processor(object):
          ``None`` is given, the ``default_tpl`` will be used.
         :param str out_file: Optional path for the output file. If given, the
          file will be created or overriden with the content of the document.
+        :param bool stream: If ``True``, the document is streamed to
+         ``out_file``, that is required, with :meth:`Processor.write_document`
+         and ``None`` is returned. On failure, the incomplete file is
+         removed.
+        :param str assets_dir: Optional path to a directory to write the
+         styles and the script as external files. See
+         :meth:`Processor.write_document`.
+        :param str assets_url: URL of the assets directory, as referenced from
+         the document. If ``None`` is given, the path to ``assets_dir``
+         relative to ``out_file``, if given, is used.
         :param dict kwargs: Except for ``codefn`` (with is automatically set),
          this method supports all the other arguments
          :meth:`Processor.process`` supports.
         """
 
-        processed = self.process_files(codefn, annfn, **kwargs)
-
-        # Add title and join annotations
-        processed['title'] = title
-        processed['annotations'] = '\n'.join(processed['annotations'])
-        processed['styles'] = '\n'.join(processed['styles'])
-
         if tpl is None:
             tpl = default_tpl
-        document = tpl.format(**processed)
+        kwargs = self.document_options(
+            annfn, out_file=out_file,
+            assets_dir=assets_dir, assets_url=assets_url, **kwargs
+        )
+
+        if stream:
+            if out_file is None:
+                raise ValueError('An output file is required to stream.')
+
+            # Warning: might raise IO exceptions
+            try:
+                with open(out_file, 'w') as of:
+                    self.write_document(
+                        codefn, annfn, of, title=title, tpl=tpl, **kwargs
+                    )
+            except Exception:
+                if exists(out_file):
+                    unlink(out_file)
+                raise
+            return None
+
+        # Warning: might raise IO exceptions
+        with self._stage('read'):
+            code, annotations = self.read_files(codefn, annfn)
+
+        document = self.render_document(
+            code, annotations, codefn=codefn, title=title, tpl=tpl, **kwargs
+        )
 
         # Warning: might raise IO exceptions
         if out_file is not None:
-            with open(out_file, 'w') as of:
-                of.write(document)
+            with self._stage('write'):
+                with open(out_file, 'w') as of:
+                    of.write(document)
 
         return document
+
+    @_profiled
+    def render_document(
+            self, code, annotations,
+            title='', tpl=None, assets_dir=None, assets_url=None, **kwargs):
+        """
+        Render a document for given code and annotations.
+
+        This is the part of :meth:`Processor.create_document` that doesn't
+        read or write the code, annotations and output files.
+
+        :param str code: Code to be highlighted.
+        :param str annotations: Annotations for the code.
+        :param str title: Title of the document.
+        :param str tpl: Python template string to be used a template for the
+         document. If ``None`` is given, the ``default_tpl`` will be used.
+        :param str assets_dir: Optional path to a directory to write the
+         styles and the script as external files. See
+         :meth:`Processor.write_document`.
+        :param str assets_url: URL of the assets directory, as referenced from
+         the document. If ``None`` is given, ``assets_dir`` is used.
+        :param dict kwargs: Other arguments for :meth:`Processor.process`.
+        :rtype: str
+        :return: The content of the document.
+        """
+
+        if tpl is None:
+            tpl = default_tpl
+
+        processed = self.process(code, annotations, **kwargs)
+
+        # Add title and join annotations
+        with self._stage('template'):
+            processed['title'] = title
+            processed['annotations'] = '\n'.join(processed['annotations'])
+            processed.update(self._get_assets(
+                processed['styles'], kwargs.get('codestyle', 'monokai'),
+                assets_dir, assets_url, tpl
+            ))
+            return tpl.format(**processed)
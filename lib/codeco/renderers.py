@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Annotations renderers.
+
+A renderer is a session object that is built once with the renderer options
+and then used to render any number of annotations bodies to HTML using its
+``render(body)`` method. Renderers are registered by annotations format with
+:func:`register_renderer`.
+
+Markup libraries are imported when the first session of their renderer is
+built, so importing this module, or rendering only one format, doesn't pay for
+the others.
+"""
+
+from random import random
+from hashlib import sha1
+
+
+class MarkdownRenderer(object):
+    """
+    Markdown renderer session.
+
+    Keeps a single ``markdown.Markdown`` instance, with its extensions loaded,
+    that is reset between bodies.
+
+    :param dict kwargs: Keyword options passed to ``markdown.Markdown``.
+    """
+
+    def __init__(self, **kwargs):
+        from markdown import Markdown
+        kwargs['output_format'] = 'html4'  # Same as Pygments
+        self.md = Markdown(**kwargs)
+
+    def render(self, body):
+        """
+        Render given Markdown formatted body to HTML.
+
+        :param str body: String with Markdown.
+        """
+        self.md.reset()
+        return self.md.convert(body)
+
+
+class MarkdownItRenderer(object):
+    """
+    CommonMark renderer session using markdown-it-py.
+
+    Requires the optional ``markdown-it-py`` package.
+
+    :param str preset: markdown-it preset, ``'commonmark'`` by default.
+    :param dict kwargs: Options to update the preset with.
+    """
+
+    def __init__(self, preset='commonmark', **kwargs):
+        from markdown_it import MarkdownIt
+        self.md = MarkdownIt(preset, options_update=kwargs)
+
+    def render(self, body):
+        """
+        Render given CommonMark formatted body to HTML.
+
+        :param str body: String with CommonMark.
+        """
+        return self.md.render(body)
+
+
+class MistuneRenderer(object):
+    """
+    Markdown renderer session using mistune.
+
+    Requires the optional ``mistune`` package, version 2 or later.
+
+    :param dict kwargs: Keyword options passed to
+     ``mistune.create_markdown``. Raw HTML is not escaped by default.
+    """
+
+    def __init__(self, **kwargs):
+        from mistune import create_markdown
+        kwargs.setdefault('escape', False)
+        self.md = create_markdown(**kwargs)
+
+    def render(self, body):
+        """
+        Render given Markdown formatted body to HTML.
+
+        :param str body: String with Markdown.
+        """
+        return self.md(body)
+
+
+class RestRenderer(object):
+    """
+    reStructuredText renderer session.
+
+    Keeps a docutils ``Publisher`` with its components and settings already
+    built, so they are not recreated for each body.
+
+    :param dict kwargs: Settings overrides passed to docutils.
+    """
+
+    def __init__(self, **kwargs):
+        from docutils import readers, parsers, writers
+        from docutils.core import Publisher
+        from docutils.io import StringInput, StringOutput
+
+        overrides = {
+            'doctitle_xform': False,
+            'initial_header_level': 1
+        }
+        overrides.update(kwargs)
+
+        self.publisher = Publisher(
+            reader=readers.get_reader_class('standalone')(),
+            parser=parsers.get_parser_class('restructuredtext')(),
+            writer=writers.get_writer_class('html')(),
+            source_class=StringInput,
+            destination_class=StringOutput,
+        )
+        self.publisher.process_programmatic_settings(None, overrides, None)
+
+    def _publish(self, source):
+        """
+        Publish given source and return the publisher document and body.
+        """
+        self.publisher.set_source(source, None)
+        self.publisher.set_destination(None, None)
+        self.publisher.publish()
+        return self.publisher.document, self.publisher.writer.parts['body']
+
+    def render(self, body):
+        """
+        Render given reStructuredText formatted body to HTML.
+
+        :param str body: String with reStructuredText.
+        """
+        return self._publish(body)[1]
+
+    """
+    Names of the ``docutils.nodes`` elements that make the output of a body
+    depend on the other bodies of the document (titles hierarchy, document
+    information, references, numbering, messages, or transitions that are
+    only valid between elements), so bodies containing them can't be
+    published together.
+    """
+    isolated_elements = (
+        'section', 'title', 'docinfo', 'field_list', 'footnote', 'citation',
+        'target', 'substitution_definition', 'system_message', 'topic',
+        'transition',
+    )
+
+    def render_many(self, bodies):
+        """
+        Render given reStructuredText formatted bodies in a single publish
+        pass, splitting the output afterwards.
+
+        Bodies are joined separated by comments, that are then used to split
+        the output. This is only possible if the bodies don't interact with
+        each other, so if the document contains any of the
+        :attr:`RestRenderer.isolated_elements`, or the separators don't end up
+        at the top level, ``None`` is returned and the bodies must be
+        rendered one by one.
+
+        :param list bodies: List of strings with reStructuredText.
+        :rtype: list
+        :return: List with the HTML for each body, or ``None``.
+        """
+        from docutils import nodes
+
+        if len(bodies) < 2:
+            return [self.render(body) for body in bodies]
+
+        # Separator unlikely to be in the bodies
+        separator = 'codeco-separator-' + sha1(
+            str(random()).encode('utf-8')
+        ).hexdigest()
+
+        source = '\n\n.. {}\n\n'.format(separator).join(bodies)
+        document, html = self._publish(source)
+
+        isolated_classes = tuple(
+            getattr(nodes, name) for name in self.isolated_elements
+        )
+        isolated = _findall(
+            document, lambda node: isinstance(node, isolated_classes)
+        )
+        if next(iter(isolated), None) is not None:
+            return None
+
+        separators = [
+            node for node in _findall(document, nodes.comment)
+            if node.astext() == separator
+        ]
+        if len(separators) != len(bodies) - 1 or any(
+                node.parent is not document for node in separators):
+            return None
+
+        parts = html.split('<!-- {} -->\n'.format(separator))
+        if len(parts) != len(bodies):
+            return None
+        return parts
+
+
+"""
+Renderers factories by annotations format.
+"""
+renderers_registry = {}
+
+
+def register_renderer(ann_format, factory):
+    """
+    Register a renderer for an annotations format.
+
+    :param str ann_format: Name of the format, as used in the ``ann_format``
+     argument of :meth:`codeco.processor.Processor.process`. Registering an
+     existing format replaces its renderer.
+    :param factory: Callable that receives the renderer options as keyword
+     arguments and returns a renderer session, an object with a
+     ``render(body)`` method that returns the body rendered to HTML. The
+     session may also have a ``render_many(bodies)`` method, see
+     :meth:`RestRenderer.render_many`.
+    """
+    renderers_registry[ann_format] = factory
+
+
+def get_renderer(ann_format):
+    """
+    Get the renderer factory registered for an annotations format.
+
+    :param str ann_format: Name of the format.
+    :raises ValueError: If no renderer is registered for the format.
+    """
+    try:
+        return renderers_registry[ann_format]
+    except KeyError:
+        raise ValueError(
+            'Unknown annotations format "{}". Available formats are: {}.'
+            .format(ann_format, ', '.join(sorted(renderers_registry)))
+        )
+
+
+register_renderer('markdown', MarkdownRenderer)
+register_renderer('rest', RestRenderer)
+register_renderer('commonmark', MarkdownItRenderer)
+register_renderer('mistune', MistuneRenderer)
+
+
+def _findall(node, condition):
+    """
+    Iterate the nodes under given node matching a condition.
+    """
+    if hasattr(node, 'findall'):
+        return node.findall(condition)
+    return node.traverse(condition)
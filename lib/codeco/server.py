@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Preview server module.
+"""
+
+from os import stat
+from os.path import join
+from time import sleep
+from threading import Thread, Condition
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from html import escape
+from traceback import format_exc, print_exc
+from urllib.parse import unquote, quote
+
+from codeco.cache import RenderCache
+from codeco.batch import find_pairs, create_processor
+from codeco.watch import create_watcher
+
+
+index_tpl = """\
+<!DOCTYPE html>
+<html>
+<head>
+    <meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
+    <title>codeco</title>
+</head>
+<body>
+<h1>codeco</h1>
+<ul>
+{items}
+</ul>
+</body>
+</html>
+"""
+
+
+error_tpl = """\
+<!DOCTYPE html>
+<html>
+<head>
+    <meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
+    <title>{title}</title>
+</head>
+<body>
+<h1>{title}</h1>
+<pre>{error}</pre>
+</body>
+</html>
+"""
+
+
+"""
+Script injected in served pages to reload them when their inputs change.
+"""
+reload_script = """\
+<script type="text/javascript">
+new EventSource('/_events').addEventListener('reload', function () {
+    window.location.reload();
+});
+</script>
+"""
+
+
+class DocumentStore(object):
+    """
+    In-memory store of the documents of a source tree.
+
+    Documents are created on demand and kept in memory until their inputs
+    change. A single warm :class:`codeco.processor.Processor` is used from a
+    single thread, so lexers, renderers sessions, and rendered annotations
+    and highlighted code caches are reused between requests.
+
+    The pairs of the source tree are found once, and again when
+    :meth:`DocumentStore.refresh_pairs` is called, by :class:`ReloadNotifier`
+    when the inputs change.
+
+    :param str source: Path to the source tree. See
+     :func:`codeco.batch.find_pairs`.
+    :param dict pairs: Optional dictionary mapping code files to annotations
+     files, relative to the source, to serve instead of the pairs found in
+     the source tree.
+    :param str tpl_file: Optional path to a template file.
+    :param str cache_dir: Optional path to a directory to cache rendered
+     annotations and highlighted code between runs.
+    :param dict kwargs: Other arguments for
+     :meth:`codeco.processor.Processor.create_document`.
+    """
+
+    def __init__(
+            self, source, pairs=None,
+            tpl_file=None, cache_dir=None, **kwargs):
+        self.source = source
+        self._pairs = pairs
+        self.tpl_file = tpl_file
+        self.options = kwargs
+        self.options.setdefault('prefix_mode', 'path')
+
+        processor_opts = {'cache_dir': cache_dir}
+        if cache_dir is None:
+            processor_opts['cache'] = RenderCache()
+        self.processor = create_processor(**processor_opts)
+
+        # Renderers sessions are per thread, always render in the same one
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._documents = {}
+        self._found = None
+
+    def pairs(self):
+        """
+        Get the code - annotations pairs of the source tree.
+
+        :rtype: dict
+        :return: A dictionary mapping the relative path of the code file to
+         the relative path of the annotations file.
+        """
+        found = self._found
+        if found is None:
+            found = self.refresh_pairs()
+        return dict(found)
+
+    def refresh_pairs(self):
+        """
+        Find the code - annotations pairs of the source tree again.
+
+        :rtype: dict
+        :return: The pairs. See :meth:`DocumentStore.pairs`.
+        """
+        if self._pairs is not None:
+            found = dict(self._pairs)
+        else:
+            found = dict(find_pairs(self.source))
+        self._found = found
+        return found
+
+    def paths(self):
+        """
+        Get the paths of all the input files, including the template.
+        """
+        paths = []
+        for codefn, annfn in sorted(self.pairs().items()):
+            paths.append(join(self.source, codefn))
+            paths.append(join(self.source, annfn))
+        if self.tpl_file is not None:
+            paths.append(self.tpl_file)
+        return paths
+
+    def _signature(self, paths):
+        signature = []
+        for path in paths:
+            info = stat(path)
+            signature.append((path, info.st_mtime, info.st_size))
+        return signature
+
+    def _create(self, relfn, annfn):
+        codefn = join(self.source, relfn)
+        annfn = join(self.source, annfn)
+        paths = [codefn, annfn]
+        if self.tpl_file is not None:
+            paths.append(self.tpl_file)
+
+        signature = self._signature(paths)
+        cached = self._documents.get(codefn, None)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        tpl = None
+        if self.tpl_file is not None:
+            with open(self.tpl_file, 'r') as fd:
+                tpl = fd.read()
+
+        options = dict(self.options)
+        options.setdefault('title', relfn)
+        document = self.processor.create_document(
+            codefn, annfn, tpl=tpl, **options
+        )
+        self._documents[codefn] = (signature, document)
+        return document
+
+    def get(self, codefn):
+        """
+        Get the document of a code file.
+
+        :param str codefn: Path of the code file, relative to the source.
+        :rtype: str
+        :return: The document, or ``None`` if the code file isn't paired.
+        """
+        annfn = self.pairs().get(codefn, None)
+        if annfn is None:
+            return None
+        return self._executor.submit(self._create, codefn, annfn).result()
+
+    def close(self):
+        """
+        Release the resources of the store.
+        """
+        self._executor.shutdown()
+
+
+class ReloadNotifier(object):
+    """
+    Notifies waiting clients each time the inputs of the documents change.
+
+    The pairs of the store are found again after each change, and every
+    ``interval`` seconds to pick up new pairs.
+
+    :param store: :class:`DocumentStore` instance.
+    :param bool polling: Always poll files instead of using inotify.
+    :param float interval: Seconds between searches of new pairs.
+    """
+
+    def __init__(self, store, polling=False, interval=5.0):
+        self.store = store
+        self.polling = polling
+        self.interval = interval
+        self.generation = 0
+        self._condition = Condition()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        """
+        Start watching the inputs in a background thread.
+        """
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._watch()
+            except Exception:
+                # For example, inputs removed while starting to watch them.
+                # Report, and notify as the inputs changed anyway.
+                print_exc()
+                sleep(self.interval)
+
+            with self._condition:
+                self.generation += 1
+                self._condition.notify_all()
+
+    def _watch(self):
+        """
+        Wait until the inputs change, or the pairs of the store do.
+        """
+        paths = self.store.paths()
+        watcher = create_watcher(paths, polling=self.polling)
+        try:
+            # Wake up from time to time to pick up new pairs
+            while not watcher.wait(timeout=self.interval):
+                self.store.refresh_pairs()
+                if self.store.paths() != paths:
+                    break
+        finally:
+            watcher.close()
+        self.store.refresh_pairs()
+
+    def wait(self, generation, timeout=None):
+        """
+        Wait until the inputs change after given generation.
+
+        :param int generation: Last generation seen by the client.
+        :param float timeout: Maximum time to wait in seconds.
+        :rtype: int
+        :return: The current generation.
+        """
+        with self._condition:
+            if self.generation == generation:
+                self._condition.wait(timeout)
+            return self.generation
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the preview server.
+
+    Serves the index of documents at ``/``, each document at
+    ``/<code file>.html`` and the reload events at ``/_events``.
+    """
+
+    server_version = 'codeco'
+
+    def do_GET(self):
+        path = unquote(self.path.split('?', 1)[0])
+
+        if path == '/':
+            self._send_index()
+        elif path == '/_events':
+            self._send_events()
+        elif path.endswith('.html'):
+            self._send_document(path[1:-len('.html')])
+        else:
+            self._send(404, error_tpl.format(
+                title='Not found', error=escape(path)
+            ))
+
+    def _send(self, code, html):
+        body = html.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_index(self):
+        items = [
+            '<li><a href="/{0}.html">{1}</a></li>'.format(
+                quote(codefn), escape(codefn)
+            )
+            for codefn in sorted(self.server.store.pairs())
+        ]
+        self._send(200, index_tpl.format(items='\n'.join(items)))
+
+    def _send_document(self, codefn):
+        try:
+            document = self.server.store.get(codefn)
+        except Exception:
+            self._send(500, error_tpl.format(
+                title='Unable to create {}'.format(escape(codefn)),
+                error=escape(format_exc()),
+            ) + reload_script)
+            return
+
+        if document is None:
+            self._send(404, error_tpl.format(
+                title='Not found', error=escape(codefn)
+            ))
+            return
+
+        # Inject the reload script at the end of the body
+        index = document.rfind('</body>')
+        if index < 0:
+            index = len(document)
+        self._send(
+            200, document[:index] + reload_script + document[index:]
+        )
+
+    def _send_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+
+        notifier = self.server.notifier
+        generation = notifier.generation
+        try:
+            while True:
+                current = notifier.wait(generation, timeout=15.0)
+                if current == generation:
+                    # Keep alive
+                    self.wfile.write(b': ping\n\n')
+                else:
+                    generation = current
+                    self.wfile.write(b'event: reload\ndata: reload\n\n')
+                self.wfile.flush()
+        except (IOError, OSError):
+            pass
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class PreviewServer(ThreadingHTTPServer):
+    """
+    Preview server of the documents of a source tree.
+
+    :param tuple address: Tuple ``(host, port)`` to listen on.
+    :param store: :class:`DocumentStore` instance.
+    :param bool polling: Always poll files instead of using inotify.
+    :param bool verbose: Log requests to standard error.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, store, polling=False, verbose=False):
+        ThreadingHTTPServer.__init__(self, address, PreviewHandler)
+        self.store = store
+        self.verbose = verbose
+        self.notifier = ReloadNotifier(store, polling=polling)
+        self.notifier.start()
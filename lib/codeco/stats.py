@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Instrumentation module.
+"""
+
+from time import perf_counter
+from contextlib import contextmanager
+
+import tracemalloc
+
+
+"""
+Names of the stages reported by the processor, in pipeline order. These names
+are stable, new stages might be added but existing ones are not renamed.
+
+Times include the time of the stages nested in them: ``total`` includes all
+the others and, when a document is streamed, ``write`` includes the
+``parse``, ``render`` and ``wrap`` stages of the annotations produced while
+writing.
+"""
+stages = [
+    'total',      # The whole call to the processor
+    'read',       # Reading the code and annotations files
+    'prefix',     # Generating the prefix of the block
+    'lexer',      # Getting or guessing the lexer
+    'parse',      # Parsing the annotations
+    'render',     # Rendering the annotations bodies
+    'wrap',       # Wrapping the rendered annotations
+    'highlight',  # Highlighting the code with Pygments
+    'mark',       # Marking characters ranges and linking lines
+    'chunk',      # Splitting the code in chunks
+    'template',   # Formatting the document
+    'write',      # Writing the document
+]
+
+
+class StageStats(object):
+    """
+    Wall time, number of calls and, optionally, peak memory of each stage of
+    the processor.
+
+    Pass an instance as the ``stats`` argument of
+    :meth:`codeco.processor.Processor.process` or
+    :meth:`codeco.processor.Processor.create_document`. Stats accumulate
+    between calls. To get each measure as it is taken, for example to send it
+    to a monitoring system, override :meth:`StageStats.record`.
+
+    An instance must only be used from one thread at a time.
+
+    :param bool memory: Also measure the peak memory allocated by each stage,
+     using ``tracemalloc``. Tracing is started, if required, when the first
+     stage starts and stopped when it ends. Tracing memory makes everything
+     several times slower.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stats = {}
+        self._stack = []
+        self._tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager that measures a stage.
+
+        :param str name: Name of the stage. See ``codeco.stats.stages``.
+        """
+        if self.memory:
+            if not self._stack and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+
+            # The peak is reset for this stage, keep the enclosing one's
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current, 0])
+        else:
+            self._stack.append(None)
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            frame = self._stack.pop()
+
+            peak = None
+            if frame is not None:
+                peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], peak)
+                peak -= frame[0]
+                if not self._stack and self._tracing:
+                    tracemalloc.stop()
+                    self._tracing = False
+
+            self.record(name, elapsed, peak)
+
+    def record(self, name, elapsed, peak=None):
+        """
+        Record a measure of a stage.
+
+        :param str name: Name of the stage.
+        :param float elapsed: Wall time of the stage, in seconds.
+        :param int peak: Peak memory allocated by the stage, in bytes, or
+         ``None`` if memory isn't measured.
+        """
+        stat = self.stats.get(name, None)
+        if stat is None:
+            stat = self.stats[name] = {
+                'calls' : 0,
+                'time' : 0.0,
+            }
+        stat['calls'] += 1
+        stat['time'] += elapsed
+        if peak is not None:
+            stat['peak'] = max(stat.get('peak', 0), peak)
+
+    def as_dict(self):
+        """
+        Get the stats as a JSON serializable dictionary.
+
+        :rtype: dict
+        :return: A dictionary mapping the name of each measured stage, in
+         pipeline order, to a dictionary with the keys ``calls``, ``time``
+         (seconds) and, if memory is measured, ``peak`` (bytes).
+        """
+        order = {name: index for index, name in enumerate(stages)}
+        return {
+            name: dict(self.stats[name])
+            for name in sorted(
+                self.stats,
+                key=lambda name: (order.get(name, len(order)), name)
+            )
+        }
+
+    def format_table(self):
+        """
+        Format the stats as a text table.
+
+        :rtype: str
+        """
+        header = '{:<10} {:>8} {:>10} {:>8}'.format(
+            'stage', 'calls', 'time (ms)', '%'
+        )
+        if self.memory:
+            header += ' {:>10}'.format('peak (KiB)')
+        rows = [header, '-' * len(header)]
+
+        stats = self.as_dict()
+        total = stats.get('total', {}).get('time', 0.0)
+        for name, stat in stats.items():
+            row = '{:<10} {:>8} {:>10.2f} {:>8}'.format(
+                name, stat['calls'], stat['time'] * 1000.0,
+                '{:.1f}'.format(100.0 * stat['time'] / total)
+                if total else '-'
+            )
+            if self.memory:
+                row += ' {:>10.1f}'.format(stat.get('peak', 0) / 1024.0)
+            rows.append(row)
+        return '\n'.join(rows)
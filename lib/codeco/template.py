@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Compiled templates module.
+"""
+
+from string import Formatter
+
+
+class CompiledTemplate(object):
+    """
+    Python template string split once into literal chunks and slots, so it
+    can be rendered piece by piece.
+
+    The output is the same as calling ``str.format`` on the template, except
+    that values that are iterators are streamed: each of their pieces is
+    produced as it is consumed, without joining them first. Use
+    :func:`compile_template` to get a memoized instance.
+
+    :param str tpl: Python template string. See
+     ``codeco.processor.default_tpl`` for an example.
+    """
+
+    formatter = Formatter()
+
+    def __init__(self, tpl):
+        # List of tuples (literal, field, format_spec, conversion) where
+        # either the literal or the field is None
+        self.parts = []
+        for literal, field, spec, conversion in self.formatter.parse(tpl):
+            if literal:
+                self.parts.append((literal, None, None, None))
+            if field is not None:
+                self.parts.append((None, field, spec, conversion))
+
+        self.fields = [
+            field for literal, field, spec, conversion in self.parts
+            if field is not None
+        ]
+
+    def iter_render(self, values):
+        """
+        Render the template with given values, piece by piece.
+
+        :param dict values: Values for the slots of the template. Iterators
+         used in a slot without format specification or conversion are
+         streamed, and can only be used once in the template.
+        """
+        formatter = self.formatter
+
+        for literal, field, spec, conversion in self.parts:
+            if field is None:
+                yield literal
+                continue
+
+            value = formatter.get_field(field, (), values)[0]
+
+            if _is_iterator(value):
+                if not spec and not conversion:
+                    for piece in value:
+                        yield piece
+                    continue
+                value = ''.join(value)
+
+            value = formatter.convert_field(value, conversion)
+            if spec and '{' in spec:
+                spec = formatter.vformat(spec, (), values)
+            yield formatter.format_field(value, spec)
+
+    def render(self, values):
+        """
+        Render the template with given values to a string.
+
+        :param dict values: Values for the slots of the template.
+        """
+        return ''.join(self.iter_render(values))
+
+    def write(self, out, values):
+        """
+        Render the template with given values to a file object, writing each
+        piece as it is produced.
+
+        :param out: File-like object with a ``write`` method.
+        :param dict values: Values for the slots of the template.
+        """
+        for piece in self.iter_render(values):
+            out.write(piece)
+
+
+"""
+Memo of compiled templates, keyed by template string.
+"""
+templates_memo = {}
+
+
+def compile_template(tpl):
+    """
+    Get the compiled version of a template string.
+
+    :param str tpl: Python template string.
+    :rtype: :class:`CompiledTemplate`
+    """
+    compiled = templates_memo.get(tpl, None)
+    if compiled is None:
+        compiled = templates_memo[tpl] = CompiledTemplate(tpl)
+    return compiled
+
+
+def _is_iterator(value):
+    """
+    Check if given value is an iterator (and not only an iterable).
+    """
+    try:
+        return iter(value) is value
+    except TypeError:
+        return False
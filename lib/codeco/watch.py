@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Watch mode module.
+"""
+
+from os import read, close, stat
+from os.path import abspath, dirname, join
+from select import select
+from struct import unpack_from, calcsize
+from time import perf_counter, sleep
+from traceback import format_exc
+
+from codeco.cache import RenderCache
+
+
+class PollingWatcher(object):
+    """
+    Files watcher that polls the modification time and size of the files.
+
+    :param list paths: Paths of the files to watch.
+    :param float interval: Seconds between polls.
+    """
+
+    def __init__(self, paths, interval=0.5):
+        self.paths = set(abspath(path) for path in paths)
+        self.interval = interval
+        self._signatures = {
+            path: self._signature(path) for path in self.paths
+        }
+
+    def _signature(self, path):
+        try:
+            info = stat(path)
+        except OSError:
+            return None
+        return (info.st_mtime, info.st_size)
+
+    def wait(self, timeout=None):
+        """
+        Wait until some of the files change.
+
+        :param float timeout: Maximum time to wait in seconds, or ``None`` to
+         wait forever.
+        :rtype: set
+        :return: The set of absolute paths of the files that changed, empty
+         if the timeout expired.
+        """
+        deadline = None if timeout is None else perf_counter() + timeout
+        while True:
+            changed = set()
+            for path in self.paths:
+                signature = self._signature(path)
+                if signature != self._signatures[path]:
+                    self._signatures[path] = signature
+                    changed.add(path)
+            if changed:
+                return changed
+
+            if deadline is not None and perf_counter() >= deadline:
+                return changed
+            sleep(self.interval)
+
+    def close(self):
+        """
+        Release the resources of the watcher.
+        """
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Files watcher that uses Linux inotify, through ``ctypes``.
+
+    The directories of the files are watched, instead of the files, so files
+    replaced by editors (written to a temporary file and renamed) are still
+    watched.
+
+    :param list paths: Paths of the files to watch.
+    :param float latency: Seconds to wait for more events after the first
+     one, so a burst of writes produces a single change.
+    :raises OSError: If inotify isn't available.
+    """
+
+    # See inotify(7)
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+
+    event_format = 'iIII'
+    event_size = calcsize(event_format)
+
+    def __init__(self, paths, latency=0.1):
+        from ctypes import CDLL, get_errno
+        from ctypes.util import find_library
+
+        self.paths = set(abspath(path) for path in paths)
+        self.latency = latency
+
+        try:
+            libc = CDLL(find_library('c') or 'libc.so.6', use_errno=True)
+            init = libc.inotify_init1
+            add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError):
+            raise OSError('inotify is not available.')
+
+        self.fd = init(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(get_errno(), 'Unable to initialize inotify.')
+
+        mask = self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_MOVED_TO
+        self._dirs = {}
+        for directory in set(dirname(path) for path in self.paths):
+            wd = add_watch(self.fd, directory.encode('utf-8'), mask)
+            if wd < 0:
+                errno = get_errno()
+                self.close()
+                raise OSError(
+                    errno, 'Unable to watch {}.'.format(directory)
+                )
+            self._dirs[wd] = directory
+
+    def _read(self):
+        """
+        Read the pending events and return the watched paths they affect.
+        """
+        changed = set()
+        while True:
+            try:
+                data = read(self.fd, 64 * 1024)
+            except OSError:
+                break
+            if not data:
+                break
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = unpack_from(
+                    self.event_format, data, offset
+                )
+                offset += self.event_size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+
+                directory = self._dirs.get(wd, None)
+                if directory is None or not name:
+                    continue
+                path = join(directory, name.decode('utf-8', 'replace'))
+                if path in self.paths:
+                    changed.add(path)
+        return changed
+
+    def wait(self, timeout=None):
+        """
+        Wait until some of the files change. See :meth:`PollingWatcher.wait`.
+        """
+        deadline = None if timeout is None else perf_counter() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - perf_counter(), 0)
+
+            ready = select([self.fd], [], [], remaining)[0]
+            if not ready:
+                return set()
+
+            # Collect the rest of the burst
+            sleep(self.latency)
+            changed = self._read()
+            if changed:
+                return changed
+
+    def close(self):
+        """
+        Release the resources of the watcher.
+        """
+        if self.fd >= 0:
+            close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(paths, polling=False):
+    """
+    Create a watcher for given files, using inotify when available and
+    polling otherwise.
+
+    :param list paths: Paths of the files to watch.
+    :param bool polling: Always use polling.
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(paths)
+        except OSError:
+            pass
+    return PollingWatcher(paths)
+
+
+def watch_document(
+        proc, codefn, annfn, out_file,
+        tpl_file=None, watcher=None, **kwargs):
+    """
+    Create a document, then create it again each time its inputs change.
+
+    Rebuilds are incremental: annotations are keyed in the render cache of
+    the processor by the hash of their content, so only the annotations that
+    changed are rendered again, and highlighted code is reused from the
+    highlight cache if the code didn't change. If the processor has no render
+    cache, an in-memory :class:`codeco.cache.RenderCache` is set.
+
+    This generator yields a report after each build, and runs until closed.
+
+    :param proc: :class:`codeco.processor.Processor` instance.
+    :param str codefn: Path to the code file.
+    :param str annfn: Path to the annotations file.
+    :param str out_file: Path for the output file.
+    :param str tpl_file: Optional path to a template file.
+    :param watcher: Optional watcher, as returned by :func:`create_watcher`.
+     By default, one is created for the code, annotations and template files.
+    :param dict kwargs: Other arguments for
+     :meth:`codeco.processor.Processor.create_document`, except ``tpl``.
+    :rtype: generator
+    :return: A generator of dictionaries with the keys ``changed`` (set of
+     changed paths, empty for the first build), ``annotations`` (number of
+     annotations), ``rendered`` (number of annotations rendered),
+     ``highlighted`` (if the code was highlighted again), ``elapsed``
+     (seconds) and ``error`` (formatted traceback or ``None``).
+    """
+
+    if proc.cache is None:
+        proc.cache = RenderCache()
+
+    paths = [codefn, annfn]
+    if tpl_file is not None:
+        paths.append(tpl_file)
+    if watcher is None:
+        watcher = create_watcher(paths)
+
+    changed = set()
+    try:
+        while True:
+            cache = proc.cache
+            highlight_cache = proc.highlight_cache
+            hits, misses = cache.hits, cache.misses
+            highlights = (
+                highlight_cache.misses if highlight_cache is not None else 0
+            )
+
+            report = {
+                'changed' : changed,
+                'error' : None,
+            }
+            start = perf_counter()
+            try:
+                tpl = None
+                if tpl_file is not None:
+                    with open(tpl_file, 'r') as fd:
+                        tpl = fd.read()
+                proc.create_document(
+                    codefn, annfn, tpl=tpl, out_file=out_file, **kwargs
+                )
+            except Exception:
+                report['error'] = format_exc()
+
+            report['elapsed'] = perf_counter() - start
+            report['rendered'] = cache.misses - misses
+            report['annotations'] = (
+                cache.hits - hits + report['rendered']
+            )
+            report['highlighted'] = (
+                highlight_cache is None or
+                highlight_cache.misses != highlights
+            )
+            yield report
+
+            changed = watcher.wait()
+    finally:
+        watcher.close()
@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+HTML wrapper for rendered annotations.
+
+Rendered annotations are wrapped and marked with classes by a streaming
+parser from the standard library, without building a tree. It only handles
+well-formed HTML, like the one produced by the renderers, and gives up on any
+construct that a HTML5 parser would fix up or move around, in which case
+Beautiful Soup with the html5lib parser is used, imported only then. Both
+produce the same output.
+"""
+
+from html.parser import HTMLParser
+
+
+"""
+Characters considered whitespace by HTML.
+"""
+html_whitespace = ' \t\n\r\f'
+
+"""
+Elements without content, serialized as ``<tag/>``.
+"""
+void_elements = frozenset([
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed',
+    'frame', 'hr', 'image', 'img', 'input', 'isindex', 'keygen', 'link',
+    'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr',
+])
+
+"""
+Attributes whose value is a whitespace separated list, by element.
+"""
+list_attributes = {
+    '*': frozenset(['class', 'accesskey', 'dropzone']),
+    'a': frozenset(['rel', 'rev']),
+    'link': frozenset(['rel', 'rev']),
+    'td': frozenset(['headers']),
+    'th': frozenset(['headers']),
+    'form': frozenset(['accept-charset']),
+    'object': frozenset(['archive']),
+    'area': frozenset(['rel']),
+    'icon': frozenset(['sizes']),
+    'iframe': frozenset(['sandbox']),
+    'output': frozenset(['for']),
+}
+
+"""
+Elements whose content is not escaped.
+"""
+raw_elements = frozenset(['script', 'style'])
+
+"""
+Elements that a HTML5 parser handles specially.
+"""
+unsupported_elements = frozenset([
+    'html', 'head', 'body', 'frameset', 'frame', 'template', 'title',
+    'textarea', 'select', 'option', 'optgroup', 'noscript', 'noframes',
+    'noembed', 'iframe', 'xmp', 'plaintext', 'listing', 'image', 'isindex',
+    'nobr', 'math', 'svg', 'ruby', 'rb', 'rp', 'rt', 'rtc', 'form', 'button',
+    'applet', 'marquee', 'object',
+])
+
+"""
+Elements that a HTML5 parser moves to the head if found at the top level.
+"""
+head_elements = frozenset([
+    'script', 'style', 'link', 'meta', 'base', 'basefont', 'bgsound',
+])
+
+"""
+Elements that implicitly close an open paragraph.
+"""
+block_elements = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'center', 'details',
+    'dialog', 'dir', 'div', 'dl', 'fieldset', 'figcaption', 'figure',
+    'footer', 'header', 'hgroup', 'main', 'menu', 'nav', 'ol', 'p', 'section',
+    'summary', 'ul', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'table',
+    'hr', 'li', 'dd', 'dt',
+])
+
+"""
+Elements that implicitly close an open element of the same kind, if found in
+its list item scope.
+"""
+list_item_elements = frozenset(['li', 'dd', 'dt'])
+
+"""
+Elements that limit the list item scope (except ``address``, ``div`` and
+``p``).
+"""
+special_elements = frozenset([
+    'address', 'applet', 'area', 'article', 'aside', 'base', 'basefont',
+    'bgsound', 'blockquote', 'body', 'br', 'button', 'caption', 'center',
+    'col', 'colgroup', 'dd', 'details', 'dir', 'div', 'dl', 'dt', 'embed',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'frame', 'frameset',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'head', 'header', 'hgroup', 'hr',
+    'html', 'iframe', 'img', 'input', 'keygen', 'li', 'link', 'listing',
+    'main', 'marquee', 'menu', 'meta', 'nav', 'noembed', 'noframes',
+    'noscript', 'object', 'ol', 'p', 'param', 'plaintext', 'pre', 'script',
+    'section', 'select', 'source', 'style', 'summary', 'table', 'tbody', 'td',
+    'template', 'textarea', 'tfoot', 'th', 'thead', 'title', 'tr', 'track',
+    'ul', 'wbr', 'xmp',
+]) - frozenset(['address', 'div', 'p'])
+
+"""
+Headings, that implicitly close an open heading.
+"""
+heading_elements = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+
+"""
+Allowed children of table elements. Anything else is moved by a HTML5 parser.
+"""
+table_children = {
+    'table': frozenset(['caption', 'colgroup', 'thead', 'tbody', 'tfoot']),
+    'colgroup': frozenset(['col']),
+    'thead': frozenset(['tr']),
+    'tbody': frozenset(['tr']),
+    'tfoot': frozenset(['tr']),
+    'tr': frozenset(['td', 'th']),
+}
+
+
+class Unsupported(Exception):
+    """
+    Raised when the HTML requires a full HTML5 parser.
+    """
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _starttag(tag, attrs, classes=()):
+    """
+    Serialize a start tag as Beautiful Soup does.
+
+    :param str tag: Name of the tag.
+    :param list attrs: List of tuples ``(name, value)``.
+    :param list classes: Classes to add to the tag.
+    """
+    if classes:
+        attrs = dict(attrs)
+        if attrs.get('class'):
+            attrs['class'] += ' ' + ' '.join(classes)
+        else:
+            attrs['class'] = ' '.join(classes)
+        attrs = attrs.items()
+
+    parts = ['<', tag]
+    for name, value in sorted(attrs):
+        value = _escape(value)
+        quote = '"'
+        if '"' in value:
+            if "'" in value:
+                value = value.replace('"', '&quot;')
+            else:
+                quote = "'"
+        parts.extend([' ', name, '=', quote, value, quote])
+    parts.append('/>' if tag in void_elements else '>')
+    return ''.join(parts)
+
+
+class _WrapperParser(HTMLParser):
+    """
+    Parser that serializes the HTML as it is fed while recording the top level
+    nodes and the start tags that may receive a class.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.out = []
+        self.stack = []
+
+        # Top level nodes as tuples (kind, first piece, last piece)
+        self.nodes = []
+
+        # Start tags that may receive a class as tuples (piece, tag, attrs)
+        self.first_element = None
+        self.first_child = None
+
+        self._skip_newline = False
+        self._implicit_colgroup = False
+
+        # Count of "<" consumed as markup or as raw text
+        self.markup = 0
+
+    def error(self, message):
+        raise Unsupported(message)
+
+    def _check_start(self, tag, attrs):
+        if tag in unsupported_elements:
+            raise Unsupported(tag)
+        if not self.stack and tag in head_elements:
+            raise Unsupported(tag)
+        if len(set(name for name, value in attrs)) != len(attrs):
+            raise Unsupported('duplicated attributes')
+
+        if self.stack:
+            current = self.stack[-1]
+            if current in table_children:
+                if tag not in table_children[current]:
+                    raise Unsupported(tag)
+            elif tag in ('caption', 'colgroup', 'col', 'thead', 'tbody',
+                         'tfoot', 'tr', 'td', 'th'):
+                raise Unsupported(tag)
+            if tag == 'a' and tag in self.stack:
+                raise Unsupported(tag)
+            if tag in list_item_elements:
+                for node in reversed(self.stack):
+                    if node in list_item_elements:
+                        raise Unsupported(tag)
+                    if node in special_elements:
+                        break
+            if tag in block_elements and 'p' in self.stack:
+                raise Unsupported(tag)
+            if current in heading_elements and tag in heading_elements:
+                raise Unsupported(tag)
+        elif tag in ('caption', 'colgroup', 'col', 'thead', 'tbody', 'tfoot',
+                     'tr', 'td', 'th'):
+            raise Unsupported(tag)
+
+    def _close_implicit(self):
+        """
+        Close the column group a HTML5 parser opens for columns found directly
+        in a table.
+        """
+        if self._implicit_colgroup:
+            self._implicit_colgroup = False
+            self.stack.pop()
+            self.out.append('</colgroup>')
+
+    def handle_starttag(self, tag, attrs):
+        self.markup += self.get_starttag_text().count('<')
+        self._starttag(tag, attrs)
+
+    def _starttag(self, tag, attrs):
+        if tag != 'col':
+            self._close_implicit()
+        elif self.stack and self.stack[-1] == 'table':
+            self._starttag('colgroup', [])
+            self._implicit_colgroup = True
+
+        self._check_start(tag, attrs)
+        self._skip_newline = tag == 'pre'
+
+        attrs = [
+            (name, '' if value is None else value)
+            for name, value in attrs
+        ]
+        lists = list_attributes['*'] | list_attributes.get(tag, frozenset())
+        attrs = [
+            (name, ' '.join(value.split()) if name in lists else value)
+            for name, value in attrs
+        ]
+
+        index = len(self.out)
+        self.out.append(_starttag(tag, attrs))
+
+        if not self.stack:
+            self.nodes.append(['element', index, index])
+            if self.first_element is None:
+                self.first_element = (index, tag, attrs)
+        elif len(self.stack) == 1 and len(self.nodes) == 1 and \
+                self.first_child is None:
+            self.first_child = (index, tag, attrs)
+
+        if tag not in void_elements:
+            self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag not in void_elements:
+            raise Unsupported(tag)
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        self.markup += 1
+        self._close_implicit()
+        if not self.stack or self.stack[-1] != tag:
+            raise Unsupported('misnested {}'.format(tag))
+        self.stack.pop()
+        self._skip_newline = False
+        self.out.append('</{}>'.format(tag))
+        if not self.stack:
+            self.nodes[-1][2] = len(self.out) - 1
+
+    def handle_data(self, data):
+        if '\x00' in data:
+            raise Unsupported('null character')
+        data = data.replace('\r\n', '\n').replace('\r', '\n')
+
+        if self._skip_newline:
+            self._skip_newline = False
+            if data.startswith('\n'):
+                data = data[1:]
+        if not data:
+            return
+
+        if self.stack:
+            current = self.stack[-1]
+            if current in table_children and data.strip(html_whitespace):
+                raise Unsupported('text in {}'.format(current))
+            if current in raw_elements:
+                self.markup += data.count('<')
+            else:
+                data = _escape(data)
+            self.out.append(data)
+            return
+
+        index = len(self.out)
+        self.out.append(_escape(data))
+        kind = 'text' if data.strip(html_whitespace) else 'whitespace'
+        self.nodes.append([kind, index, index])
+
+    def handle_comment(self, data):
+        self.markup += 1 + data.count('<')
+        if not self.stack:
+            raise Unsupported('top level comment')
+        self._skip_newline = False
+        self.out.append('<!--{}-->'.format(data))
+
+    def handle_decl(self, decl):
+        raise Unsupported(decl)
+
+    def handle_pi(self, data):
+        raise Unsupported(data)
+
+    def unknown_decl(self, data):
+        raise Unsupported(data)
+
+
+def wrap_fast(html, classes, title_class):
+    """
+    Wrap HTML into a ``div`` and mark it with classes, using a streaming
+    parser.
+
+    See :func:`wrap` for the arguments.
+
+    :rtype: str
+    :return: The wrapped HTML, or ``None`` if the HTML requires a full HTML5
+     parser to be processed.
+    """
+
+    parser = _WrapperParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Unsupported:
+        return None
+    if parser.stack:
+        return None
+
+    # A "<" not consumed as markup is a broken tag, left as text by the
+    # streaming parser but dropped or fixed up by a HTML5 parser
+    if html.count('<') != parser.markup:
+        return None
+
+    out = parser.out
+    nodes = parser.nodes
+
+    # Already wrapped
+    if len(nodes) == 1 and parser.first_element is not None and \
+            parser.first_element[1] == 'div':
+        index, tag, attrs = parser.first_element
+        out[index] = _starttag(tag, attrs, classes)
+        if parser.first_child is not None:
+            index, tag, attrs = parser.first_child
+            out[index] = _starttag(tag, attrs, [title_class])
+        return ''.join(out)
+
+    # Wrap into a div
+    if parser.first_element is not None:
+        index, tag, attrs = parser.first_element
+        out[index] = _starttag(tag, attrs, [title_class])
+
+    wrapped = [_starttag('div', [], classes)]
+    for kind, first, last in nodes:
+        if kind != 'whitespace':
+            wrapped.extend(out[first:last + 1])
+    wrapped.append('</div>')
+    return ''.join(wrapped)
+
+
+def wrap_soup(html, classes, title_class):
+    """
+    Wrap HTML into a ``div`` and mark it with classes, using Beautiful Soup
+    and the html5lib parser.
+
+    See :func:`wrap` for the arguments.
+
+    :rtype: str
+    :return: The wrapped HTML.
+    """
+    from bs4 import BeautifulSoup, Tag, NavigableString, Comment
+
+    def add_class(elem, html_class):
+        """
+        Helper to safely add a class to a Tag object.
+        """
+        if not isinstance(elem, Tag):
+            return False
+        if 'class' in elem.attrs:
+            elem.attrs['class'] += [html_class]
+        else:
+            elem.attrs['class'] = [html_class]
+        return True
+
+    bs = BeautifulSoup(html, 'html5lib')
+    elements = bs.body.contents
+    if len(elements) == 1 and elements[0].name == 'div':
+        # Already wrapped
+        wrapper = elements[0]
+    else:
+        # Wrap into a div, ignoring whitespace between elements
+        wrapper = bs.new_tag('div')
+        for elem in list(elements):
+            if isinstance(elem, NavigableString) and \
+                    not isinstance(elem, Comment) and \
+                    not elem.strip(html_whitespace):
+                continue
+            wrapper.append(elem)
+    for html_class in classes:
+        add_class(wrapper, html_class)
+
+    for child in wrapper.children:
+        if add_class(child, title_class):
+            break
+    return str(wrapper)
+
+
+def wrap(html, classes, title_class):
+    """
+    Wrap HTML into a ``div`` and mark it with classes.
+
+    If the HTML is a single ``div`` element it is used as wrapper. Otherwise,
+    all top level nodes, except whitespace, are wrapped into a new ``div``.
+    The wrapper is marked with the given classes and its first child element
+    with the title class.
+
+    :param str html: HTML to wrap.
+    :param list classes: Classes to add to the wrapper.
+    :param str title_class: Class to add to the first child element.
+    :rtype: str
+    :return: The wrapped HTML.
+    """
+    wrapped = wrap_fast(html, classes, title_class)
+    if wrapped is None:
+        wrapped = wrap_soup(html, classes, title_class)
+    return wrapped
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Shared fixtures of the test suite.
+
+The ``lib`` directory of the repository is put first in the path, so the
+tests run against the tree and not an installed ``codeco``. The repository is
+put in the path too, so the tests can use the generators of the benchmarks.
+"""
+
+import sys
+from os.path import join, dirname, abspath
+
+import pytest
+
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, join(root, 'lib'))
+
+"""
+Path to the examples of the repository.
+"""
+examples = join(root, 'examples')
+
+
+@pytest.fixture
+def proc():
+    """
+    Processor without a shared highlight cache.
+    """
+    from codeco.processor import Processor
+    return Processor(highlight_cache=None)
+
+
+def write_pair(directory, code, annotations, ext='.md'):
+    """
+    Write a code - annotations pair to a directory.
+
+    :rtype: tuple
+    :return: A tuple ``(codefn, annfn)`` with the paths of the files.
+    """
+    codefn = join(str(directory), 'source.py')
+    annfn = codefn + ext
+    with open(codefn, 'w') as cf:
+        cf.write(code)
+    with open(annfn, 'w') as af:
+        af.write(annotations)
+    return codefn, annfn
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the asyncio front end of the processor.
+"""
+
+from asyncio import run, gather
+
+from conftest import write_pair
+
+from codeco.aio import AsyncProcessor
+
+
+code = 'def add(a, b):\n    return a + b\n'
+annotations = '<[annotation]> 1 2[4,10]\n# Add\n\nAdds.\n'
+
+
+def test_coalesced_callers_get_copies():
+    processor = AsyncProcessor(max_concurrency=2)
+
+    async def main():
+        return await gather(*[
+            processor.process(code, annotations, ann_format='markdown')
+            for _ in range(3)
+        ])
+
+    try:
+        results = run(main())
+    finally:
+        processor.close()
+
+    assert results[0] == results[1] == results[2]
+    assert results[0] is not results[1]
+    results[0]['annotations'].append('changed')
+    assert 'changed' not in results[1]['annotations']
+
+
+def test_create_document(tmpdir):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    out_file = str(tmpdir.join('out.html'))
+    processor = AsyncProcessor()
+
+    try:
+        document = run(processor.create_document(
+            codefn, annfn, title='t', out_file=out_file
+        ))
+    finally:
+        processor.close()
+
+    expected = processor.processor.create_document(codefn, annfn, title='t')
+    assert document == expected
+    with open(out_file, 'r') as fd:
+        assert fd.read() == expected
+
+
+def test_get_format():
+    processor = AsyncProcessor()
+    try:
+        assert processor._get_format('a.py.md') == 'markdown'
+        assert processor._get_format('a.py.rst') == 'rest'
+        assert processor._get_format(
+            'a.py.md', {'.md': 'commonmark'}
+        ) == 'commonmark'
+    finally:
+        processor.close()
+
+
+def test_create_document_with_assets(tmpdir):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    assets_dir = str(tmpdir.join('out', 'assets'))
+    out_file = str(tmpdir.join('out', 'aio.html'))
+    expected_file = str(tmpdir.join('out', 'expected.html'))
+    processor = AsyncProcessor()
+
+    try:
+        document = run(processor.create_document(
+            codefn, annfn, out_file=out_file, assets_dir=assets_dir
+        ))
+    finally:
+        processor.close()
+
+    assert 'href="assets/codeco-' in document
+    assert document == processor.processor.create_document(
+        codefn, annfn, out_file=expected_file, assets_dir=assets_dir
+    )
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the external styles and script of the documents.
+"""
+
+import re
+from io import StringIO
+from os import listdir, stat
+from os.path import join
+from hashlib import sha1
+
+import pytest
+
+from conftest import write_pair
+
+from codeco.processor import Processor, interact_script
+
+
+code = 'def add(a, b):\n    return a + b\n'
+annotations = '<[annotation]> 1\n# Add\n\nAdds.\n'
+
+
+def hrefs(document):
+    return re.findall(r'(?:href|src)="([^"]*codeco[^"]*)"', document)
+
+
+def test_inlined_by_default(tmpdir, proc):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    document = proc.create_document(codefn, annfn)
+    assert interact_script in document
+    assert hrefs(document) == []
+
+
+def test_hashed_names(tmpdir, proc):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    assets_dir = str(tmpdir.join('assets'))
+    proc.create_document(codefn, annfn, assets_dir=assets_dir)
+
+    names = sorted(listdir(assets_dir))
+    assert len(names) == 2
+    assert re.match(r'^codeco-monokai\.[0-9a-f]{8}\.css$', names[0])
+    assert re.match(r'^codeco\.[0-9a-f]{8}\.js$', names[1])
+    for name in names:
+        with open(join(assets_dir, name), 'r') as fd:
+            digest = sha1(fd.read().encode('utf-8')).hexdigest()[:8]
+        assert name.split('.')[-2] == digest
+    assert names[1] == 'codeco.{}.js'.format(
+        sha1(interact_script.encode('utf-8')).hexdigest()[:8]
+    )
+
+    # Existing assets are not written again, other styles are added
+    mtimes = [stat(join(assets_dir, name)).st_mtime_ns for name in names]
+    proc.create_document(codefn, annfn, assets_dir=assets_dir)
+    assert sorted(listdir(assets_dir)) == names
+    assert [
+        stat(join(assets_dir, name)).st_mtime_ns for name in names
+    ] == mtimes
+
+    proc.create_document(
+        codefn, annfn, assets_dir=assets_dir, codestyle='default'
+    )
+    assert len(listdir(assets_dir)) == 3
+
+
+def test_urls(tmpdir, proc):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    assets_dir = str(tmpdir.join('out', 'assets'))
+
+    # Relative to the output file
+    out_file = str(tmpdir.join('out', 'sub', 'doc.html'))
+    tmpdir.join('out', 'sub').ensure(dir=True)
+    proc.create_document(
+        codefn, annfn, assets_dir=assets_dir, out_file=out_file
+    )
+    with open(out_file, 'r') as fd:
+        urls = hrefs(fd.read())
+    assert len(urls) == 2
+    assert all(url.startswith('../assets/codeco') for url in urls)
+
+    # Given
+    document = proc.create_document(
+        codefn, annfn, assets_dir=assets_dir, assets_url='/static'
+    )
+    assert all(url.startswith('/static/codeco') for url in hrefs(document))
+
+    # Without an output file, the directory
+    document = proc.create_document(codefn, annfn, assets_dir=assets_dir)
+    assert all(
+        url.startswith(assets_dir + '/codeco') for url in hrefs(document)
+    )
+
+
+def test_template_without_assets(tmpdir, proc):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    with pytest.raises(ValueError):
+        proc.create_document(
+            codefn, annfn, tpl='{styles}{script}{annotations}{code}',
+            assets_dir=str(tmpdir.join('assets')),
+        )
+
+
+def test_streamed_equals_formatted(tmpdir, proc):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    assets_dir = str(tmpdir.join('out', 'assets'))
+    formatted_file = str(tmpdir.join('out', 'formatted.html'))
+    streamed_file = str(tmpdir.join('out', 'streamed.html'))
+
+    proc.create_document(
+        codefn, annfn, assets_dir=assets_dir, out_file=formatted_file
+    )
+    proc.create_document(
+        codefn, annfn, assets_dir=assets_dir, out_file=streamed_file,
+        stream=True,
+    )
+    with open(formatted_file, 'r') as ff, open(streamed_file, 'r') as sf:
+        formatted = ff.read()
+        assert sf.read() == formatted
+    assert hrefs(formatted)
+
+    out = StringIO()
+    proc.write_document(
+        codefn, annfn, out, assets_dir=assets_dir, assets_url='assets'
+    )
+    assert out.getvalue() == formatted
+
+
+def test_document_options(tmpdir):
+    options = Processor.document_options(
+        'a.py.rst', out_file=str(tmpdir.join('out', 'a.html')),
+        assets_dir=str(tmpdir.join('assets')),
+    )
+    assert options == {
+        'prefix_mode' : 'content',
+        'assets_dir'  : str(tmpdir.join('assets')),
+        'assets_url'  : join('..', 'assets'),
+        'ann_format'  : 'rest',
+    }
+
+    options = Processor.document_options(
+        'a.py.md', out_file='a.html', ext_map={'.md': 'commonmark'},
+        assets_dir='assets', assets_url='/static', prefix_mode='path',
+    )
+    assert options['assets_url'] == '/static'
+    assert options['ann_format'] == 'commonmark'
+    assert options['prefix_mode'] == 'path'
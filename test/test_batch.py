@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the rendering of directory trees.
+"""
+
+import sys
+from os import makedirs, environ
+from os.path import join
+from subprocess import run, PIPE
+
+import pytest
+
+from conftest import root
+
+from codeco.batch import find_pairs, process_tree
+
+
+code = 'def add(a, b):\n    return a + b\n'
+
+
+@pytest.fixture
+def source(tmpdir):
+    source = str(tmpdir.join('source'))
+    makedirs(join(source, 'sub'))
+    for path, content in [
+            ('add.py', code),
+            ('add.py.md', '<[annotation]> 1\n# Add\n\nAdds.\n'),
+            ('add.py.rst', 'Ignored, Markdown takes precedence.\n'),
+            ('sub/add.py', code),
+            ('sub/add.py.rst', '<[annotation]> 2\nAdd\n===\n\n*Adds*.\n'),
+            ('sub/alone.py', code)]:
+        with open(join(source, path), 'w') as fd:
+            fd.write(content)
+    return source
+
+
+def test_find_pairs(source):
+    assert find_pairs(source) == [
+        ('add.py', 'add.py.md'),
+        (join('sub', 'add.py'), join('sub', 'add.py.rst')),
+    ]
+
+
+@pytest.mark.parametrize('jobs, cache, single_pass', [
+    (1, False, False),
+    (1, True, True),
+    (2, True, False),
+])
+def test_output_unchanged(tmpdir, proc, source, jobs, cache, single_pass):
+    output = str(tmpdir.join('output'))
+    cache_dir = str(tmpdir.join('cache')) if cache else None
+
+    for _ in range(2 if cache else 1):
+        results = process_tree(
+            source, output,
+            jobs=jobs, cache_dir=cache_dir, single_pass=single_pass,
+        )
+    assert [result[-1] for result in results] == [None, None]
+
+    for codefn, annfn in find_pairs(source):
+        with open(join(output, codefn + '.html'), 'r') as fd:
+            assert fd.read() == proc.create_document(
+                join(source, codefn), join(source, annfn), title=codefn
+            )
+
+
+def test_errors_reported(tmpdir, source):
+    with open(join(source, 'sub', 'add.py.rst'), 'w') as fd:
+        fd.write('<[annotation]> x\n')
+
+    results = process_tree(source, str(tmpdir.join('output')), jobs=1)
+    assert results[0][-1] is None
+    assert results[1][-1] is not None
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_processor_errors_reported(tmpdir, source, jobs):
+    # The render cache can't be created in the workers
+    cache_dir = tmpdir.join('cache')
+    cache_dir.ensure('render')
+
+    results = process_tree(
+        source, str(tmpdir.join('output')), jobs=jobs, cache_dir=str(cache_dir)
+    )
+    assert len(results) == 2
+    for result in results:
+        assert 'FileExistsError' in result[-1]
+
+
+def test_cli_jobs(tmpdir, source):
+    env = dict(environ, PYTHONPATH=join(root, 'lib'))
+    process = run(
+        [sys.executable, join(root, 'bin', 'codeco'), 'batch',
+         source, str(tmpdir.join('output')), '-j', '0'],
+        stdout=PIPE, stderr=PIPE, env=env, universal_newlines=True,
+    )
+    assert process.returncode == 2
+    assert 'Traceback' not in process.stderr
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the caches.
+"""
+
+from os import listdir
+from os.path import join
+
+from conftest import write_pair
+
+from codeco.cache import Cache, RenderCache, HighlightCache
+from codeco.processor import Processor
+
+
+code = 'def add(a, b):\n    return a + b\n'
+annotations = '<[annotation]> 1 2\n# Add\n\nAdds *a* and *b*.\n'
+
+
+def test_memory_lru():
+    cache = Cache(max_size=10)
+    cache.put('aa', 'xxxx')
+    cache.put('bb', 'yyyy')
+    assert cache.get('aa') == 'xxxx'
+
+    # Least recently used is now bb
+    cache.put('cc', 'zzzz')
+    assert cache.get('bb') is None
+    assert cache.get('aa') == 'xxxx'
+    assert cache.get('cc') == 'zzzz'
+    assert (cache.hits, cache.misses) == (3, 1)
+
+    # Replacing an entry doesn't count it twice
+    cache.put('cc', 'zz')
+    cache.put('dd', 'ww')
+    assert cache.get('aa') == 'xxxx'
+
+
+def test_disk_persistence(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    cache = Cache(directory, max_size=100)
+    cache.put('abcdef', 'á' * 10)
+    assert cache.get('abcdef') == 'á' * 10
+    assert [f for f in listdir(directory)] == ['ab']
+
+    # Entries found in the directory are reused and bounded
+    reopened = Cache(directory, max_size=100)
+    assert reopened.get('abcdef') == 'á' * 10
+    assert Cache(directory, max_size=10).get('abcdef') is None
+    assert listdir(tmpdir.join('cache', 'ab').strpath) == []
+
+
+def test_disk_entry_removed_by_other_process(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    cache = Cache(directory)
+    cache.put('abcdef', 'value')
+    Cache(directory, max_size=0)
+    assert cache.get('abcdef') is None
+    assert cache.misses == 1
+
+
+def test_scan_entry_removed_by_other_process(tmpdir, monkeypatch):
+    import codeco.cache
+
+    directory = str(tmpdir.join('cache'))
+    cache = Cache(directory)
+    cache.put('abcdef', 'value')
+    cache.put('abcxyz', 'other')
+
+    # Removed between listing the directory and reading its size
+    getsize = codeco.cache.getsize
+
+    def racing_getsize(path):
+        if 'cdef' in path:
+            raise FileNotFoundError(path)
+        return getsize(path)
+
+    monkeypatch.setattr(codeco.cache, 'getsize', racing_getsize)
+    reopened = Cache(directory)
+    assert reopened.get('abcdef') is None
+    assert reopened.get('abcxyz') == 'other'
+
+
+def test_shared_directory_bounded(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    caches = [Cache(directory, max_size=100) for _ in range(4)]
+    for num in range(40):
+        caches[num % 4].put('{:06d}'.format(num), 'x' * 10)
+
+    size = sum(
+        len(listdir(join(directory, subdir))) * 10
+        for subdir in listdir(directory)
+    )
+    assert size <= 100 + 3 * 10
+
+    # Entries written by other processes are found by the next scan
+    caches[0].put('000040', 'x' * 10)
+    caches[0].put('000041', 'x' * 10)
+    assert caches[0].get('000039') == 'x' * 10
+
+
+def test_render_cache_key():
+    key = RenderCache.key('body', 'rest', {'a': 1, 'b': 2}, False)
+    assert key == RenderCache.key('body', 'rest', {'b': 2, 'a': 1}, False)
+    assert key != RenderCache.key('body', 'rest', {'a': 1, 'b': 2}, True)
+    assert key != RenderCache.key('body', 'markdown', {'a': 1, 'b': 2}, False)
+    assert key != RenderCache.key('Body', 'rest', {'a': 1, 'b': 2}, False)
+
+
+def test_highlight_cache_promotes(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    HighlightCache(directory).put('abcdef', 'value')
+
+    cache = HighlightCache(directory)
+    assert cache.memory.get('abcdef') is None
+    assert cache.get('abcdef') == 'value'
+    assert cache.memory.get('abcdef') == 'value'
+    assert cache.get('abcdef') == 'value'
+    assert cache.get('000000') is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_cached_output_unchanged(tmpdir):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    expected = Processor(highlight_cache=None).create_document(
+        codefn, annfn, title='t', prefix_mode='path'
+    )
+
+    directory = str(tmpdir.join('cache'))
+    for _ in range(2):
+        processor = Processor(
+            cache=RenderCache(directory),
+            highlight_cache=HighlightCache(directory),
+        )
+        assert processor.create_document(
+            codefn, annfn, title='t', prefix_mode='path'
+        ) == expected
+    assert processor.cache.hits == processor.highlight_cache.hits == 1
+
+
+def test_highlight_cache_prefix_independent(tmpdir):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    cache = HighlightCache()
+    first = Processor(highlight_cache=cache).create_document(
+        codefn, annfn, title='t', prefix='pfxone'
+    )
+    second = Processor(highlight_cache=cache).create_document(
+        codefn, annfn, title='t', prefix='pfxtwo'
+    )
+    assert cache.hits == 1
+    assert second == first.replace('pfxone', 'pfxtwo')
+    assert second == Processor(highlight_cache=None).create_document(
+        codefn, annfn, title='t', prefix='pfxtwo'
+    )
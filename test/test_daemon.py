@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the render daemon and its client.
+"""
+
+import sys
+from io import StringIO
+from os import environ
+from threading import Thread
+from subprocess import run, PIPE
+from os.path import join
+
+import pytest
+
+from conftest import root, write_pair
+
+from codeco.client import create_request, submit, is_daemon_socket
+from codeco.daemon import RenderDaemon
+from codeco.processor import Processor
+
+
+code = 'def add(a, b):\n    return a + b\n'
+
+"""
+Annotations ending with a header without body.
+"""
+annotations = '<[annotation]> 1 2[4,10]\n# Add\n\nAdds.\n<[annotation]> 2\n'
+
+
+@pytest.fixture
+def daemon(tmpdir):
+    """
+    Daemon serving in a thread on a socket in a temporary directory.
+    """
+    server = RenderDaemon(str(tmpdir.join('codeco.sock')), idle_timeout=60)
+    thread = Thread(target=server.serve_until_idle, args=(0.05,))
+    thread.start()
+    yield server
+
+    # Exit as soon as idle
+    server.idle_timeout = 0.01
+    thread.join()
+    server.close()
+
+
+def test_daemon_equals_in_process(tmpdir, daemon):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    out = StringIO()
+    Processor().write_document(codefn, annfn, out, title='t')
+
+    response = submit(
+        create_request(codefn, annfn, title='t'), path=daemon.path
+    )
+    assert response['error'] is None
+    assert response['document'] == out.getvalue()
+
+    out_file = str(tmpdir.join('out.html'))
+    response = submit(
+        create_request(codefn, annfn, out_file=out_file, title='t'),
+        path=daemon.path
+    )
+    assert response['document'] is None
+    with open(out_file, 'r') as fd:
+        assert fd.read() == out.getvalue()
+
+
+def test_daemon_assets_relative_to_out_file(tmpdir, daemon):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    assets_dir = str(tmpdir.join('out', 'assets'))
+    expected = Processor().create_document(
+        codefn, annfn, out_file=str(tmpdir.join('out', 'expected.html')),
+        assets_dir=assets_dir,
+    )
+
+    out_file = str(tmpdir.join('out', 'daemon.html'))
+    request = create_request(
+        codefn, annfn, out_file=out_file, assets_dir=assets_dir
+    )
+    response = submit(request, path=daemon.path)
+    assert response['error'] is None
+    with open(out_file, 'r') as fd:
+        assert fd.read() == expected
+    assert 'href="assets/codeco-' in expected
+
+
+def test_daemon_reports_errors(tmpdir, daemon):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    response = submit(
+        create_request(codefn, str(tmpdir.join('missing.md'))),
+        path=daemon.path
+    )
+    assert response['status'] == 'error'
+    assert 'FileNotFoundError' in response['error']
+
+
+def test_cli_daemon_equals_no_daemon(tmpdir, daemon):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    env = dict(environ, CODECO_SOCKET=daemon.path)
+    outputs = []
+    for extra in [[], ['--no-daemon']]:
+        outputs.append(run(
+            [sys.executable, join(root, 'bin', 'codeco'), codefn, annfn] +
+            extra,
+            stdout=PIPE, env=env, check=True, universal_newlines=True,
+        ).stdout)
+    assert outputs[0] == outputs[1]
+
+
+def test_cli_warnings_to_stderr(tmpdir, daemon):
+    codefn, annfn = write_pair(tmpdir, code, '<[annotation]> 1 [3]\n# One\n')
+    env = dict(environ, CODECO_SOCKET=daemon.path)
+    for extra in [[], ['--no-daemon']]:
+        process = run(
+            [sys.executable, join(root, 'bin', 'codeco'), codefn, annfn] +
+            extra,
+            stdout=PIPE, stderr=PIPE, env=env, check=True,
+            universal_newlines=True,
+        )
+        assert 'WARNING' not in process.stdout
+        assert 'Unable to parse token "[3]" in line #1' in process.stderr
+
+
+def test_no_daemon(tmpdir):
+    path = str(tmpdir.join('codeco.sock'))
+    assert not is_daemon_socket(path)
+    assert submit(create_request('a', 'b'), path=path) is None
+
+
+def test_foreign_path_is_not_replaced(tmpdir):
+    path = tmpdir.join('codeco.sock')
+    path.write('')
+    with pytest.raises(RuntimeError):
+        RenderDaemon(str(path))
+    assert path.read() == ''
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the documents created by the processor.
+"""
+
+from io import StringIO
+
+import pytest
+
+from conftest import write_pair
+
+from benchmarks.generators import generate_pair
+
+
+code = '''\
+def add(a, b):
+    return a + b
+
+
+def sub(a, b):
+    return a - b
+'''
+
+
+@pytest.mark.parametrize('annotations', [
+    '<[annotation]> 1 2[4,10]\n# Add\n\nAdds.\n<[annotation]> 5\n',
+    '<[annotation]> 1\n# Add\n\nAdds.\n<[annotation]>\n',
+    '<[annotation]> 1\n# Add\n\nAdds.\n<[annotation]> 5\n\n',
+    '<[annotation]> 1\n<[annotation]> 5\n# Sub\n',
+    'Preamble.\n<[hidden-annotation]> 1 5\n# Both\n\nHidden.\n',
+    '<[annotation]> 1\n# Add\n\nbody\x0cmore\u2028end\x1c\n',
+])
+def test_streamed_equals_formatted(tmpdir, proc, annotations):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+
+    formatted = proc.create_document(codefn, annfn, title='t')
+
+    out = StringIO()
+    proc.write_document(codefn, annfn, out, title='t')
+    assert out.getvalue() == formatted
+
+    out_file = str(tmpdir.join('streamed.html'))
+    proc.create_document(
+        codefn, annfn, title='t', out_file=out_file, stream=True
+    )
+    with open(out_file, 'r') as fd:
+        assert fd.read() == formatted
+
+
+@pytest.mark.parametrize('ann_format', ['markdown', 'rest'])
+@pytest.mark.parametrize('chunk_lines', [None, 100])
+def test_generated_streamed_equals_formatted(
+        tmpdir, proc, ann_format, chunk_lines):
+    codefn, annfn = generate_pair(
+        str(tmpdir), 1000, 250, ann_format=ann_format
+    )
+    formatted = proc.create_document(codefn, annfn, chunk_lines=chunk_lines)
+
+    out = StringIO()
+    proc.write_document(codefn, annfn, out, chunk_lines=chunk_lines)
+    assert out.getvalue() == formatted
+
+
+def test_trailing_header_without_body(tmpdir, proc):
+    codefn, annfn = write_pair(
+        tmpdir, code, '<[annotation]> 1\n# Add\n<[annotation]> 5'
+    )
+    out = StringIO()
+    proc.write_document(codefn, annfn, out)
+    document = out.getvalue()
+
+    assert 'annotation-0' in document
+    assert 'annotation-1' not in document
+
+
+def test_warnings_to_stderr(capsys, proc):
+    proc.process(code, '<[annotation]> 1 [3]\n# One\n')
+    out, err = capsys.readouterr()
+    assert out == ''
+    assert 'Unable to parse token "[3]" in line #1' in err
+
+    with proc._capturing_warnings() as warnings:
+        proc.process(code, '<[annotation]> 1\n# One\n<[annotation]> 2 [\n')
+    assert capsys.readouterr() == ('', '')
+    assert warnings == [
+        '** WARNING: Unable to parse token "[" in line #3.'
+    ]
+
+
+@pytest.mark.parametrize('annotations', [
+    '<[annotation]> 1\n# One\n\nbody\x0cmore\x1cend \n<[annotation]> 2 [\n',
+    '<[annotation]> 1\r\n# One\r\n\r\nCRLF\r\n<[annotation]> 2 [\r\nTwo\r\n',
+    '<[annotation]> 1\r# One\r\rCR\r<[annotation]> 2 [\rTwo\r',
+])
+def test_file_equals_string(tmpdir, proc, annotations):
+    annfn = str(tmpdir.join('annotations.md'))
+    with open(annfn, 'w', newline='') as af:
+        af.write(annotations)
+
+    with proc._capturing_warnings() as expected_warnings:
+        expected = proc._parse_annotations(annotations, 'p')
+    with proc._capturing_warnings() as warnings:
+        with open(annfn, 'r') as af:
+            parsed = list(proc.iter_annotations(af, 'p'))
+
+    assert [(repr(meta), body) for meta, body in parsed] == \
+        [(repr(meta), body) for meta, body in expected]
+    assert warnings == expected_warnings == [
+        '** WARNING: Unable to parse token "[" in line #5.'
+    ]
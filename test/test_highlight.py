@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the highlighting of the code of a block.
+"""
+
+import re
+
+import pytest
+
+from codeco.model import Annotation, Target
+
+
+def unmark(html):
+    """
+    Remove the characters ranges marks of highlighted code.
+    """
+    return re.sub(r'<span class="hll-char [^"]*">([^<]*)</span>', r'\1', html)
+
+
+@pytest.mark.parametrize('html, ranges, expected', [
+    ('abcdef', {(1, 3)}, 'a<span class="hll-char p-chars-1-1-3">bcd</span>ef'),
+    ('abc', {(0, 10)}, '<span class="hll-char p-chars-1-0-10">abc</span>'),
+    ('abc', {(5, 6)}, 'abc'),
+    (
+        '<span class="k">def</span> <span class="nf">add</span>',
+        {(2, 4)},
+        '<span class="k">de<span class="hll-char p-chars-1-2-4">f</span>'
+        '</span><span class="hll-char p-chars-1-2-4"> </span>'
+        '<span class="nf"><span class="hll-char p-chars-1-2-4">a</span>dd'
+        '</span>',
+    ),
+    (
+        'a &lt;&lt; b',
+        {(2, 3)},
+        'a <span class="hll-char p-chars-1-2-3">&lt;&lt;</span> b',
+    ),
+    (
+        'abcd',
+        {(0, 1), (1, 2)},
+        '<span class="hll-char p-chars-1-0-1">a</span>'
+        '<span class="hll-char p-chars-1-0-1 p-chars-1-1-2">b</span>'
+        '<span class="hll-char p-chars-1-1-2">c</span>d',
+    ),
+])
+def test_mark_line(proc, html, ranges, expected):
+    assert proc._mark_line(html, 1, ranges, 'p-') == expected
+    assert unmark(expected) == html
+
+
+def test_marks_leave_code_unchanged(proc):
+    code = 'def add(a, b):\n    return a << b  # Shift & add\n'
+    lexer = proc._get_lexer(code, lexer='python')
+    metas = [
+        Annotation(0, targets=[Target(1, 4, 6), Target(2, 4, 40)]),
+        Annotation(1, targets=[Target(2, 15, 16), Target(2)]),
+    ]
+
+    plain = proc._highlight_block(code, lexer, 'monokai', 'p-')[1]
+    marked = proc._highlight_block(code, lexer, 'monokai', 'p-', metas)[1]
+    marked = re.sub(r'<a class="annotation-link" [^>]*></a>', '', marked)
+    marked = re.sub(r'<script .*</script>\n', '', marked)
+    plain = re.sub(r'<script .*</script>\n', '', plain)
+
+    assert 'p-chars-1-4-6' in marked
+    assert 'p-chars-2-15-16' in marked
+    assert unmark(marked) == plain
+
+
+def highlight(proc, lines, prefix='p-'):
+    code = ''.join('x = {}\n'.format(num) for num in range(lines))
+    lexer = proc._get_lexer(code, lexer='python')
+    options = {'style': 'monokai', 'linenos': 'table'}
+    return proc._highlight(code, lexer, options, prefix)
+
+
+@pytest.mark.parametrize('lines, chunk_lines', [(1, 1), (10, 10), (10, 20)])
+def test_single_chunk_unchanged(proc, lines, chunk_lines):
+    highlighted = highlight(proc, lines)
+    assert proc._chunk_code(highlighted, 'p-', chunk_lines) == highlighted
+
+
+def test_unexpected_structure_unchanged(proc):
+    assert proc._chunk_code('<pre>x</pre>', 'p-', 1) == '<pre>x</pre>'
+    highlighted = highlight(proc, 10)
+    assert proc._chunk_code(highlighted, 'other-', 1) == highlighted
+
+
+@pytest.mark.parametrize('lines, chunk_lines', [(10, 1), (10, 3), (10, 5)])
+def test_chunks(proc, lines, chunk_lines):
+    highlighted = highlight(proc, lines)
+    chunked = proc._chunk_code(highlighted, 'p-', chunk_lines)
+
+    bounds = re.findall(
+        r'<tbody class="codeco-chunk[^"]*" '
+        r'data-first="([0-9]+)" data-last="([0-9]+)">', chunked
+    )
+    assert [(int(first), int(last)) for first, last in bounds] == [
+        (first, min(first + chunk_lines - 1, lines))
+        for first in range(1, lines + 1, chunk_lines)
+    ]
+    assert chunked.count('codeco-lazy') == len(bounds) - 1
+
+    # Each line is in a chunk, plus its placeholder if lazy
+    for num in range(1, lines + 1):
+        count = 1 if num <= chunk_lines else 2
+        assert chunked.count('id="p-line-{}"'.format(num)) == count
+
+    # Without the placeholders, the lines are the same
+    materialized = re.sub(
+        r'codeco-lazy"[^>]*>.*?<template>', '', chunked, flags=re.DOTALL
+    )
+    line_re = re.compile(r'<span id="p-line-[0-9]+">[^\n]*\n</span>')
+    assert line_re.findall(materialized) == line_re.findall(highlighted)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the startup time of the library and the command line tool.
+
+Startup must not import the heavy dependencies, that are imported only by the
+code paths that need them. Imports are listed with ``python -X importtime``.
+"""
+
+import sys
+from os import environ, pathsep
+from subprocess import run, PIPE
+from os.path import join
+
+import pytest
+
+from conftest import root, examples
+
+
+codeco_bin = join(root, 'bin', 'codeco')
+
+"""
+Modules, and their submodules, that must not be imported on startup.
+"""
+heavy_modules = [
+    'pygments.lexers', 'pygments.formatters', 'pygments.styles',
+    'markdown', 'docutils', 'bs4', 'html5lib', 'multiprocessing',
+    'http.server', 'codeco.daemon',
+]
+
+
+def imported_modules(args, env=None):
+    """
+    Run the interpreter with ``-X importtime`` and given arguments.
+
+    :param list args: Arguments for the interpreter.
+    :param dict env: Extra environment variables.
+    :rtype: set
+    :return: The names of the imported modules.
+    """
+    env = dict(environ, **(env or {}))
+    paths = [join(root, 'lib')]
+    if env.get('PYTHONPATH', None):
+        paths.append(env['PYTHONPATH'])
+    env['PYTHONPATH'] = pathsep.join(paths)
+
+    process = run(
+        [sys.executable, '-X', 'importtime'] + args,
+        stdout=PIPE, stderr=PIPE, universal_newlines=True, env=env,
+        check=True,
+    )
+    modules = set()
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            modules.add(fields[2].strip())
+    return modules
+
+
+def heavy(modules, names=heavy_modules):
+    return sorted(
+        module for module in modules
+        if any(
+            module == name or module.startswith(name + '.')
+            for name in names
+        )
+    )
+
+
+@pytest.mark.parametrize('args', [
+    ['-c', 'import codeco.processor'],
+    ['-c', 'import codeco.batch'],
+    ['-c', 'import codeco.client'],
+    [codeco_bin, '--help'],
+])
+def test_startup_is_light(args):
+    assert heavy(imported_modules(args)) == []
+
+
+def test_run_without_daemon_is_light(tmpdir):
+    modules = imported_modules(
+        [
+            codeco_bin,
+            join(examples, 'ex3', 'fibonacci.py'),
+            join(examples, 'ex3', 'annotations.md'),
+            '-o', str(tmpdir.join('out.html')),
+        ],
+        env={'CODECO_SOCKET': str(tmpdir.join('codeco.sock'))},
+    )
+    assert heavy(modules, ['codeco.daemon']) == []
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the selection of lexers.
+"""
+
+import pytest
+
+from pygments.lexers import PythonLexer, guess_lexer_for_filename
+from pygments.util import ClassNotFound
+
+
+objc = '@interface Foo : NSObject\n- (void)bar;\n@end\n'
+header = '#include <stdio.h>\nint add(int a, int b);\n'
+cmake = 'cmake_minimum_required(VERSION 3.0)\nproject(foo)\n'
+
+
+@pytest.mark.parametrize('order', [
+    [('notes.txt', 'Some notes.\n'),
+     ('CMakeLists.txt', cmake)],
+    [('CMakeLists.txt', cmake),
+     ('notes.txt', 'Some notes.\n')],
+    [('a.h', header), ('b.h', objc)],
+    [('b.h', objc), ('a.h', header)],
+    [('a.py', 'x = 1\n'), ('b.py', '#!/usr/bin/env python3\nx = 1\n')],
+])
+def test_independent_of_order(proc, order):
+    for codefn, code in order:
+        assert type(proc._get_lexer(code, codefn=codefn)) is \
+            type(guess_lexer_for_filename(codefn, code))
+
+
+def test_guessed_names(proc):
+    assert type(proc._get_lexer(cmake, codefn='CMakeLists.txt')).__name__ == \
+        'CMakeLexer'
+    assert type(proc._get_lexer('', codefn='notes.txt')).__name__ == \
+        'TextLexer'
+    assert type(proc._get_lexer(objc, codefn='b.h')).__name__ == \
+        'ObjectiveCLexer'
+    assert type(proc._get_lexer(header, codefn='a.h')).__name__ == 'CLexer'
+    assert type(proc._get_lexer('', codefn='dir/Makefile')).__name__ == \
+        'MakefileLexer'
+
+
+def test_without_filename(proc):
+    code = '#!/usr/bin/env python3\nimport os\n'
+    assert isinstance(proc._get_lexer(code), PythonLexer)
+
+
+def test_unknown_filename(proc):
+    with pytest.raises(ClassNotFound):
+        proc._get_lexer('x', codefn='file.unknown-extension')
+
+
+def test_explicit_lexer(proc):
+    lexer = PythonLexer()
+    assert proc._get_lexer('int x;', codefn='a.c', lexer=lexer) is lexer
+    assert isinstance(
+        proc._get_lexer('int x;', codefn='a.c', lexer='python'), PythonLexer
+    )
+    with pytest.raises(ClassNotFound):
+        proc._get_lexer('x', lexer='unknown-lexer')
+
+
+def test_explicit_lexer_document(proc):
+    code = 'x = 1\n'
+    annotations = '<[annotation]> 1\n# One\n'
+    guessed = proc.process(code, annotations, codefn='x.txt', prefix='p')
+    explicit = proc.process(
+        code, annotations, codefn='x.txt', prefix='p', lexer='python'
+    )
+    assert '<span class="n">x</span>' not in guessed['code']
+    assert '<span class="n">x</span>' in explicit['code']
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the annotations data model.
+"""
+
+from random import Random
+
+import pytest
+
+from codeco.model import Target, Annotation, AnnotationIndex
+
+
+def test_target():
+    assert Target(3).as_data() == [3]
+    assert Target(3, 1, 4).as_data() == [3, 1, 4]
+    assert Target(3, 1).as_data() == [3]
+    assert repr(Target(3, 1, 4)) == 'Target(3, 1, 4)'
+
+    with pytest.raises(AttributeError):
+        Target(3).other = None
+
+
+def test_annotation():
+    ann = Annotation(2, [Target(1), Target(2, 0, 3)], 'p-', hide=True)
+    assert ann.anchor == 'p-annotation-2'
+    assert ann.as_data() == {'targets': [[1], [2, 0, 3]], 'hide': True}
+    assert Annotation(0).as_data() == {'targets': [], 'hide': False}
+
+    with pytest.raises(AttributeError):
+        ann.other = None
+
+
+def test_index():
+    index = AnnotationIndex([
+        Annotation(0, [Target(2), Target(3, 0, 1), Target(5)]),
+        None,
+        Annotation(2),
+        Annotation(3, [Target(3), Target(4)]),
+    ])
+    assert list(index.segments()) == [
+        (2, 2, (0,)), (3, 3, (0, 3)), (4, 4, (3,)), (5, 5, (0,)),
+    ]
+    assert len(index) == 4
+    assert index.annotations_at(1) == ()
+    assert index.annotations_at(3) == (0, 3)
+    assert index.annotations_at(6) == ()
+
+
+def test_empty_index():
+    index = AnnotationIndex([Annotation(0), None])
+    assert not index
+    assert list(index.segments()) == []
+    assert index.annotations_at(1) == ()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_index_equals_scan(seed):
+    random = Random(seed)
+    lines = random.randint(1, 50)
+    annotations = [
+        Annotation(num, [
+            Target(random.randint(1, lines))
+            for _ in range(random.randint(0, 6))
+        ])
+        for num in range(random.randint(0, 10))
+    ]
+    index = AnnotationIndex(annotations)
+
+    for line in range(0, lines + 2):
+        assert index.annotations_at(line) == tuple(
+            ann.index for ann in annotations
+            if any(target.line == line for target in ann.targets)
+        )
+
+    # Segments are disjoint, sorted and merged when touched by the same
+    # annotations
+    segments = list(index.segments())
+    for (first, last, members), (other, _, others) in zip(
+            segments, segments[1:]):
+        assert first <= last < other
+        assert last + 1 < other or members != others
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the generated block prefixes.
+"""
+
+import pytest
+
+from conftest import write_pair
+
+
+code = 'def add(a, b):\n    return a + b\n'
+annotations = '<[annotation]> 1 2\n# Add\n\nAdds.\n'
+
+
+def test_content_prefix(proc):
+    first = proc.process(code, annotations, prefix_mode='content')
+    assert proc.process(code, annotations, prefix_mode='content') == first
+
+    # The prefix depends on both the code and the annotations
+    other = proc.process(code + '\n', annotations, prefix_mode='content')
+    assert other['annotations'] != first['annotations']
+    other = proc.process(code, annotations + '\n', prefix_mode='content')
+    assert other['code'] != first['code']
+
+
+def test_path_prefix(proc):
+    first = proc.process(
+        code, annotations, codefn='add.py', prefix_mode='path'
+    )
+    assert proc.process(
+        code + '\n', annotations, codefn='add.py', prefix_mode='path'
+    )['annotations'] == first['annotations']
+    assert proc.process(
+        code, annotations, codefn='sub.py', prefix_mode='path'
+    )['annotations'] != first['annotations']
+
+    # Without a path, the prefix is derived from the content
+    assert proc.process(
+        code, annotations, prefix_mode='path'
+    ) == proc.process(code, annotations, prefix_mode='content')
+
+
+def test_random_prefix(proc):
+    assert proc.process(code, annotations) != proc.process(code, annotations)
+
+
+def test_given_prefix(proc):
+    result = proc.process(
+        code, annotations, prefix='given', prefix_mode='content'
+    )
+    assert 'id="givenannotation-0"' in result['annotations'][0]
+
+
+def test_unknown_prefix_mode(proc):
+    with pytest.raises(ValueError):
+        proc.process(code, annotations, prefix_mode='unknown')
+
+
+def test_documents_reproducible(tmpdir, proc):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    assert proc.create_document(codefn, annfn) == \
+        proc.create_document(codefn, annfn)
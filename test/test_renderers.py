@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the annotations renderers.
+
+The optional Markdown engines are checked against the reference ``markdown``
+engine on the Markdown annotations of the examples, after wrapping.
+"""
+
+from glob import glob
+from os.path import join, relpath
+
+import pytest
+
+from conftest import examples
+
+from codeco.processor import Processor
+from codeco.renderers import get_renderer, RestRenderer
+from codeco.wrapper import wrap
+
+
+"""
+Optional Markdown engines, mapped to the module they require.
+"""
+engines = {
+    'commonmark' : 'markdown_it',
+    'mistune' : 'mistune',
+}
+
+"""
+Differences with the reference engine that are known and accepted, mapped to
+their reason, by ``(engine, annotation)``.
+"""
+known_differences = {
+    ('mistune', 'ex3/annotations.md#1'):
+        'mistune strips the trailing newline of indented code blocks',
+}
+
+
+def corpus():
+    """
+    Parse the Markdown annotations of the examples.
+
+    :rtype: list
+    :return: List of tuples ``(name, body)``.
+    """
+    proc = Processor()
+    bodies = []
+    for annfn in sorted(glob(join(examples, '*', '*.md'))):
+        with open(annfn, 'r') as af:
+            parsed = proc._parse_annotations(af.read(), 'test')
+        for index, (meta, body) in enumerate(parsed, 1):
+            name = '{}#{}'.format(relpath(annfn, examples), index)
+            bodies.append((name, body))
+    return bodies
+
+
+def cases():
+    for engine in sorted(engines):
+        for name, body in corpus():
+            reason = known_differences.get((engine, name), None)
+            yield pytest.param(
+                engine, body,
+                id='{}-{}'.format(engine, name),
+                marks=() if reason is None else pytest.mark.xfail(
+                    reason=reason, strict=True
+                ),
+            )
+
+
+def render(engine, body):
+    html = get_renderer(engine)().render(body)
+    return wrap(html, ['annotation_body'], 'annotation_title')
+
+
+@pytest.mark.parametrize('engine, body', list(cases()))
+def test_engine_matches_markdown(engine, body):
+    pytest.importorskip(engines[engine])
+    assert render(engine, body) == render('markdown', body)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        get_renderer('unknown')
+
+
+@pytest.mark.parametrize('bodies', [
+    ['Some *text*.', 'A list:\n\n- One.\n- Two.', '``code``'],
+    ['A.', '-----\n\nStarts with a transition.'],
+    ['Ends with a transition.\n\n-----', 'B.'],
+    ['A.', 'Around\n\n-----\n\na transition.', 'C.'],
+    ['Title\n=====\n\nText.', 'B.'],
+])
+def test_rest_single_pass_equals_one_by_one(bodies):
+    renderer = RestRenderer(warning_stream=False)
+    expected = [renderer.render(body) for body in bodies]
+    rendered = renderer.render_many(bodies)
+    assert rendered is None or rendered == expected
+
+
+def test_rest_single_pass():
+    bodies = ['Some *text*.', 'A list:\n\n- One.\n- Two.']
+    assert RestRenderer().render_many(bodies) is not None
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the preview server.
+"""
+
+from os import makedirs
+from os.path import join
+from threading import Thread
+from http.client import HTTPConnection
+
+import pytest
+
+from codeco.processor import Processor
+from codeco.server import (
+    DocumentStore, ReloadNotifier, PreviewServer, reload_script
+)
+
+
+code = 'def add(a, b):\n    return a + b\n'
+annotations = '<[annotation]> 1\n# Add\n\nAdds.\n'
+
+
+def write(path, content):
+    with open(path, 'w') as fd:
+        fd.write(content)
+
+
+@pytest.fixture
+def source(tmpdir):
+    source = str(tmpdir.join('source'))
+    makedirs(join(source, 'sub'))
+    write(join(source, 'add.py'), code)
+    write(join(source, 'add.py.md'), annotations)
+    write(join(source, 'sub', 'bad.unknown'), code)
+    write(join(source, 'sub', 'bad.unknown.rst'), '<[annotation]> 1\n')
+    return source
+
+
+@pytest.fixture
+def store(source):
+    store = DocumentStore(source)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def server(store):
+    server = PreviewServer(('127.0.0.1', 0), store, polling=True)
+    thread = Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def get(server, path):
+    connection = HTTPConnection(*server.server_address[:2], timeout=10)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        return response.status, response.read().decode('utf-8')
+    finally:
+        connection.close()
+
+
+def test_store(source, store):
+    assert store.pairs() == {
+        'add.py': 'add.py.md',
+        join('sub', 'bad.unknown'): join('sub', 'bad.unknown.rst'),
+    }
+
+    document = store.get('add.py')
+    assert document == Processor(highlight_cache=None).create_document(
+        join(source, 'add.py'), join(source, 'add.py.md'),
+        title='add.py', prefix_mode='path',
+    )
+    assert store.get('add.py') is document
+    assert store.get('missing.py') is None
+
+    # Documents are created again when their inputs change
+    write(join(source, 'add.py.md'), annotations + '\nMore.\n')
+    assert 'More.' in store.get('add.py')
+
+
+def test_store_pairs_cached(source, store):
+    store.pairs()
+    write(join(source, 'new.py'), code)
+    write(join(source, 'new.py.md'), annotations)
+    assert 'new.py' not in store.pairs()
+    assert store.get('new.py') is None
+
+    assert 'new.py' in store.refresh_pairs()
+    assert store.get('new.py') is not None
+
+
+def test_store_given_pairs(source):
+    store = DocumentStore(source, pairs={'add.py': 'add.py.md'})
+    try:
+        assert store.pairs() == {'add.py': 'add.py.md'}
+        assert store.get(join('sub', 'bad.unknown')) is None
+    finally:
+        store.close()
+
+
+def test_index(server):
+    status, html = get(server, '/')
+    assert status == 200
+    assert '<a href="/add.py.html">add.py</a>' in html
+    assert '<a href="/sub/bad.unknown.html">sub/bad.unknown</a>' in html
+
+
+def test_document(server):
+    status, html = get(server, '/add.py.html')
+    assert status == 200
+
+    document = server.store.get('add.py')
+    index = document.rindex('</body>')
+    assert html == document[:index] + reload_script + document[index:]
+
+
+@pytest.mark.parametrize('path', [
+    '/missing.py.html', '/add.py', '/../add.py.html', '/%2e%2e/add.py.html',
+    '/' + join('..', 'source', 'add.py') + '.html',
+])
+def test_not_found(server, path):
+    status, html = get(server, path)
+    assert status == 404
+
+
+def test_error(server):
+    status, html = get(server, '/sub/bad.unknown.html')
+    assert status == 500
+    assert 'Unable to create sub/bad.unknown' in html
+
+
+def test_reload_events(source, server):
+    connection = HTTPConnection(*server.server_address[:2], timeout=10)
+    try:
+        connection.request('GET', '/_events')
+        response = connection.getresponse()
+        assert response.status == 200
+        assert response.getheader('Content-Type') == 'text/event-stream'
+
+        write(join(source, 'add.py'), code + '\n')
+        assert response.readline() == b'event: reload\n'
+        assert response.readline() == b'data: reload\n'
+    finally:
+        connection.close()
+
+
+def test_notifier_finds_new_pairs(source, store):
+    store.pairs()
+    notifier = ReloadNotifier(store, polling=True, interval=0.1)
+    notifier.start()
+
+    write(join(source, 'new.py'), code)
+    write(join(source, 'new.py.md'), annotations)
+    assert notifier.wait(0, timeout=10) > 0
+    assert 'new.py' in store.pairs()
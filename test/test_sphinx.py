@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the Sphinx extension.
+"""
+
+import sys
+from io import StringIO
+from glob import glob
+from os import environ, pathsep, stat, utime
+from shutil import copytree, ignore_patterns
+from subprocess import run, PIPE, STDOUT
+from os.path import join, basename, exists
+
+import pytest
+
+from conftest import root, examples
+
+
+pytest.importorskip('sphinx')
+
+
+def test_parallel_build(tmpdir):
+    """
+    Build the sample project in parallel, with warnings (including the one
+    for extensions that aren't parallel safe) turned into errors.
+    """
+    # Pages read files from the other examples
+    copytree(
+        examples, join(str(tmpdir), 'examples'),
+        ignore=ignore_patterns('_build')
+    )
+    source = join(str(tmpdir), 'examples', 'sphinx')
+    output = join(str(tmpdir), 'output')
+
+    # The extension is imported from the tree
+    env = dict(environ)
+    paths = [join(root, 'lib')]
+    if env.get('PYTHONPATH', None):
+        paths.append(env['PYTHONPATH'])
+    env['PYTHONPATH'] = pathsep.join(paths)
+    process = run(
+        [
+            sys.executable, '-m', 'sphinx', '-W', '-j', 'auto', '-b', 'html',
+            source, output,
+        ],
+        stdout=PIPE, stderr=STDOUT, env=env, universal_newlines=True,
+    )
+    assert process.returncode == 0, process.stdout
+
+    # Every page has its blocks and the assets were written
+    for page in sorted(glob(join(source, '*.rst'))):
+        with open(page, 'r') as fd:
+            expected = fd.read().count('.. annotated-code::')
+        html = join(output, basename(page)[:-len('.rst')] + '.html')
+        with open(html, 'r') as fd:
+            assert fd.read().count('<table class="two-columns">') == expected
+
+    for asset in ['codeco.css', 'codeco.js']:
+        assert exists(join(output, '_static', asset))
+
+
+code = 'cmake_minimum_required(VERSION 3.0)\nproject(foo)\n'
+annotations = '<[annotation]> 1\nRequired\n--------\n\nVersion.\n'
+
+pages = {
+    'index.rst': '''\
+Index
+=====
+
+.. toctree::
+
+   cmake
+   notes
+   inline
+''',
+    'cmake.rst': '''\
+CMake
+=====
+
+.. annotated-code::
+   :code: code/CMakeLists.txt
+   :annotations: code/annotations.rst
+''',
+    'notes.rst': '''\
+Notes
+=====
+
+.. annotated-code::
+   :code: code/notes.txt
+   :annotations: code/annotations.rst
+''',
+    'inline.rst': '''\
+Inline
+======
+
+.. annotated-code::
+   :lexer: python
+
+   x = 1
+
+   <[===========]>
+
+   <[annotation]> 1
+   One
+''',
+}
+
+
+@pytest.fixture
+def project(tmpdir):
+    source = tmpdir.join('source')
+    for name, content in pages.items():
+        source.join(name).write(content, ensure=True)
+    source.join('conf.py').write(
+        "extensions = ['codeco.directive']\nexclude_patterns = ['code']\n"
+    )
+    source.join('code', 'CMakeLists.txt').write(code, ensure=True)
+    source.join('code', 'notes.txt').write(code)
+    source.join('code', 'annotations.rst').write(annotations)
+    return tmpdir
+
+
+def build(project, monkeypatch):
+    """
+    Build the project incrementally in this process.
+
+    :rtype: list
+    :return: The blocks rendered by the build, as lists of the keyword
+     arguments of the processor.
+    """
+    from sphinx.application import Sphinx
+    from sphinx.util.docutils import docutils_namespace
+    from codeco.directive import get_processor
+
+    processor = get_processor()
+    process = processor.process
+    rendered = []
+
+    def counting_process(*args, **kwargs):
+        rendered.append(kwargs)
+        return process(*args, **kwargs)
+
+    monkeypatch.setattr(processor, 'process', counting_process)
+    try:
+        warnings = StringIO()
+        with docutils_namespace():
+            app = Sphinx(
+                str(project.join('source')), str(project.join('source')),
+                str(project.join('output')), str(project.join('doctrees')),
+                'html', status=None, warning=warnings, freshenv=False,
+            )
+            app.build()
+        assert warnings.getvalue() == ''
+    finally:
+        monkeypatch.undo()
+    return rendered
+
+
+def touch(path):
+    """
+    Change a file and make sure its modification time is newer.
+    """
+    info = stat(str(path))
+    utime(str(path), (info.st_atime + 10, info.st_mtime + 10))
+
+
+def read_output(project, name):
+    return project.join('output', name + '.html').read()
+
+
+def test_incremental_build(project, monkeypatch):
+    rendered = build(project, monkeypatch)
+    assert sorted(
+        basename(kwargs['codefn'] or '') for kwargs in rendered
+    ) == ['', 'CMakeLists.txt', 'notes.txt']
+
+    # Lexers are guessed from the whole file name
+    assert '<span class="nb">cmake_minimum_required</span>' in \
+        read_output(project, 'cmake')
+    assert '<span class="nb">cmake_minimum_required</span>' not in \
+        read_output(project, 'notes')
+
+    # Pages read again without changes in their blocks reuse them
+    project.join('source', 'inline.rst').write(
+        '\nOther paragraph.\n', mode='a'
+    )
+    touch(project.join('source', 'inline.rst'))
+    assert build(project, monkeypatch) == []
+    assert 'Other paragraph.' in read_output(project, 'inline')
+
+    # Pages are read again when their files change
+    cmake = read_output(project, 'cmake')
+    project.join('source', 'code', 'notes.txt').write(code + 'project(bar)\n')
+    touch(project.join('source', 'code', 'notes.txt'))
+    rendered = build(project, monkeypatch)
+    assert [basename(kwargs['codefn']) for kwargs in rendered] == \
+        ['notes.txt']
+    assert 'project(bar)' in read_output(project, 'notes')
+    assert read_output(project, 'cmake') == cmake
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the stages instrumentation.
+"""
+
+from io import StringIO
+
+from conftest import write_pair
+
+from codeco.stats import StageStats, stages
+
+
+def test_nested_stages():
+    stats = StageStats(memory=True)
+    with stats.stage('total'):
+        with stats.stage('render'):
+            data = [0] * 100000
+        with stats.stage('render'):
+            pass
+    del data
+
+    result = stats.as_dict()
+    assert list(result) == ['total', 'render']
+    assert result['render']['calls'] == 2
+    assert 0 <= result['render']['time'] <= result['total']['time']
+    assert result['total']['peak'] >= result['render']['peak'] >= 800000
+
+
+def test_processor_stages(tmpdir, proc):
+    codefn, annfn = write_pair(
+        tmpdir, 'x = 1\n', '<[annotation]> 1\n# One\n'
+    )
+    stats = StageStats()
+    proc.write_document(codefn, annfn, StringIO(), stats=stats)
+
+    result = stats.as_dict()
+    assert result['total']['calls'] == 1
+    assert set(result) <= set(stages)
+    assert {'read', 'lexer', 'parse', 'render', 'write'} <= set(result)
+    assert 'peak' not in result['total']
+    assert stats.format_table().startswith('stage')
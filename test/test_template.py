@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the compiled templates.
+"""
+
+from io import StringIO
+
+import pytest
+
+from codeco.processor import default_tpl
+from codeco.template import CompiledTemplate, compile_template
+
+
+values = {
+    'title': 'Title',
+    'style': 'body {}',
+    'styles': '.x {}',
+    'extra_styles': '.y {}',
+    'script': 'var x = {};',
+    'assets': '',
+    'annotations': '<div>A</div>',
+    'code': '<pre>B</pre>',
+    'number': 3.14159,
+    'user': {'name': 'Ada'},
+    'items': ['zero', 'one'],
+}
+
+
+@pytest.mark.parametrize('tpl', [
+    default_tpl,
+    '',
+    'No fields',
+    '{{literal}} braces {title}',
+    '{title}{code}',
+    '{number:.2f} {number:>10.1f}',
+    '{title!r} {title!s:>8}',
+    '{user[name]} {items[1]}',
+])
+def test_equals_format(tpl):
+    compiled = CompiledTemplate(tpl)
+    assert compiled.render(values) == tpl.format(**values)
+
+    out = StringIO()
+    compiled.write(out, values)
+    assert out.getvalue() == tpl.format(**values)
+
+
+def test_nested_spec():
+    compiled = CompiledTemplate('{number:>{width}.1f}')
+    assert compiled.render({'number': 1.0, 'width': 6}) == '   1.0'
+
+
+def test_iterators_streamed():
+    consumed = []
+
+    def annotations():
+        for piece in ['<div>A</div>', '<div>B</div>']:
+            consumed.append(piece)
+            yield piece
+
+    pieces = CompiledTemplate('<{title}>{annotations}</{title}>').iter_render(
+        {'title': 'body', 'annotations': annotations()}
+    )
+    assert next(pieces) == '<'
+    assert next(pieces) == 'body'
+    assert next(pieces) == '>'
+    assert next(pieces) == '<div>A</div>'
+    assert consumed == ['<div>A</div>']
+    assert list(pieces) == ['<div>B</div>', '</', 'body', '>']
+
+
+def test_iterators_with_spec_joined():
+    compiled = CompiledTemplate('[{value:>6}] [{other!r}]')
+    assert compiled.render({
+        'value': iter(['a', 'b']), 'other': iter(['c']),
+    }) == '[    ab] [\'c\']'
+
+
+def test_lists_not_streamed():
+    compiled = CompiledTemplate('{items}')
+    assert compiled.render(values) == '{items}'.format(**values)
+
+
+def test_memoized():
+    assert compile_template(default_tpl) is compile_template(default_tpl)
+    assert 'code' in compile_template(default_tpl).fields
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the watch mode.
+"""
+
+from os import pipe, rename, unlink, close
+from os.path import abspath
+from struct import pack
+
+import pytest
+
+from conftest import write_pair
+
+from codeco.cache import HighlightCache
+from codeco.processor import Processor
+from codeco.watch import (
+    PollingWatcher, InotifyWatcher, create_watcher, watch_document
+)
+
+
+code = 'def add(a, b):\n    return a + b\n'
+annotations = '<[annotation]> 1\n# Add\n\nAdds.\n<[annotation]> 2\n# Sum\n'
+
+
+def write(path, content):
+    with open(str(path), 'w') as fd:
+        fd.write(content)
+
+
+def inotify_watcher(paths):
+    try:
+        return InotifyWatcher(paths, latency=0.01)
+    except OSError:
+        pytest.skip('inotify is not available')
+
+
+@pytest.fixture(params=['polling', 'inotify'])
+def watcher_factory(request):
+    if request.param == 'polling':
+        return lambda paths: PollingWatcher(paths, interval=0.01)
+    return inotify_watcher
+
+
+def test_timeout(tmpdir, watcher_factory):
+    path = tmpdir.join('a.txt')
+    write(path, 'a')
+    watcher = watcher_factory([str(path)])
+    try:
+        assert watcher.wait(timeout=0.05) == set()
+    finally:
+        watcher.close()
+
+
+def test_changes(tmpdir, watcher_factory):
+    path = tmpdir.join('a.txt')
+    other = tmpdir.join('b.txt')
+    write(path, 'a')
+    write(other, 'b')
+    watcher = watcher_factory([str(path)])
+    try:
+        # Only watched files are reported
+        write(other, 'bb')
+        assert watcher.wait(timeout=0.1) == set()
+
+        write(path, 'aa')
+        assert watcher.wait(timeout=5) == {abspath(str(path))}
+
+        # Replaced, as editors do
+        write(tmpdir.join('a.txt.tmp'), 'aaa')
+        rename(str(tmpdir.join('a.txt.tmp')), str(path))
+        assert watcher.wait(timeout=5) == {abspath(str(path))}
+    finally:
+        watcher.close()
+
+
+def test_polling_created_and_removed(tmpdir):
+    path = tmpdir.join('a.txt')
+    watcher = PollingWatcher([str(path)], interval=0.01)
+    write(path, 'a')
+    assert watcher.wait(timeout=5) == {abspath(str(path))}
+    unlink(str(path))
+    assert watcher.wait(timeout=5) == {abspath(str(path))}
+
+
+def test_inotify_events(tmpdir):
+    path = tmpdir.join('a.txt')
+    write(path, 'a')
+    watcher = inotify_watcher([str(path)])
+    close(watcher.fd)
+
+    # Events as read from inotify: wd, mask, cookie, length and the name
+    # padded with null bytes
+    def event(wd, name):
+        name = name + b'\0' * (16 - len(name))
+        return pack(watcher.event_format, wd, 0, 0, len(name)) + name
+
+    wd = list(watcher._dirs)[0]
+    reader, writer = pipe()
+    with open(writer, 'wb') as fd:
+        fd.write(b''.join([
+            event(wd, b'a.txt'), event(wd, b'b.txt'), event(wd + 1, b'a.txt'),
+            pack(watcher.event_format, wd, 0, 0, 0),
+        ]))
+    watcher.fd = reader
+    try:
+        assert watcher._read() == {abspath(str(path))}
+    finally:
+        watcher.close()
+
+
+def test_create_watcher(tmpdir):
+    watcher = create_watcher([str(tmpdir.join('a.txt'))], polling=True)
+    assert isinstance(watcher, PollingWatcher)
+    watcher.close()
+
+
+def test_watch_document(tmpdir):
+    codefn, annfn = write_pair(tmpdir, code, annotations)
+    out_file = str(tmpdir.join('out.html'))
+    tpl_file = str(tmpdir.join('tpl.html'))
+    write(tpl_file, '{annotations}{code}')
+
+    proc = Processor(highlight_cache=HighlightCache())
+    reports = watch_document(
+        proc, codefn, annfn, out_file, tpl_file=tpl_file,
+        watcher=PollingWatcher([codefn, annfn, tpl_file], interval=0.01),
+        title='t',
+    )
+    try:
+        report = next(reports)
+        assert report['changed'] == set()
+        assert report['error'] is None
+        assert (report['annotations'], report['rendered']) == (2, 2)
+        assert report['highlighted']
+        assert report['elapsed'] > 0
+
+        # Only the changed annotation is rendered again
+        write(annfn, annotations + '\nSums.\n')
+        report = next(reports)
+        assert report['changed'] == {abspath(annfn)}
+        assert (report['annotations'], report['rendered']) == (2, 1)
+        assert not report['highlighted']
+        with open(out_file, 'r') as fd:
+            assert 'Sums.' in fd.read()
+
+        write(codefn, code + '\n')
+        report = next(reports)
+        assert report['changed'] == {abspath(codefn)}
+        assert (report['annotations'], report['rendered']) == (2, 0)
+        assert report['highlighted']
+
+        write(tpl_file, '{missing}')
+        report = next(reports)
+        assert 'KeyError' in report['error']
+    finally:
+        reports.close()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2014 Carlos Jenkins <carlos@jenkins.co.cr>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Tests for the annotations wrapper.
+"""
+
+from os.path import join
+
+import pytest
+
+from conftest import examples
+
+from codeco.processor import Processor
+from codeco.wrapper import wrap, wrap_fast, wrap_soup
+
+
+classes = ['annotation_body']
+
+
+def corpus():
+    """
+    Render the annotations of the examples.
+    """
+    proc = Processor(highlight_cache=None)
+    rendered = []
+    for annfn, renderer in [
+            (join(examples, 'ex1', 'annotations.md'), proc._render_markdown),
+            (join(examples, 'ex2', 'annotations.rst'), proc._render_rest)]:
+        with open(annfn, 'r') as af:
+            parsed = proc._parse_annotations(af.read(), 'test')
+        for meta, body in parsed:
+            rendered.append(renderer(body).strip())
+    return rendered
+
+
+@pytest.mark.parametrize('html', corpus() + [
+    '',
+    'Just text & more',
+    '<p>One</p>\n\n<p>Two</p>',
+    '<div class="x"><p>Title</p><p>Body</p></div>',
+    '<div>One</div><div>Two</div>',
+    '<p class="a  b" id=\'say "hi"\'>Quotes</p>',
+    '<pre>\nkept\n</pre>',
+    '<table><col/><tr><td>Cell</td></tr></table>',
+    '<ul><li>One<li>Two</ul>',
+    '<p>Open <div>block</div></p>',
+    '<p>Broken < tag</p>',
+    '<title>Moved</title><p>Body</p>',
+    '<!-- top --><p>Body</p>',
+])
+def test_fast_equals_soup(html):
+    expected = wrap_soup(html, classes, 'annotation_title')
+    assert wrap(html, classes, 'annotation_title') == expected
+
+    fast = wrap_fast(html, classes, 'annotation_title')
+    assert fast is None or fast == expected
+
+
+def test_corpus_is_fast():
+    for html in corpus():
+        assert wrap_fast(html, classes, 'annotation_title') is not None